@@ -0,0 +1,22 @@
+# API_MODE=dev: one process with code reload (the old entrypoint).
+# API_MODE=prod: API_WORKERS processes (default: one per core), no reload.
+# More than one process needs SOCKETIO_MESSAGE_QUEUE, or events reach only the clients of one of them.
+import multiprocessing
+import os
+
+mode = os.environ.get("API_MODE", "dev")
+
+bind = "0.0.0.0:5001"
+worker_class = "geventwebsocket.gunicorn.workers.GeventWebSocketWorker"
+
+if mode == "prod":
+    workers = int(os.environ.get("API_WORKERS") or multiprocessing.cpu_count())
+    reload = False
+else:
+    workers = 1
+    reload = True
+    reload_engine = "poll"
+
+if workers > 1 and not os.environ.get("SOCKETIO_MESSAGE_QUEUE"):
+    raise SystemExit(f"API_WORKERS={workers} needs SOCKETIO_MESSAGE_QUEUE (e.g. redis://redis:6379); "
+                     "set API_WORKERS=1 to run a single process without one")
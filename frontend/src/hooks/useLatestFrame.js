@@ -3,9 +3,10 @@ import { io } from 'socket.io-client';
 
 const API_URL = import.meta.env.VITE_API_URL;
 
-export const useLatestFrame = () => {
-  // We initialize with the base URL
-  const [frameUrl, setFrameUrl] = useState(`${API_URL}/latest-frame`);
+export const useLatestFrame = (streamName) => {
+  // MJPEG push stream: the server sends each new snapshot over one open connection,
+  // so the <img> updates itself without polling /latest-frame
+  const frameUrl = `${API_URL}/latest-frame/stream?stream=${encodeURIComponent(streamName || 'default')}`;
   const [lastCaptureTime, setLastCaptureTime] = useState(null);
   const [isCapturing, setIsCapturing] = useState(false);
 
@@ -18,20 +19,15 @@ export const useLatestFrame = () => {
       reconnectionAttempts: Infinity
     });
 
-    socket.on('log_update', (msg) => {
-      // If the log contains our trigger phrase, we force an update
-      if (msg.data.includes("Saved AI Snapshot")) {
+    socket.on('worker_event', (event) => {
+      // The event only drives the capture indicator; the image arrives via the stream
+      if (event.type === 'snapshot' && (!streamName || event.stream === streamName)) {
         setLastCaptureTime(new Date());
         setIsCapturing(true);
 
         // Reset isCapturing after some time if no new frames come in
         clearTimeout(timeoutId);
         timeoutId = setTimeout(() => setIsCapturing(false), 10000);
-
-        // We add a timestamp (?t=...) to force the browser to ignore its cache
-        setTimeout(() => {
-          setFrameUrl(`${API_URL}/latest-frame?t=${Date.now()}`);
-        }, 200);
       }
     });
 
@@ -39,7 +35,7 @@ export const useLatestFrame = () => {
       socket.disconnect();
       clearTimeout(timeoutId);
     };
-  }, []);
+  }, [streamName]);
 
   return { frameUrl, lastCaptureTime, isCapturing };
-};
\ No newline at end of file
+};
@@ -23,21 +23,25 @@ export const useLogs = (maxLines = 50) => {
       setIsSystemActive(false);
     });
 
-    // Listen for the specific 'log_update' event
+    // Listen for the specific 'log_update' event (lines arrive batched)
     socket.on('log_update', (payload) => {
-      const line = payload.data;
-
-      // If we see active loop logs, the system is definitely alive
-      if (line.includes("Analysis Loop started") || line.includes("Saved AI Snapshot")) {
-        setIsSystemActive(true);
-      }
+      const lines = payload.lines || [payload.data];
 
       setLogs((prev) => {
-        const newLogs = [...prev, line];
+        const newLogs = [...prev, ...lines];
         return newLogs.slice(-maxLines); // Keep only the last X lines
       });
     });
 
+    // Worker liveness comes from structured events, not from parsing log text
+    socket.on('worker_event', (event) => {
+      if (event.type === 'stopped') {
+        setIsSystemActive(false);
+      } else if (event.type !== 'error') {
+        setIsSystemActive(true);
+      }
+    });
+
     return () => socket.disconnect();
   }, [maxLines]);
 
@@ -24,16 +24,31 @@ export const useStreamControl = () => {
     }
   };
 
-  const stopStream = async () => {
+  const stopStream = async (streamId) => {
     setLoading(true);
     try {
-      const response = await fetch(`${API_URL}/system/stop`, { method: 'POST' });
+      const response = await fetch(`${API_URL}/system/stop`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(streamId ? { stream_id: streamId } : {})
+      });
       return await response.json();
     } finally {
       setLoading(false);
     }
   };
 
+  // Per-stream control: several streams can run at once
+  const startStreamWorker = async (streamId) => {
+    const response = await fetch(`${API_URL}/streams/${streamId}/start`, { method: 'POST' });
+    return await response.json();
+  };
+
+  const stopStreamWorker = async (streamId) => {
+    const response = await fetch(`${API_URL}/streams/${streamId}/stop`, { method: 'POST' });
+    return await response.json();
+  };
+
   const addStream = async (streamData) => {
     const response = await fetch(`${API_URL}/streams`, {
       method: 'POST',
@@ -47,5 +62,5 @@ export const useStreamControl = () => {
     await fetch(`${API_URL}/streams/${streamId}`, { method: 'DELETE' });
   };
 
-  return { startStream, stopStream, fetchStreams, addStream, deleteStream, loading };
+  return { startStream, stopStream, startStreamWorker, stopStreamWorker, fetchStreams, addStream, deleteStream, loading };
 };
\ No newline at end of file
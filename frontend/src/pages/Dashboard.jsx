@@ -9,12 +9,10 @@ import VideoPlayer from '../components/VideoPlayer';
 const API_URL = import.meta.env.VITE_API_URL;
 const API_URL_FALLBACK = API_URL + "/latest-frame-fallback";
 
-// We serve HLS streams from the frontend dist/streams folder (or proxied)
-// For dev mode, we need to know where the streams are.
-// Since we are running in a container, the frontend is served at :5173
-// and the streams are written to dist/streams.
-const RAW_STREAM_URL = `${API_URL}/hls-streams/raw/live.m3u8`;
-const PROC_STREAM_URL = `${API_URL}/hls-streams/processed/live.m3u8`;
+// Each stream's worker writes its own HLS folder (HLS_STREAMS/<stream name>/...)
+// which the API serves under /hls-streams.
+const rawStreamUrl = (name) => `${API_URL}/hls-streams/${name}/raw/live.m3u8`;
+const procStreamUrl = (name) => `${API_URL}/hls-streams/${name}/processed/live.m3u8`;
 
 export default function Dashboard() {
     const [isOnline, setIsOnline] = useState(false);
@@ -25,8 +23,10 @@ export default function Dashboard() {
 
     const { logs, isConnected } = useLogs(100);
     const { startStream, stopStream, fetchStreams, addStream, deleteStream, loading } = useStreamControl();
-    const { frameUrl, isCapturing, lastCaptureTime } = useLatestFrame();
     const { clearHistory, isClearing } = useHistory();
+    const selectedStream = streams.find(s => s.id === selectedStreamId);
+    const streamName = selectedStream?.name || 'default';
+    const { frameUrl, isCapturing, lastCaptureTime } = useLatestFrame(streamName);
 
     useEffect(() => {
         loadStreams();
@@ -42,7 +42,7 @@ export default function Dashboard() {
 
     const handleToggle = async () => {
         if (isOnline) {
-            await stopStream();
+            await stopStream(selectedStreamId);
             setIsOnline(false);
         } else {
             await startStream(selectedStreamId);
@@ -68,7 +68,7 @@ export default function Dashboard() {
 
     const handleStreamSwitch = async (id) => {
         if (isOnline) {
-            await stopStream();
+            await stopStream(selectedStreamId);
             setIsOnline(false);
         }
         setSelectedStreamId(id);
@@ -156,8 +156,8 @@ export default function Dashboard() {
                     </div>
 
                     <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
-                        <VideoPlayer isOnline={isOnline} url={RAW_STREAM_URL} title="Raw Input Feed" />
-                        <VideoPlayer isOnline={isOnline} url={PROC_STREAM_URL} title="Inference Output" />
+                        <VideoPlayer isOnline={isOnline} url={rawStreamUrl(streamName)} title="Raw Input Feed" />
+                        <VideoPlayer isOnline={isOnline} url={procStreamUrl(streamName)} title="Inference Output" />
                     </div>
                 </div>
 
@@ -1,11 +1,10 @@
 from gevent import monkey
 monkey.patch_all()
 
-import sqlite3
-import uuid
+import fcntl
+import functools
 import os
 import sys
-import subprocess
 import time
 import requests
 import signal
@@ -15,153 +14,303 @@ import numpy as np
 import cv2
 import io
 
-from flask import Flask, jsonify, send_from_directory, send_file, request
+from flask import Flask, Response, g, has_request_context, jsonify, send_from_directory, send_file, request
 from flask_socketio import SocketIO
 from flask_cors import CORS
+from gevent.threadpool import ThreadPool
+
+# Shared helpers live next to this file (the worker imports them the same way)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from helpers import (
+    EventListener, EventPublisher, Histogram, JpegBroadcast, LogTailer, MetricsText, SharedJpegSlot, SharedMetrics, StreamSupervisor,
+    LLHLS_BASE_DIR, ResultStore, StreamRegistry, WarmWorkerPool, WorkerRegistry, clean_settings, control_socket_path,
+    latest_frame_slot_path, plan_update, playlist_has, process_cmdline, process_role, process_sample, process_tree,
+)
 
 DB_PATH = "/data/streams.db"
 
 def init_db():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS streams (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                display_name TEXT NOT NULL,
-                url TEXT NOT NULL,
-                type TEXT NOT NULL,
-                username TEXT,
-                password TEXT
-            )
-        ''')
-        # Seed default streams if table is empty
-        cursor = conn.execute('SELECT COUNT(*) FROM streams')
-        if cursor.fetchone()[0] == 0:
-            # 1. First Option: Local Webcam
-            conn.execute('INSERT INTO streams (id, name, display_name, url, type, username, password) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                        ("local", "local_webcam", "Local Webcam", "/dev/video0", "local", "", ""))
-            
-            # 2. ESP32-CAM (Initial seed uses env variables if provided)
-            user_env = os.environ.get("WEB_USER", "")
-            pass_env = os.environ.get("WEB_PASS", "")
-            
-            conn.execute('INSERT INTO streams (id, name, display_name, url, type, username, password) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                        ("esp32", "esp32_cam", "ESP32-CAM", "https://192.168.0.195/stream", "external", user_env, pass_env))
-        
-        # Migrations/Updates for existing data
+    # Seed default streams if table is empty
+    registry = StreamRegistry(DB_PATH).init(seed=[
+        # 1. First Option: Local Webcam
+        {"id": "local", "name": "local_webcam", "display_name": "Local Webcam", "url": "/dev/video0", "type": "local"},
+        # 2. ESP32-CAM (Initial seed uses env variables if provided)
+        {"id": "esp32", "name": "esp32_cam", "display_name": "ESP32-CAM", "url": "https://192.168.0.195/stream",
+         "type": "external", "username": os.environ.get("WEB_USER", ""), "password": os.environ.get("WEB_PASS", "")},
+    ])
+    # Migrations/Updates for existing data
+    with registry.transaction() as conn:
         conn.execute("UPDATE streams SET url = REPLACE(url, '/view', '/stream') WHERE url LIKE '%/view'")
+    return registry
+
+# Stream rows and the active stream are read from this in-memory copy; writes
+# go through it so every API process sees them (see helpers/streams.py)
+streams = init_db()
+
+# VLM captions/detections history, written in batches by the workers
+results = ResultStore(DB_PATH, connection=streams.connection).init()
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_active_stream():
+    """The dashboard's active stream row (settings table), else 'local', else the first stream."""
+    return streams.get(streams.setting('active_stream')) or streams.first()
+
+def set_active_stream(stream_id):
+    streams.set_setting('active_stream', stream_id)
+
+# Several API processes can serve requests (see configs/stream-operations/gunicorn.conf.py).
+# Exactly one, the control process, binds the worker event socket and keeps the
+# warm pool; the others read shared state from SQLite and the shared-memory slots.
+CONTROL_LOCK = os.environ.get("API_CONTROL_LOCK", "/tmp/svl_api_control.lock")
+_control_lock_file = None
+
+def acquire_control():
+    global _control_lock_file
+    f = open(CONTROL_LOCK, "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _control_lock_file = f  # held until this process exits
+    return True
 
-# Global to track current active stream config
-active_stream_config = None
+IS_CONTROL = acquire_control()
 
 app = Flask(__name__)
 CORS(app)
+# With several API processes, SOCKETIO_MESSAGE_QUEUE (e.g. redis://redis:6379) lets
+# the control process's emits reach clients connected to any of them
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or None
 socketio = SocketIO(
     app,
-    cors_allowed_origins="*"
+    cors_allowed_origins="*",
+    message_queue=SOCKETIO_MESSAGE_QUEUE
 )
-worker_process = None
+
+# CPU-bound work (placeholder rendering + JPEG encoding) runs on real threads so
+# it never blocks the gevent hub serving every websocket of this process
+cpu_pool = ThreadPool(int(os.environ.get("API_CPU_THREADS", "2")))
 CAMERA_API = "http://stream-cam:5000"
 
+# Runs one AI worker per stream; ports, paths and CPU cores are per worker.
+# WARM_WORKERS pre-imported interpreters wait idle so a stream switch skips
+# the Python/cv2 start-up.
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+WARM_WORKERS = int(os.environ.get("WARM_WORKERS", "1"))
+supervisor = StreamSupervisor(
+    os.path.join(SCRIPTS_DIR, "camera_test.py"),
+    pool=WarmWorkerPool(os.path.join(SCRIPTS_DIR, "warm_worker.py"), WARM_WORKERS) if WARM_WORKERS > 0 and IS_CONTROL else None,
+    registry=WorkerRegistry(DB_PATH).init()
+)
+
+# --- METRICS ---
+# Hot-path endpoints whose latency is recorded (a dict update + bisect per request)
+METERED_ENDPOINTS = {'get_latest_frame', 'stream_latest_frame', 'serve_hls', 'search_results'}
+request_latency = {}
+socketio_emits = {}
+socketio_clients = 0
+# Each API process publishes the counters above here every API_METRICS_INTERVAL
+# seconds; /metrics on any process sums them (see helpers/metrics.py SharedMetrics)
+API_METRICS_DIR = os.environ.get("API_METRICS_DIR", "/dev/shm/svl_api_metrics")
+API_METRICS_INTERVAL = float(os.environ.get("API_METRICS_INTERVAL", "2"))
+shared_metrics = SharedMetrics(API_METRICS_DIR)
+
+def socket_emit(event, data):
+    """socketio.emit, counted per event name for /metrics."""
+    socketio_emits[event] = socketio_emits.get(event, 0) + 1
+    socketio.emit(event, data)
+
+@socketio.on('connect')
+def on_socket_connect(*args):
+    global socketio_clients
+    socketio_clients += 1
+
+@socketio.on('disconnect')
+def on_socket_disconnect(*args):
+    global socketio_clients
+    socketio_clients = max(socketio_clients - 1, 0)
+
+@app.before_request
+def start_request_timer():
+    if request.endpoint in METERED_ENDPOINTS:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        kind = request.endpoint
+        if kind == 'serve_hls':
+            kind = 'hls_playlist' if request.path.endswith('.m3u8') else 'hls_media'
+        key = (kind, response.status_code)
+        if key not in request_latency:
+            request_latency[key] = Histogram()
+        request_latency[key].observe(time.perf_counter() - started)
+    return response
+
 # Base directories
 BASE_IMAGE_DIR = "/data/images"
 BASE_LOG_PATH = "/data/logs"
 HLS_BASE_DIR = "/data/logs/HLS_STREAMS"
 
+# Read-only views of each stream's shared-memory latest-frame slot
+latest_frame_slots = {}
+
+def get_stream_name():
+    """Stream a request is about: ?stream=<name>, else the dashboard's active stream."""
+    requested = request.args.get('stream') if has_request_context() else None
+    if requested:
+        return requested
+    active = get_active_stream()
+    return active['name'] if active else "default"
+
+def get_latest_frame_slot(name=None):
+    name = name or get_stream_name()
+    if name not in latest_frame_slots:
+        latest_frame_slots[name] = SharedJpegSlot(latest_frame_slot_path(name))
+    return latest_frame_slots[name]
+
 def get_current_paths():
-    global active_stream_config
-    name = active_stream_config['name'] if active_stream_config else "default"
+    active = get_active_stream()
+    name = active['name'] if active else "default"
     image_dir = f"{BASE_IMAGE_DIR}/{name}/captured_frames"
     log_path = f"{BASE_LOG_PATH}/{name}/"
     return image_dir, log_path
 
 @app.route('/streams', methods=['GET'])
 def get_streams():
-    with get_db_connection() as conn:
-        # Order by a CASE statement to ensure 'local' is always first
-        query = '''
-            SELECT * FROM streams 
-            ORDER BY (CASE WHEN id = 'local' THEN 0 ELSE 1 END), display_name ASC
-        '''
-        streams = [dict(row) for row in conn.execute(query).fetchall()]
-    return jsonify(streams)
+    # 'local' is always first (see StreamRegistry)
+    return jsonify(streams.list())
 
 @app.route('/streams', methods=['POST'])
 def add_stream():
     data = request.json
-    stream_id = str(uuid.uuid4())
-    name = data.get('name', 'new_stream').replace(' ', '_').lower()
-    display_name = data.get('display_name', 'New Stream')
-    url = data.get('url', '')
-    stream_type = data.get('type', 'external')
-    username = data.get('username', '')
-    password = data.get('password', '')
-    
-    with get_db_connection() as conn:
-        conn.execute('INSERT INTO streams (id, name, display_name, url, type, username, password) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                    (stream_id, name, display_name, url, stream_type, username, password))
-    
-    return jsonify({"id": stream_id, "name": name, "display_name": display_name}), 201
+    try:
+        settings = clean_settings(data.get('settings'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream = streams.create({
+        "name": data.get('name', 'new_stream').replace(' ', '_').lower(),
+        "display_name": data.get('display_name', 'New Stream'),
+        "url": data.get('url', ''),
+        "type": data.get('type', 'external'),
+        "username": data.get('username', ''),
+        "password": data.get('password', ''),
+    }, settings)
+    return jsonify({"id": stream['id'], "name": stream['name'], "display_name": stream['display_name']}), 201
 
 @app.route('/streams/<stream_id>', methods=['PUT'])
 def update_stream(stream_id):
+    """Saves a stream edit and applies it to its running worker, restarting it only if needed."""
     data = request.json
-    with get_db_connection() as conn:
-        conn.execute('''
-            UPDATE streams 
-            SET name = ?, display_name = ?, url = ?, type = ?, username = ?, password = ?
-            WHERE id = ?
-        ''', (
-            data.get('name', '').replace(' ', '_').lower(),
-            data.get('display_name', ''),
-            data.get('url', ''),
-            data.get('type', ''),
-            data.get('username', ''),
-            data.get('password', ''),
-            stream_id
-        ))
-    return jsonify({"status": "updated"})
+    try:
+        settings = clean_settings(data['settings']) if 'settings' in data else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    old, new = streams.update(stream_id, {
+        "name": data.get('name', '').replace(' ', '_').lower(),
+        "display_name": data.get('display_name', ''),
+        "url": data.get('url', ''),
+        "type": data.get('type', ''),
+        "username": data.get('username', ''),
+        "password": data.get('password', ''),
+    }, settings)
+    if new is None:
+        return jsonify({"error": "Stream not found"}), 404
+    return jsonify({"status": "updated", "version": new['version'], "applied": reconfigure_worker(old, new)})
+
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 date/time from a query string; None if absent."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/results')
+def search_results():
+    """Searches the VLM history, newest first.
+
+    ?q= words in the caption or detection labels, ?stream= stream name,
+    ?since= / ?until= epoch seconds or ISO 8601, ?limit= page size (max 200),
+    ?cursor= the next_cursor of the previous page.
+    """
+    args = request.args
+    try:
+        rows, next_cursor = results.search(
+            text=args.get('q'), stream=args.get('stream'),
+            since=parse_time(args.get('since')), until=parse_time(args.get('until')),
+            cursor=args.get('cursor'), limit=args.get('limit', 50)
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Bad query: {e}"}), 400
+    return jsonify({"results": rows, "next_cursor": next_cursor})
 
 @app.route('/streams/<stream_id>', methods=['DELETE'])
 def delete_stream(stream_id):
-    with get_db_connection() as conn:
-        conn.execute('DELETE FROM streams WHERE id = ?', (stream_id,))
+    streams.delete(stream_id)
     return jsonify({"status": "deleted"})
 
+HLS_MIME_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+}
+
+def wait_for_hls_playlist(path, msn, part, timeout):
+    """LL-HLS blocking playlist reload: waits until the playlist holds msn/part."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with open(path, 'r') as f:
+                if playlist_has(f.read(), msn, part):
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.02)
+    return False
+
 @app.route('/hls-streams/<path:filename>')
 def serve_hls(filename):
-    """Serve HLS manifest and segments with correct CORS and cache headers."""
-    response = send_from_directory(HLS_BASE_DIR, filename)
+    """Serve HLS manifest and segments with correct CORS and cache headers.
+
+    LL-HLS rings written by the worker to shared memory take precedence over
+    the on-disk playlists.
+    """
+    base_dir = HLS_BASE_DIR
+    if os.path.isfile(os.path.join(LLHLS_BASE_DIR, filename)):
+        base_dir = LLHLS_BASE_DIR
+
+    msn = request.args.get('_HLS_msn', type=int)
+    if filename.endswith('.m3u8') and msn is not None and base_dir == LLHLS_BASE_DIR:
+        # Spec: answer with 503 if the request can't be satisfied within 3 target durations
+        if not wait_for_hls_playlist(os.path.join(base_dir, filename), msn, request.args.get('_HLS_part', type=int), 3.0):
+            return jsonify({"error": "Playlist did not reach the requested segment"}), 503
+
+    response = send_from_directory(base_dir, filename)
     
     # Fix MIME types for HLS segments (Flask/Python might guess .ts as TypeScript or Qt)
-    if filename.endswith('.ts'):
-        response.headers['Content-Type'] = 'video/mp2t'
-    elif filename.endswith('.m3u8'):
-        response.headers['Content-Type'] = 'application/vnd.apple.mpegurl'
+    ext = os.path.splitext(filename)[1]
+    if ext in HLS_MIME_TYPES:
+        response.headers['Content-Type'] = HLS_MIME_TYPES[ext]
 
     response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    if ext == '.m3u8':
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    else:
+        # Segment, part and init names carry a per-run prefix and are never rewritten
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
     return response
 
 def signal_handler(sig, frame):
     """Cleanup function triggered on Ctrl+C"""
     print('\n[SYSTEM] Shutdown signal received. Cleaning up processes...')
-    global worker_process
     
-    # 1. Terminate the AI worker
-    if worker_process and worker_process.poll() is None:
-        print("[SYSTEM] Terminating AI Worker...")
-        worker_process.terminate()
-        try:
-            worker_process.wait(timeout=2)
-        except subprocess.TimeoutExpired:
-            worker_process.kill()
+    # 1. Terminate the AI workers (and the idle warm ones)
+    supervisor.shutdown()
         
     # 2. Try to stop the remote camera if it's running
     try:
@@ -201,186 +350,409 @@ def clear_history():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@functools.lru_cache(maxsize=8)
+def render_placeholder(text):
+    """JPEG bytes of the 'awaiting frame' card; cached, the text only changes once a second."""
+    img = np.zeros((720, 1280, 3), dtype=np.uint8)
+    img[:] = (30, 30, 35) # Slate-ish background
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    cv2.putText(img, text, (400, 360), font, 1.5, (100, 100, 110), 3, cv2.LINE_AA)
+    _, buffer = cv2.imencode('.jpg', img)
+    return buffer.tobytes()
+
+def placeholder_response(text):
+    data = cpu_pool.apply(render_placeholder, (text,))
+    return send_file(io.BytesIO(data), mimetype='image/jpeg')
+
 @app.route('/latest-frame')
 def get_latest_frame():
-    image_dir, _ = get_current_paths()
-    # 1. Try to find the actual latest frame
+    # 1. Serve the worker's latest snapshot straight from shared memory
     try:
-        if os.path.exists(image_dir):
-            log_files = [os.path.join(image_dir, f) for f in os.listdir(image_dir) if f.endswith('.jpg')]
-            if log_files:
-                latest_img = max(log_files, key=os.path.getmtime)
-                return send_from_directory(image_dir, os.path.basename(latest_img))
+        slot = get_latest_frame_slot()
+        etag = slot.etag()
+        if etag and request.if_none_match.contains(etag.strip('"')):
+            return Response(status=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+        latest = slot.read()
+        if latest:
+            etag, _, data = latest
+            return Response(data, mimetype='image/jpeg', headers={'ETag': etag, 'Cache-Control': 'no-cache'})
     except Exception:
         pass
 
-    # 2. Fallback: Generate a local placeholder if no image exists
-    img = np.zeros((720, 1280, 3), dtype=np.uint8)
-    img[:] = (30, 30, 35) # Slate-ish background
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    text = "Awaiting AI Frame..."
-    cv2.putText(img, text, (400, 360), font, 1.5, (100, 100, 110), 3, cv2.LINE_AA)
-    
-    # Encode to memory and send
-    _, buffer = cv2.imencode('.jpg', img)
-    return send_file(io.BytesIO(buffer), mimetype='image/jpeg')
+    # 2. Fallback: a local placeholder if no image exists
+    return placeholder_response("Awaiting AI Frame...")
+
+# In-process hubs (one per stream): each new snapshot is read from the slot
+# once and shared by every MJPEG client. Clients only ever wait for the
+# newest frame, so a slow viewer skips frames instead of queuing them.
+frame_hubs = {}
+frame_hub_clients = 0
+FRAME_HUB_POLL = float(os.environ.get("FRAME_HUB_POLL", "0.1"))
+# An idle stream resends its last frame this often, so a client that went away fails the write
+MJPEG_KEEPALIVE = float(os.environ.get("MJPEG_KEEPALIVE", "5"))
+snapshot_ready = threading.Event()
+
+def get_frame_hub(name):
+    if name not in frame_hubs:
+        frame_hubs[name] = JpegBroadcast()
+    return frame_hubs[name]
+
+def frame_hub_thread():
+    """Background task that moves new snapshots from the shared slots into the hubs."""
+    last_etags = {}
+    while True:
+        for name, hub in list(frame_hubs.items()):
+            try:
+                slot = get_latest_frame_slot(name)
+                etag = slot.etag()
+                if etag and etag != last_etags.get(name):
+                    latest = slot.read()
+                    if latest:
+                        last_etags[name] = latest[0]
+                        hub.put(latest[2])
+            except Exception:
+                pass
+        # The control process is woken by the worker's snapshot event (the timeout is
+        # a safety net); other API processes get no events and poll the slot headers
+        snapshot_ready.wait(timeout=1.0 if IS_CONTROL else FRAME_HUB_POLL)
+        snapshot_ready.clear()
+
+@app.route('/latest-frame/stream')
+def stream_latest_frame():
+    """multipart/x-mixed-replace (MJPEG) push of every new snapshot."""
+    hub = get_frame_hub(get_stream_name())
+    snapshot_ready.set()
+
+    def part(data):
+        return (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                + str(len(data)).encode() + b'\r\n\r\n' + data + b'\r\n')
+
+    def generate():
+        global frame_hub_clients
+        frame_hub_clients += 1
+        # Start one behind so the current frame is sent immediately
+        last_seq = max(hub.seq - 1, 0)
+        last = None
+        try:
+            if not hub.seq:
+                yield part(cpu_pool.apply(render_placeholder, ("Awaiting Frame...",)))
+            while True:
+                seq, data = hub.wait(last_seq, timeout=MJPEG_KEEPALIVE)
+                if data is None:
+                    data = last or cpu_pool.apply(render_placeholder, ("Awaiting Frame...",))
+                else:
+                    last_seq, last = seq, data
+                yield part(data)
+        finally:
+            frame_hub_clients -= 1
+
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame',
+                    headers={'Cache-Control': 'no-cache'})
 
 @app.route('/latest-frame-fallback')
 def get_latest_frame_fallback():
-    # 1. Fallback: Generate a local placeholder if no image exists
-    img = np.zeros((720, 1280, 3), dtype=np.uint8)
-    img[:] = (30, 30, 35) # Slate-ish background
+    # Rendered off the event loop (see cpu_pool)
     timestamp = datetime.now().strftime("%H:%M:%S")
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    text = f"Awaiting Frame... {timestamp}"
-    cv2.putText(img, text, (400, 360), font, 1.5, (100, 100, 110), 3, cv2.LINE_AA)
-    
-    # Encode to memory and send
-    _, buffer = cv2.imencode('.jpg', img)
-    return send_file(io.BytesIO(buffer), mimetype='image/jpeg')
+    return placeholder_response(f"Awaiting Frame... {timestamp}")
+
+# Event types the other API processes read back (/system/status, /metrics); the
+# frequent ones (snapshot, inference...) only go to Socket.IO
+SHARED_EVENT_TYPES = {'started', 'first_frame', 'stopped', 'timings'}
+
+def handle_worker_event(event):
+    """Forwards a typed worker event to Socket.IO clients."""
+    if event['type'] == 'snapshot':
+        snapshot_ready.set()
+    socket_emit('worker_event', event)
+    if event['type'] == 'first_frame':
+        supervisor.record_first_frame(event.get('stream_id'), event.get('ttff_ms'))
+    if event['type'] in SHARED_EVENT_TYPES:
+        supervisor.registry.record_event(event)
+
+def worker_event_thread():
+    """Background task receiving worker events over the local Unix socket."""
+    EventListener(handle_worker_event).run()
 
 def log_reader_thread():
-    """Background thread to emit logs via WebSocket without blocking."""
-    current_file = None
-    file_handle = None
+    """Background task that pushes new worker log lines to clients in batches."""
+    tailer = LogTailer(lambda lines: socket_emit('log_update', {'lines': lines}))
+    tailer.run(lambda: get_current_paths()[1])
 
-    while True:
+
+def load_stream(stream_id):
+    return streams.get(stream_id)
+
+def last_worker_event(name):
+    return supervisor.registry.last_event_time(name)
+
+def start_stream_worker(stream, requested_at=None):
+    """Starts the AI worker for a stream, then points stream-cam at its ingest port.
+
+    `requested_at` is when the request came in (time-to-first-frame starts there).
+    """
+    requested_at = requested_at or time.time()
+    print(f"[SYSTEM] Starting AI Worker for stream {stream['name']}")
+    try:
+        # Per-stream settings override the worker's environment
+        handle = supervisor.start(stream, extra_env=stream.get('settings'), requested_at=requested_at)
+    except Exception as e:
+        print(f"[SYSTEM] Failed to start AI Worker: {e}")
+        return {"error": f"Failed to start AI Worker: {str(e)}"}, 500
+
+    body, code = start_camera(stream, handle.ports['ingest'])
+    if code != 200:
+        return body, code
+    return {"status": "Stream Online", "stream": stream, "worker": handle.status(), "camera": body}, 200
+
+def start_camera(stream, ingest_port):
+    """(Re)starts stream-cam's pull of a camera into a worker's ingest port."""
+    # Camera Trigger: stream-cam answers once ffmpeg has sent its first packet,
+    # so retries only cover the service itself not being up yet
+    # The worker's ingest transport; stream-cam has to send with the same one
+    transport = (stream.get('settings') or {}).get('INGEST_TRANSPORT') or os.environ.get('INGEST_TRANSPORT', 'udp')
+    camera_config = dict(stream, dest_port=ingest_port, transport=transport)
+    max_retries = 5
+    for i in range(max_retries):
         try:
-            _, log_path = get_current_paths()
-            # 1. Always look for the newest log file
-            if not os.path.exists(log_path):
-                time.sleep(1)
+            cam_resp = requests.post(f"{CAMERA_API}/start", json=camera_config, timeout=15)
+            if cam_resp.status_code != 200:
+                return {"error": f"Camera service error: {cam_resp.text}"}, 500
+            return cam_resp.json(), 200
+        except requests.exceptions.ConnectionError:
+            if i < max_retries - 1:
+                time.sleep(min(0.25 * 2 ** i, 2))
                 continue
-                
-            log_files = [os.path.join(log_path, f) for f in os.listdir(log_path) if f.endswith('.log')]
+            return {"error": "Camera service not reachable"}, 500
 
-            if not log_files:
-                time.sleep(1)
-                continue
-                
-            latest_log = max(log_files, key=os.path.getmtime)
-
-            # 2. If a new log file was created (e.g. after a restart), switch to it
-            if latest_log != current_file:
-                if file_handle: file_handle.close()
-                current_file = latest_log
-                file_handle = open(latest_log, 'r')
-                file_handle.seek(0, 2) # Start at the end
-                print(f"Log Reader now watching: {latest_log}")
-
-            # 3. Read only new lines
-            line = file_handle.readline()
-            if line:
-                # This triggers the "Saved AI Snapshot" check in React
-                socketio.emit('log_update', {'data': line.strip()})
-            else:
-                time.sleep(0.1) # Prevent CPU spiking
-        except Exception as e:
-            time.sleep(1)
+def push_live_settings(stream, settings, version=None):
+    """Sends settings to the stream's running worker; False if it is not listening.
+
+    `stream` locates the worker (its running name); `version` is the row
+    version the settings come from (default: the stream's own).
+    """
+    control = EventPublisher(stream['name'], control_socket_path(stream['name']))
+    try:
+        return control.emit("config", stream_id=stream['id'], version=version or stream['version'], settings=settings)
+    finally:
+        control.close()
+
+def reconfigure_worker(old, new):
+    """Applies a stream edit to its running worker; returns what it took ("live", "camera", "restart")."""
+    worker = supervisor.status(new['id'])
+    if not (worker and worker['alive']):
+        return []
+    plan = plan_update(old, new)
+    # The worker runs under the old name (paths, ring, control socket) until restarted
+    if plan["restart"] or (plan["live"] and not push_live_settings(old, plan["live"], version=new['version'])):
+        body, code = start_stream_worker(new)
+        print(f"[SYSTEM] Restarted AI Worker for {new['name']} to apply v{new['version']}: {body.get('error', 'ok')}")
+        return ["restart"]
+    applied = ["live"] if plan["live"] else []
+    if plan["camera"]:
+        # Same worker, same ingest port: only the camera pull restarts
+        body, code = start_camera(new, worker['ports']['ingest'])
+        print(f"[SYSTEM] Camera for {new['name']} re-pulled for v{new['version']}: {body.get('error', 'ok')}")
+        applied.append("camera")
+    return applied
+
+def stop_stream_worker(stream_id):
+    """Stops one stream's AI worker and its camera feed."""
+    supervisor.stop(stream_id)
+    try:
+        requests.post(f"{CAMERA_API}/stop", json={"id": stream_id}, timeout=5)
+    except:
+        pass
+
+def stream_status(stream):
+    worker = supervisor.status(stream['id'])
+    return {
+        "stream_id": stream['id'],
+        "stream": stream['name'],
+        "worker_alive": bool(worker and worker['alive']),
+        "worker": worker,
+        "last_worker_event": last_worker_event(stream['name']),
+    }
+
+@app.route('/streams/<stream_id>/start', methods=['POST'])
+def stream_start(stream_id):
+    requested_at = time.time()
+    stream = load_stream(stream_id)
+    if not stream:
+        return jsonify({"error": "Stream not found"}), 404
+    body, code = start_stream_worker(stream, requested_at)
+    return jsonify(body), code
+
+@app.route('/streams/<stream_id>/stop', methods=['POST'])
+def stream_stop(stream_id):
+    stop_stream_worker(stream_id)
+    return jsonify({"status": "Stream Offline", "stream_id": stream_id}), 200
+
+@app.route('/streams/<stream_id>/status')
+def stream_status_route(stream_id):
+    stream = load_stream(stream_id)
+    if not stream:
+        return jsonify({"error": "Stream not found"}), 404
+    return jsonify(stream_status(stream))
 
+@app.route('/system/workers')
+def system_workers():
+    return jsonify(supervisor.status())
 
 @app.route('/system/start', methods=['POST'])
 def system_start():
-    global worker_process, active_stream_config
-    
+    """Starts the selected stream and makes it the dashboard's active stream.
+
+    Other running streams are left alone; use /system/stop or
+    /streams/<id>/stop to stop them.
+    """
+    requested_at = time.time()
     data = request.json or {}
     stream_id = data.get('stream_id', 'local')
     
     # Load and find the stream config from DB
-    with get_db_connection() as conn:
-        row = conn.execute('SELECT * FROM streams WHERE id = ?', (stream_id,)).fetchone()
-        if not row:
-            row = conn.execute('SELECT * FROM streams LIMIT 1').fetchone()
-        active_stream_config = dict(row)
-    
-    # Stop existing if any
-    system_stop()
-    
-    # 1. Start AI Receiver
-    if worker_process is None or worker_process.poll() is not None:
-        cmd = [sys.executable, "/app/scripts/camera_test.py"]
-        env = os.environ.copy()
-        env["STREAM_NAME"] = active_stream_config['name']
-        
-        print(f"[SYSTEM] Starting AI Worker for stream {active_stream_config['name']}")
-        try:
-            worker_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                env=env,
-                start_new_session=True
-            )
-            print(f"[SYSTEM] AI Worker started with PID: {worker_process.pid}")
-        except Exception as e:
-            print(f"[SYSTEM] Failed to start AI Worker: {e}")
-            return jsonify({"error": f"Failed to start AI Worker: {str(e)}"}), 500
-    
-    # 2. Robust Camera Trigger (with retries)
-    max_retries = 5
-    for i in range(max_retries):
-        try:
-            cam_resp = requests.post(f"{CAMERA_API}/start", json=active_stream_config, timeout=5)
-            if cam_resp.status_code != 200:
-                 return jsonify({"error": f"Camera service error: {cam_resp.text}"}), 500
-            return jsonify({"status": "System Online", "stream": active_stream_config}), 200
-        except requests.exceptions.ConnectionError:
-            if i < max_retries - 1:
-                time.sleep(2)
-                continue
-            return jsonify({"error": "Camera service not reachable"}), 500
+    stream = load_stream(stream_id)
+    if not stream:
+        stream = streams.first()
+    # Stored in the DB so every API process agrees on it
+    set_active_stream(stream['id'])
+
+    body, code = start_stream_worker(stream, requested_at)
+    if code == 200:
+        body["status"] = "System Online"
+    return jsonify(body), code
 
 @app.route('/system/stop', methods=['POST'])
 def system_stop():
-    global worker_process
-    
-    # 1. Stop local AI processing
-    if worker_process and worker_process.poll() is None:
-        print("[SYSTEM] Stopping AI Worker...")
-        worker_process.terminate()
+    """Stops the given stream (default: the active one), or every stream with {"all": true}."""
+    data = request.get_json(silent=True) or {}
+    if data.get('all'):
+        supervisor.stop_all()
         try:
-            worker_process.wait(timeout=2)
-        except subprocess.TimeoutExpired:
-            worker_process.kill()
-        worker_process = None
-        
-    # 2. Stop Remote Hardware
-    try:
-        requests.post(f"{CAMERA_API}/stop", timeout=5)
-    except:
-        pass
-        
-    return jsonify({"status": "System Offline"}), 200
+            requests.post(f"{CAMERA_API}/stop", timeout=5)
+        except:
+            pass
+        return jsonify({"status": "System Offline"}), 200
+
+    active = get_active_stream()
+    stream_id = data.get('stream_id') or (active['id'] if active else None)
+    if stream_id:
+        stop_stream_worker(stream_id)
+    return jsonify({"status": "System Offline", "stream_id": stream_id}), 200
 
 @app.route('/system/status')
 def system_status():
-    global worker_process, active_stream_config
-    worker_alive = False
-    if worker_process is not None:
-        worker_alive = worker_process.poll() is None
+    active = get_active_stream()
+    worker = supervisor.status(active['id']) if active else None
+    worker_alive = bool(worker and worker['alive'])
     
     timestamp = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
     return {
         "status": "ok", 
         "worker_alive": worker_alive,
-        "active_stream": active_stream_config,
-        "message": f"AI Worker is active ({active_stream_config['name'] if active_stream_config else 'None'})" if worker_alive else "AI Worker is stopped", 
+        "active_stream": active,
+        "last_worker_event": last_worker_event(active['name']) if active else None,
+        "time_to_first_frame_ms": worker['time_to_first_frame_ms'] if worker else None,
+        "workers": supervisor.status(),
+        "message": f"AI Worker is active ({active['name'] if active else 'None'})" if worker_alive else "AI Worker is stopped", 
         "timestamp": timestamp
     }
 
-@app.before_request
-def initialize():
-    global active_stream_config
-    if not hasattr(app, '_db_initialized'):
-        init_db()
-        app._db_initialized = True
-        if active_stream_config is None:
-            with get_db_connection() as conn:
-                row = conn.execute('SELECT * FROM streams WHERE id = ?', ('local',)).fetchone()
-                if not row:
-                    row = conn.execute('SELECT * FROM streams LIMIT 1').fetchone()
-                if row: active_stream_config = dict(row)
-                    
-    if not hasattr(app, '_background_thread_started'):
+def worker_metrics(out, name, timings):
+    """Renders one stream's last timings event (cumulative since the worker started)."""
+    labels = {"stream": name}
+    out.counter("frames_grabbed_total", timings.get('grabbed'), labels, "Packets grabbed from the ingest stream")
+    out.counter("frames_decoded_total", timings.get('decoded'), labels, "Frames retrieved into the frame ring")
+    for stage, hist in (timings.get('decode') or {}).items():
+        out.histogram("stage_seconds", hist, dict(labels, stage=stage), "Per-frame time of each pipeline stage")
+    for sink in timings.get('sinks') or []:
+        sink_labels = dict(labels, sink=sink['name'])
+        out.histogram("stage_seconds", sink.get('latency_hist'), dict(labels, stage=sink['name']))
+        out.sample("sink_queue_depth", sink.get('depth'), sink_labels, help_text="Items waiting (or ring lag) per sink")
+        out.counter("sink_written_total", sink.get('written'), sink_labels, "Items a sink finished")
+        out.counter("sink_dropped_total", sink.get('dropped'), sink_labels, "Items a sink dropped or skipped")
+        out.counter("sink_errors_total", sink.get('errors'), sink_labels, "Sink handler errors")
+    ingest = timings.get('ingest') or {}
+    ingest_labels = dict(labels, transport=ingest.get('transport', ''))
+    out.counter("ingest_bytes_total", ingest.get('bytes'), ingest_labels, "Bytes received from stream-cam")
+    out.sample("ingest_bytes_per_second", ingest.get('bytes_per_s'), ingest_labels, help_text="Ingest rate over the last second")
+    out.counter("ingest_packets_total", ingest.get('packets'), ingest_labels, "MPEG-TS packets received")
+    out.counter("ingest_lost_packets_total", ingest.get('lost_packets'), dict(ingest_labels, stage="ingest"),
+                "MPEG-TS packets lost on the way to the worker (continuity counter) or at its decoders (socket drops)")
+    out.counter("ingest_lost_packets_total", ingest.get('decoder_lost_packets'), dict(ingest_labels, stage="decoder"))
+    out.counter("ingest_reconnects_total", ingest.get('reconnects'), ingest_labels, "Ingest sender reconnections")
+    gate = timings.get('gate') or {}
+    out.counter("scene_checked_total", gate.get('checked'), labels, "Frames checked by the scene gate")
+    out.counter("scene_forwarded_total", gate.get('forwarded'), labels, "Frames forwarded to snapshots/inference")
+    out.sample("worker_timings_age_seconds", time.time() - timings['timestamp'], labels,
+               help_text="Seconds since the worker last reported")
+
+def process_metrics(out, worker):
+    """CPU and RSS of a worker and its ffmpeg children, read from /proc at scrape time."""
+    root = worker['pid']
+    for pid in process_tree(root):
+        sample = process_sample(pid)
+        if sample is None:
+            continue
+        labels = {"stream": worker['stream'], "process": process_role(pid, process_cmdline(pid), root), "pid": pid}
+        out.counter("process_cpu_seconds_total", sample[0], labels, "CPU time of worker processes")
+        out.sample("process_resident_bytes", sample[1], labels, help_text="RSS of worker processes")
+
+API_METRICS_HELP = {
+    "request_seconds": "Latency of /latest-frame, /hls-streams and /results requests",
+    "socketio_clients": "Connected Socket.IO clients",
+    "socketio_emits_total": "Socket.IO messages emitted",
+    "mjpeg_clients": "Open /latest-frame/stream responses",
+}
+
+def publish_api_metrics():
+    """Writes this process's API counters to the shared metrics directory."""
+    samples = [("histogram", "request_seconds", {"endpoint": endpoint, "status": status}, hist.snapshot())
+               for (endpoint, status), hist in list(request_latency.items())]
+    samples.append(("gauge", "socketio_clients", {}, socketio_clients))
+    samples += [("counter", "socketio_emits_total", {"event": event}, count) for event, count in list(socketio_emits.items())]
+    samples.append(("gauge", "mjpeg_clients", {}, frame_hub_clients))
+    shared_metrics.write(samples)
+
+def api_metrics_thread():
+    """Background task publishing this process's API counters."""
+    while True:
+        try:
+            publish_api_metrics()
+        except OSError:
+            pass
+        time.sleep(API_METRICS_INTERVAL)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of worker stages, ffmpeg children and API hot paths (all API processes)."""
+    out = MetricsText(prefix="svl_")
+    publish_api_metrics()
+    for kind, name, labels, value in shared_metrics.collect():
+        help_text = API_METRICS_HELP.get(name, "")
+        if kind == "histogram":
+            out.histogram(name, value, labels, help_text)
+        else:
+            out.sample(name, value, labels, kind, help_text)
+    for name, events in sorted((k, v) for k, v in supervisor.registry.events().items() if k):
+        if 'timings' in events:
+            worker_metrics(out, name, events['timings'])
+    for worker in supervisor.status():
+        out.sample("worker_alive", int(worker['alive']), {"stream": worker['stream']}, help_text="1 while the stream's worker runs")
+        if worker['alive'] and worker['pid']:
+            process_metrics(out, worker)
+    return Response(out.render(), content_type=MetricsText.CONTENT_TYPE)
+
+def start_background_tasks():
+    """Runs once per API process at import (gunicorn imports the app in each worker)."""
+    # Worker events arrive on the control process's event socket; without a message
+    # queue every process tails the log itself since its emits stay local
+    if IS_CONTROL or not SOCKETIO_MESSAGE_QUEUE:
         socketio.start_background_task(target=log_reader_thread)
-        app._background_thread_started = True
\ No newline at end of file
+    if IS_CONTROL:
+        socketio.start_background_task(target=worker_event_thread)
+    socketio.start_background_task(target=frame_hub_thread)
+    socketio.start_background_task(target=api_metrics_thread)
+    if supervisor.pool:
+        socketio.start_background_task(target=supervisor.pool.fill)
+
+start_background_tasks()
@@ -0,0 +1,504 @@
+"""End-to-end pipeline benchmark with a synthetic camera.
+
+Runs camera_test.py against a generated MPEG-TS source and a stub Ollama
+endpoint, so the whole pipeline can be measured without a webcam or GPU:
+
+    python3 scripts/benchmark.py --duration 30 --out bench.json
+
+Every source frame carries its index as a black/white barcode in the top
+rows; the harness remembers when it sent each index and decodes the barcode
+from the newest HLS segment/part as soon as it shows up in the playlist
+(glass-to-HLS). Everything else comes from the worker's own event stream
+(timings, snapshot, inference) and /proc. The result is one JSON document;
+run it twice and diff the numbers to compare builds. Worker settings
+(HLS_MODE, WORKER_OUTPUTS, ANALYSIS_FPS...) are taken from the environment.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from helpers import EventListener, llhls_dir, process_cmdline, process_role, process_sample, process_tree
+from transport import IngestSender, ingest_address
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_SCRIPT = os.path.join(SCRIPT_DIR, "camera_test.py")
+BARCODE_BITS = 24
+BARCODE_HEIGHT = 16
+
+
+def percentiles(values):
+    """count/mean/p50/p95/max summary (None for an empty list)."""
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2),
+        "p50": round(pick(0.5), 2),
+        "p95": round(pick(0.95), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+# --- SYNTHETIC CAMERA ---
+
+def draw_barcode(frame, index):
+    block = frame.shape[1] // BARCODE_BITS
+    for bit in range(BARCODE_BITS):
+        value = 255 if index >> (BARCODE_BITS - 1 - bit) & 1 else 0
+        frame[:BARCODE_HEIGHT, bit * block:(bit + 1) * block] = value
+
+
+def read_barcode(frame):
+    """Frame index from the barcode rows (sampled at block centres, robust to compression)."""
+    if frame is None or frame.shape[0] < BARCODE_HEIGHT:
+        return None
+    block = frame.shape[1] // BARCODE_BITS
+    row = frame[BARCODE_HEIGHT // 4:BARCODE_HEIGHT * 3 // 4].mean(axis=(0, 2) if frame.ndim == 3 else 0)
+    index = 0
+    for bit in range(BARCODE_BITS):
+        centre = row[bit * block + block // 4:(bit + 1) * block - block // 4]
+        index = index << 1 | int(centre.mean() > 127)
+    return index
+
+
+class SyntheticCamera:
+    """Generates barcoded frames in Python and pushes them as H.264 MPEG-TS through an IngestSender.
+
+    A box moves across the picture so the scene gate keeps forwarding frames;
+    `sent[index]` is the wall-clock time the frame was handed to ffmpeg.
+    The sender is the same one stream-cam uses, so INGEST_TRANSPORT applies.
+    """
+
+    def __init__(self, sender, width=640, height=480, fps=30):
+        self.sender = sender
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.sent = {}
+        self.process = None
+        self.running = False
+        self._thread = None
+
+    def build_cmd(self):
+        return [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{self.width}x{self.height}', '-r', str(self.fps),
+            '-i', '-',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-preset', 'ultrafast', '-tune', 'zerolatency',
+            '-g', str(self.fps), '-x264-params', 'repeat-headers=1',
+            '-f', 'mpegts', 'pipe:1',
+        ]
+
+    def start(self):
+        self.process = subprocess.Popen(self.build_cmd(), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="synthetic-camera", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._pump, name="synthetic-camera-send", daemon=True).start()
+        return self
+
+    def _pump(self):
+        while True:
+            chunk = self.process.stdout.read1(64 * 1024)
+            if not chunk:
+                break
+            self.sender.send(chunk)
+        self.sender.close()
+
+    def _run(self):
+        frame = np.zeros((self.height, self.width, 3), np.uint8)
+        start = time.time()
+        index = 0
+        while self.running:
+            due = start + index / self.fps
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            frame[BARCODE_HEIGHT:] = 40
+            x = int((index * 4) % (self.width - 80))
+            cv2.rectangle(frame, (x, self.height // 3), (x + 80, self.height // 3 + 80), (0, 160, 255), -1)
+            draw_barcode(frame, index)
+            self.sent[index] = time.time()
+            try:
+                self.process.stdin.write(frame.tobytes())
+            except (BrokenPipeError, ValueError):
+                break
+            index += 1
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self.process:
+            try:
+                self.process.stdin.close()
+            except Exception:
+                pass
+            self.process.terminate()
+            self.process.wait(timeout=5)
+
+
+# --- STUB OLLAMA ---
+
+class StubOllama:
+    """Answers /api/chat after `latency` seconds with a fixed caption (and a box if `detect`)."""
+
+    def __init__(self, port=0, latency=0.3, detect=False):
+        stub = self
+        self.latency = latency
+        self.detect = detect
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if body.get("messages"):
+                    stub.requests += 1
+                    time.sleep(stub.latency)
+                content = "A synthetic test pattern with a moving orange box."
+                if stub.detect:
+                    content = '[{"label": "box", "box": [0.4, 0.33, 0.55, 0.5]}] ' + content
+                data = json.dumps({"message": {"role": "assistant", "content": content}, "done": True}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/chat"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub-ollama", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# --- MEASUREMENT ---
+
+class EventRecorder:
+    """Collects worker events (with receive time) from the benchmark's own socket."""
+
+    def __init__(self, path):
+        self.timings = []
+        self.snapshot_ms = []
+        self.socket_ms = []
+        self.inference_ms = []
+        self.inference_cached = 0
+        self.first_frame = None
+        self.errors = []
+        self.recording = False
+        self.listener = EventListener(self.on_event, path).bind()
+        threading.Thread(target=self.listener.run, name="bench-events", daemon=True).start()
+
+    def on_event(self, event):
+        now = time.time()
+        kind = event["type"]
+        if kind == "first_frame":
+            self.first_frame = event
+        elif kind == "error":
+            self.errors.append(event.get("message"))
+        if not self.recording:
+            return
+        if kind == "timings":
+            event["received"] = now
+            self.timings.append(event)
+        elif kind == "snapshot":
+            self.socket_ms.append((now - event["timestamp"]) * 1000)
+            if event.get("frame_ts"):
+                self.snapshot_ms.append((now - event["frame_ts"]) * 1000)
+        elif kind == "inference":
+            if event.get("cached"):
+                self.inference_cached += 1
+            else:
+                self.inference_ms.append(event.get("latency_ms", 0.0))
+
+
+class PlaylistWatcher:
+    """Polls one HLS/LL-HLS playlist and measures send -> available for each new media file."""
+
+    def __init__(self, name, directory, sent, interval=0.02):
+        self.name = name
+        self.directory = directory
+        self.sent = sent
+        self.interval = interval
+        self.latest_ms = []  # newest frame in the file
+        self.first_ms = []  # oldest frame in the file
+        self.unreadable = 0
+        self.recording = False
+        self.running = True
+        self._seen = set()
+        threading.Thread(target=self._run, name=f"watch-{name}", daemon=True).start()
+
+    def _media(self):
+        try:
+            with open(os.path.join(self.directory, "live.m3u8")) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return []
+        media, init = [], None
+        for line in lines:
+            if line.startswith("#EXT-X-MAP:"):
+                init = line.split('URI="', 1)[1].split('"', 1)[0]
+            elif line.startswith("#EXT-X-PART:") and "URI=" in line:
+                media.append((line.split('URI="', 1)[1].split('"', 1)[0], init))
+            elif line and not line.startswith("#"):
+                media.append((line, init))
+        return media
+
+    def _indices(self, uri, init):
+        """Barcodes of the first and last frame of a media file (init prepended for fMP4)."""
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(uri)[1] or ".ts") as tmp:
+            for name in ([init] if init else []) + [uri]:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    tmp.write(f.read())
+            tmp.flush()
+            cap = cv2.VideoCapture(tmp.name, cv2.CAP_FFMPEG)
+            first = last = None
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if first is None:
+                    first = frame
+                last = frame
+            cap.release()
+        return read_barcode(first), read_barcode(last)
+
+    def _run(self):
+        while self.running:
+            for uri, init in self._media():
+                if uri in self._seen:
+                    continue
+                self._seen.add(uri)
+                seen_at = time.time()
+                if not self.recording:
+                    continue
+                try:
+                    first, last = self._indices(uri, init)
+                except OSError:
+                    first = last = None
+                if last is None or last not in self.sent:
+                    self.unreadable += 1
+                    continue
+                self.latest_ms.append((seen_at - self.sent[last]) * 1000)
+                if first in self.sent:
+                    self.first_ms.append((seen_at - self.sent[first]) * 1000)
+            time.sleep(self.interval)
+
+    def result(self):
+        return {
+            "newest_frame_ms": percentiles(self.latest_ms),
+            "oldest_frame_ms": percentiles(self.first_ms),
+            "unreadable": self.unreadable,
+        }
+
+
+class ProcessSampler:
+    """CPU % and RSS per process of the worker tree, sampled every `interval` seconds."""
+
+    def __init__(self, root_pid, interval=1.0):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.samples = {}  # label -> {"cpu": [...], "rss": [...]}
+        self.recording = False
+        self.running = True
+        threading.Thread(target=self._run, name="bench-proc", daemon=True).start()
+
+    def _run(self):
+        last = {}
+        while self.running:
+            now = time.time()
+            labels = {}
+            for pid in process_tree(self.root_pid):
+                label = process_role(pid, process_cmdline(pid), self.root_pid)
+                labels[pid] = f"{label}-{pid}" if label in labels.values() else label
+            for pid, label in labels.items():
+                sample = process_sample(pid)
+                if sample is None:
+                    continue
+                previous = last.get(pid)
+                last[pid] = (now, sample[0])
+                if previous is None or not self.recording:
+                    continue
+                cpu = (sample[0] - previous[1]) / max(now - previous[0], 1e-6) * 100
+                entry = self.samples.setdefault(label, {"cpu": [], "rss": []})
+                entry["cpu"].append(cpu)
+                entry["rss"].append(sample[1] / 1024 / 1024)
+            time.sleep(self.interval)
+
+    def result(self):
+        return {
+            label: {"cpu_percent": percentiles(s["cpu"]), "rss_mb": percentiles(s["rss"])}
+            for label, s in sorted(self.samples.items())
+        }
+
+
+def summarize_timings(timings):
+    """Ingest/decode rates and per-sink numbers from the worker's timings events."""
+    if len(timings) < 2:
+        return {}, {}
+    first, last = timings[0], timings[-1]
+    elapsed = last["received"] - first["received"]
+    grabbed = last["grabbed"] - first["grabbed"]
+    decoded = last["decoded"] - first["decoded"]
+    c0, c1 = first.get("capture") or {}, last.get("capture") or {}
+    retrieved = c1.get("retrieved", 0) - c0.get("retrieved", 0)
+    ingest = {
+        "ingest_fps": round(grabbed / elapsed, 2) if elapsed > 0 else None,
+        "decoded_fps": round(decoded / elapsed, 2) if elapsed > 0 else None,
+        "grab_ms": round((c1.get("grab_ms", 0) - c0.get("grab_ms", 0)) / grabbed, 3) if grabbed else None,
+        "retrieve_ms": round((c1.get("retrieve_ms", 0) - c0.get("retrieve_ms", 0)) / retrieved, 3) if retrieved else None,
+        "gate": last.get("gate"),
+        "tracker": last.get("tracker"),
+        "receiver": last.get("ingest"),
+    }
+    before = {s["name"]: s for s in first.get("sinks") or []}
+    sinks = {}
+    for s in last.get("sinks") or []:
+        b = before.get(s["name"], {})
+        written = s.get("written", 0) - b.get("written", 0)
+        sinks[s["name"]] = {
+            "written": written,
+            "dropped": s.get("dropped", 0) - b.get("dropped", 0),
+            "errors": s.get("errors", 0) - b.get("errors", 0),
+            "avg_write_ms": s.get("avg_write_ms"),
+            "busy_percent": round(s.get("avg_write_ms", 0) * written / elapsed / 10, 1) if elapsed > 0 else None,
+        }
+        for key in ("latency_p50_ms", "latency_p95_ms", "throughput_fps", "lapped"):
+            if key in s:
+                sinks[s["name"]][key] = s[key]
+    return ingest, sinks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds after the first frame before measuring")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--port", type=int, default=56080, help="worker ingest port (uses port..port+3: ingest, output, decode, relay)")
+    parser.add_argument("--stream", default="benchmark", help="STREAM_NAME for the worker")
+    parser.add_argument("--stub-latency", type=float, default=0.3, help="seconds the stub model takes per call")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+def run(args):
+    """Runs one benchmark and returns the report dict (with "error" if the worker never started)."""
+    event_socket = os.path.join(tempfile.gettempdir(), f"bench_events_{os.getpid()}.sock")
+    recorder = EventRecorder(event_socket)
+    stub = StubOllama(latency=args.stub_latency, detect=os.environ.get("INFERENCE_DETECT") == "1").start()
+
+    env = dict(os.environ)
+    env.update({
+        "STREAM_NAME": args.stream,
+        "STREAM_ID": args.stream,
+        "INGEST_PORT": str(args.port),
+        "OUTPUT_PORT": str(args.port + 1),
+        "DECODE_PORT": str(args.port + 2),
+        "RELAY_PORT": str(args.port + 3),
+        "OLLAMA_API_URL": stub.url,
+        "EVENT_SOCKET": event_socket,
+        "CACHE_ENABLED": env.get("CACHE_ENABLED", "0"),  # every call should reach the stub
+        # Keep stub captions out of the real history
+        "RESULTS_DB_PATH": os.path.join(tempfile.gettempdir(), f"bench_results_{os.getpid()}.db"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    env.setdefault("WORKER_OUTPUTS", "raw,processed")
+    llhls = env.get("HLS_MODE", "hls") == "llhls"
+    started = time.time()
+    worker = subprocess.Popen([sys.executable, WORKER_SCRIPT], env=env, cwd=SCRIPT_DIR,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    transport = env.get("INGEST_TRANSPORT", "udp")
+    sender = IngestSender(transport, ingest_address(transport, args.port, "127.0.0.1"))
+    camera = SyntheticCamera(sender, args.width, args.height, args.fps).start()
+    sampler = ProcessSampler(worker.pid)
+
+    watchers = []
+    for kind in ("raw", "processed"):
+        if kind in env["WORKER_OUTPUTS"]:
+            directory = llhls_dir(args.stream, kind) if llhls else f"/data/logs/HLS_STREAMS/{args.stream}/{kind}"
+            watchers.append(PlaylistWatcher(kind, directory, camera.sent))
+
+    report = {"config": {k: v for k, v in vars(args).items() if k != "out"}}
+    report["config"]["worker_env"] = {k: env[k] for k in sorted(env) if k in (
+        "WORKER_OUTPUTS", "RAW_HLS_MODE", "HLS_MODE", "ANALYSIS_FPS", "ENCODER_FPS", "OVERLAY_ENABLED",
+        "INFERENCE_DETECT", "FRAME_RING_SLOTS", "SINK_QUEUE_SIZE", "SINK_DROP_POLICY", "INGEST_TRANSPORT")}
+    try:
+        deadline = started + 60
+        while recorder.first_frame is None and time.time() < deadline and worker.poll() is None:
+            time.sleep(0.05)
+        if recorder.first_frame is None:
+            report["error"] = "worker produced no first frame"
+            return report
+        report["startup"] = {"first_frame_ms": round((time.time() - started) * 1000, 1)}
+        time.sleep(args.warmup)
+
+        for part in [recorder, sampler] + watchers:
+            part.recording = True
+        time.sleep(args.duration)
+        for part in [recorder, sampler] + watchers:
+            part.recording = False
+
+        ingest, sinks = summarize_timings(recorder.timings)
+        report["ingest"] = dict(ingest, sender=sender.stats())
+        report["sinks"] = sinks
+        report["snapshot_notify_ms"] = {
+            "frame_to_socket": percentiles(recorder.snapshot_ms),
+            "emit_to_socket": percentiles(recorder.socket_ms),
+        }
+        report["inference"] = {
+            "latency_ms": percentiles(recorder.inference_ms),
+            "cached": recorder.inference_cached,
+            "stub_requests": stub.requests,
+        }
+        report["glass_to_hls"] = {w.name: w.result() for w in watchers}
+        report["processes"] = sampler.result()
+        report["worker_errors"] = recorder.errors[:20]
+        return report
+    finally:
+        sampler.running = False
+        for w in watchers:
+            w.running = False
+        camera.stop()
+        worker.terminate()
+        try:
+            worker.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+        stub.stop()
+        try:
+            os.unlink(event_socket)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run(args)
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(1 if "error" in result else 0)
@@ -1,29 +1,175 @@
 import subprocess
 import os
+import threading
 import time
 import signal
+from collections import deque
 from flask import Flask, jsonify, request
 
+from transport import IngestSender, ingest_address
+
 app = Flask(__name__)
-process = None
 
-# Destination is the internal container name of your operations container
-UDP_DEST = "udp://stream_operations:55080?pkt_size=1316"
+# Destination is the internal container name of your operations container;
+# each worker listens on its own port (sent by the supervisor as dest_port)
+INGEST_DEST_HOST = "stream_operations"
+DEFAULT_DEST_PORT = 55080
+# udp, tcp, unix or pipe (see transport.py); the API sends the worker's choice per stream
+INGEST_TRANSPORT = os.environ.get("INGEST_TRANSPORT", "udp")
+# How long /start waits for the first packet before giving up on readiness
+READY_TIMEOUT = float(os.environ.get("FFMPEG_READY_TIMEOUT", "10"))
+
+
+class ManagedFFmpeg:
+    """One ffmpeg child in its own process group, observed through -progress.
+
+    ffmpeg writes key=value progress blocks to a pipe of their own; the first
+    block with frames or bytes written marks the stream as ready, and every
+    block refreshes the live stats (fps, bitrate, dropped/duplicated frames).
+    With a `sender`, the MPEG-TS ffmpeg writes to stdout is pumped into it
+    (the ingest transport). stderr goes to a per-stream debug log as before.
+    """
+
+    def __init__(self, stream_id, cmd, log_path, sender=None):
+        self.stream_id = stream_id
+        self._progress_r, self._progress_w = os.pipe()
+        self.cmd = cmd[:1] + ["-nostats", "-progress", f"pipe:{self._progress_w}", "-stats_period", "0.25"] + cmd[1:]
+        self.log_path = log_path
+        self.sender = sender
+        self.process = None
+        self.ready = threading.Event()
+        self.exited = threading.Event()
+        self.started_at = None
+        self.ready_ms = None
+        self.stats = {}
+        self._log_file = None
+
+    def start(self):
+        self._log_file = open(self.log_path, "w", buffering=1)
+        self.started_at = time.time()
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdout=subprocess.PIPE if self.sender else subprocess.DEVNULL,
+            stderr=self._log_file,
+            pass_fds=(self._progress_w,),
+            start_new_session=True
+        )
+        os.close(self._progress_w)
+        threading.Thread(target=self._read_progress, daemon=True).start()
+        if self.sender:
+            threading.Thread(target=self._pump, daemon=True).start()
+        return self
+
+    def _pump(self):
+        while True:
+            chunk = self.process.stdout.read1(64 * 1024)
+            if not chunk:
+                break
+            self.sender.send(chunk)
+        self.sender.close()
+
+    def _read_progress(self):
+        block = {}
+        progress = open(self._progress_r)
+        for line in progress:
+            key, sep, value = line.strip().partition("=")
+            if not sep:
+                continue
+            block[key] = value.strip()
+            if key != "progress":
+                continue
+            self.stats = {
+                "frame": _to_number(block.get("frame")),
+                "fps": _to_number(block.get("fps")),
+                "bitrate_kbps": _to_number(block.get("bitrate", "").replace("kbits/s", "")),
+                "total_size": _to_number(block.get("total_size")),
+                "dropped_frames": _to_number(block.get("drop_frames")),
+                "dup_frames": _to_number(block.get("dup_frames")),
+                "speed": block.get("speed"),
+                "updated": time.time(),
+            }
+            if not self.ready.is_set() and ((self.stats["frame"] or 0) > 0 or (self.stats["total_size"] or 0) > 0):
+                self.ready_ms = round((time.time() - self.started_at) * 1000, 1)
+                self.ready.set()
+            block = {}
+        progress.close()
+        self.process.wait()
+        self.exited.set()
+
+    def wait_ready(self, timeout):
+        """True once data flows; False if ffmpeg exits or `timeout` passes first."""
+        deadline = time.time() + timeout
+        while not self.ready.is_set() and not self.exited.is_set() and time.time() < deadline:
+            self.ready.wait(0.05)
+        return self.ready.is_set()
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self, timeout=2):
+        if self.alive:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+                self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+            except ProcessLookupError:
+                pass
+        if self._log_file:
+            self._log_file.close()
+
+    def log_tail(self, lines=20):
+        try:
+            with open(self.log_path) as f:
+                return list(deque(f, maxlen=lines))
+        except OSError:
+            return []
+
+    def status(self):
+        return {
+            "pid": self.process.pid if self.process else None,
+            "alive": self.alive,
+            "ready": self.ready.is_set(),
+            "ready_ms": self.ready_ms,
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            **self.stats,
+            "ingest": self.sender.stats() if self.sender else None,
+        }
 
-def kill_existing_ffmpeg():
-    """Force kill any ffmpeg process holding the camera device."""
+
+def _to_number(value):
     try:
-        subprocess.run(["pkill", "-9", "ffmpeg"], check=False)
-        time.sleep(1) # Wait for kernel to release device
-    except:
-        pass
+        return float(value) if "." in value else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# One managed ffmpeg per stream id, so several cameras can feed several workers
+processes = {}
+
+def stop_stream_process(stream_id):
+    """Stops the ffmpeg process group started for one stream."""
+    proc = processes.pop(stream_id, None)
+    if proc is None:
+        return False
+    proc.stop()
+    return True
 
 @app.route('/start', methods=['POST'])
 def start_stream():
-    global process
-    kill_existing_ffmpeg()
-    
     data = request.json or {}
+    stream_id = data.get('id', 'default')
+    stop_stream_process(stream_id)
+
+    dest_port = int(data.get('dest_port', DEFAULT_DEST_PORT))
+    transport = data.get('transport') or INGEST_TRANSPORT
+    try:
+        address = ingest_address(transport, dest_port, INGEST_DEST_HOST)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    dest = f"{transport}://{address if isinstance(address, str) else '%s:%d' % address}"
     stream_type = data.get('type', 'local')
     url = data.get('url', '/dev/video0')
     username = data.get('username', '')
@@ -77,33 +223,44 @@ def start_stream():
         "-bsf:v", "dump_extra",
         "-pix_fmt", "yuv420p", 
         "-f", "mpegts", 
-        UDP_DEST
+        "pipe:1" # carried to the worker by the IngestSender
     ]
     
     try:
-        log_file = open("/tmp/ffmpeg_debug.log", "w", buffering=1)
-        process = subprocess.Popen(
-            cmd,
-            stdout=log_file,
-            stderr=subprocess.STDOUT,
-            preexec_fn=os.setpgrp,
-            universal_newlines=True
-        )
-        
-        time.sleep(2.0)
-        if process.poll() is not None:
-            return jsonify({"error": "FFmpeg exited immediately", "cmd": " ".join(cmd)}), 500
-            
-        return jsonify({"status": "Stream started", "pid": process.pid}), 200
+        sender = IngestSender(transport, address, logger=print)
+        proc = ManagedFFmpeg(stream_id, cmd, f"/tmp/ffmpeg_debug_{stream_id}.log", sender=sender).start()
+        processes[stream_id] = proc
+
+        # Return as soon as the first packet is out instead of after a fixed sleep
+        if not proc.wait_ready(READY_TIMEOUT):
+            if not proc.alive:
+                processes.pop(stream_id, None)
+                proc.stop()
+                return jsonify({"error": "FFmpeg exited before sending data", "cmd": " ".join(cmd), "log": proc.log_tail()}), 500
+            # Still running (e.g. a slow network camera): report it, the worker keeps waiting
+            return jsonify({"status": "Stream starting", "dest": dest, **proc.status()}), 200
+
+        return jsonify({"status": "Stream started", "dest": dest, **proc.status()}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/stop', methods=['POST'])
 def stop_stream():
-    global process
-    kill_existing_ffmpeg()
-    process = None
+    # app.py's "stop all" and shutdown POST without a body
+    data = request.get_json(silent=True) or {}
+    stream_id = data.get('id')
+    if stream_id:
+        stop_stream_process(stream_id)
+        return jsonify({"status": "Stopped", "id": stream_id}), 200
+
+    # No id: stop every ffmpeg this service started
+    for sid in list(processes):
+        stop_stream_process(sid)
     return jsonify({"status": "Stopped"}), 200
 
+@app.route('/status')
+def stream_status():
+    return jsonify({sid: p.status() for sid, p in processes.items()}), 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -1,10 +1,7 @@
 import cv2
+import numpy as np
 import os
-import subprocess
 import shutil
-import base64
-import requests
-import re
 import time
 import sys
 import threading
@@ -13,21 +10,131 @@ from datetime import datetime
 import socket
 import signal
 
+from transport import IngestReceiver, ingest_address
+from helpers import (
+    TeeEncoder, PassthroughRemuxer, SharedFrameRing, RingReader, SinkWriter,
+    InferenceClient, ResultCache, SceneChangeDetector,
+    SharedJpegSlot, SnapshotStore, ResultStore, ResultWriter, latest_frame_slot_path,
+    EventPublisher, EventListener, EventLogHandler, control_socket_path, LLHLSSegmenter, fmp4_output, hls_output,
+    llhls_dir, udp_output, frame_ring_name, Histogram, OverlayRenderer, BoxTracker, DETECTION_PROMPT, RateLimiter, fit_size, parse_size, probe_stream,
+)
+
 # --- CONFIGURATION ---
 STREAM_NAME = os.environ.get("STREAM_NAME", "default")
+STREAM_ID = os.environ.get("STREAM_ID", STREAM_NAME)
+# When the supervisor handed this stream over (for time-to-first-frame)
+HANDOFF_TS = float(os.environ.get("WORKER_HANDOFF_TS") or time.time())
 LLM_NAME = "SmolVLM-500M-Instruct-fer0" # Keeping model name but prefixing paths with stream name
-INPUT_URL = "udp://0.0.0.0:55080"
-OUTPUT_URL = "udp://172.17.0.1:55081?pkt_size=1316"
-API_URL = "http://ollama-llm:11434/api/chat"
+# Ports are handed out per worker by the supervisor in app.py
+INGEST_PORT = int(os.environ.get("INGEST_PORT", "55080"))
+OUTPUT_PORT = int(os.environ.get("OUTPUT_PORT", str(INGEST_PORT + 1)))
+DECODE_PORT = int(os.environ.get("DECODE_PORT", str(INGEST_PORT + 2)))
+RELAY_PORT = int(os.environ.get("RELAY_PORT", str(INGEST_PORT + 3)))
+# How stream-cam's MPEG-TS reaches INGEST_PORT: udp, tcp, unix or pipe (see transport.py).
+# The IngestReceiver counts lost packets and relays everything to INPUT_URL on loopback.
+INGEST_TRANSPORT = os.environ.get("INGEST_TRANSPORT", "udp")
+INGEST_RCVBUF = int(os.environ.get("INGEST_RCVBUF", str(8 * 1024 * 1024))) # capped by net.core.rmem_max
+# The loopback hops into the decoders get the same buffer; what they still drop is counted too
+LOOPBACK_BUFFER = f"buffer_size={INGEST_RCVBUF}&fifo_size={INGEST_RCVBUF // 188}"
+INPUT_URL = f"udp://127.0.0.1:{RELAY_PORT}?{LOOPBACK_BUFFER}"
+OUTPUT_URL = f"udp://172.17.0.1:{OUTPUT_PORT}?pkt_size=1316"
+API_URL = os.environ.get("OLLAMA_API_URL") or "http://ollama-llm:11434/api/chat"
 MODEL_ID = f"hf.co/JoseferEins/{LLM_NAME}:latest"
 
 # Unique paths per stream
 IMAGE_DIR = f"/data/images/{STREAM_NAME}/captured_frames"
 LOG_DIR = f"/data/logs/{STREAM_NAME}"
-STREAM_DIR = "/data/logs/HLS_STREAMS"
+STREAM_DIR = f"/data/logs/HLS_STREAMS/{STREAM_NAME}"
 RAW_STREAM_DIR = os.path.join(STREAM_DIR, "raw")
 PROC_STREAM_DIR = os.path.join(STREAM_DIR, "processed")
 
+# Which outputs the worker produces: any of "udp", "raw", "processed".
+# Outputs showing the same picture share one encoder (see helpers/encoder.py).
+WORKER_OUTPUTS = [o.strip() for o in os.environ.get("WORKER_OUTPUTS", "udp,raw,processed").split(",") if o.strip()]
+# "passthrough" remuxes the camera's H.264 straight into the raw playlist,
+# "encode" sends decoded frames through the encoder like the other outputs.
+RAW_HLS_MODE = os.environ.get("RAW_HLS_MODE", "passthrough")
+# "hls": 2s MPEG-TS segments on the /data/logs volume. "llhls": Low-Latency
+# HLS (fMP4 parts of LLHLS_PART_TARGET seconds) kept in a ring in /dev/shm;
+# the API serves both under the same /hls-streams/<name>/... URLs.
+HLS_MODE = os.environ.get("HLS_MODE", "hls")
+LLHLS_PART_TARGET = float(os.environ.get("LLHLS_PART_TARGET", "0.2"))
+LLHLS_RAW_DIR = llhls_dir(STREAM_NAME, "raw")
+LLHLS_PROC_DIR = llhls_dir(STREAM_NAME, "processed")
+# Per-run prefix: segment names are never reused, so they can be cached as immutable
+SEGMENT_PREFIX = f"{int(time.time()):x}_"
+# Loopback feed the passthrough remuxer republishes for the decoder
+DECODE_PUSH_URL = f"udp://127.0.0.1:{DECODE_PORT}?pkt_size=1316"
+DECODE_LISTEN_URL = f"udp://0.0.0.0:{DECODE_PORT}?{LOOPBACK_BUFFER}"
+
+# Per-sink writer queues: depth and what to lose when a sink falls behind
+# ("drop_oldest" keeps the freshest frames, "drop_newest" keeps what is queued)
+SINK_QUEUE_SIZE = int(os.environ.get("SINK_QUEUE_SIZE", "2"))
+SINK_DROP_POLICY = os.environ.get("SINK_DROP_POLICY", "drop_oldest")
+SINK_STATS_INTERVAL = 30 # seconds between sink stat log lines
+# Decoded frames live in a shared-memory ring (frame_ring_<stream>) that the
+# encoder, snapshot writer and inference read in place; other processes can
+# attach to it by name. A consumer more than FRAME_RING_SLOTS frames behind skips.
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", "8"))
+
+# Source geometry and fps are probed; these are per-consumer targets on top of
+# that ("WxH" sizes, empty or 0 = follow the source). Frames no consumer is due
+# for are grabbed but never retrieved (no BGR conversion, no ring write).
+SOURCE_FPS_DEFAULT = float(os.environ.get("SOURCE_FPS_DEFAULT", "30")) # if the stream reports none
+ENCODER_FPS = float(os.environ.get("ENCODER_FPS", "0"))
+ENCODER_SIZE = parse_size(os.environ.get("ENCODER_SIZE", ""), "ENCODER_SIZE")
+ANALYSIS_FPS = float(os.environ.get("ANALYSIS_FPS", "5")) # scene gate -> snapshots + inference
+SNAPSHOT_SIZE = parse_size(os.environ.get("SNAPSHOT_SIZE", ""), "SNAPSHOT_SIZE")
+INFERENCE_SIZE = parse_size(os.environ.get("INFERENCE_SIZE", ""), "INFERENCE_SIZE")
+
+# Annotate the UDP + processed outputs with the latest inference result. The
+# raw output stays clean, which costs a second encoder when raw is encoded too.
+OVERLAY_ENABLED = os.environ.get("OVERLAY_ENABLED", "1") == "1"
+OVERLAY_OPACITY = float(os.environ.get("OVERLAY_OPACITY", "0.6"))
+OVERLAY_MAX_AGE = float(os.environ.get("OVERLAY_MAX_AGE", "30")) # hide captions older than N seconds
+
+# VLM inference on sampled frames (point OLLAMA_API_URL at a stub to test)
+INFERENCE_ENABLED = os.environ.get("INFERENCE_ENABLED", "1") == "1"
+# INFERENCE_DETECT=1 asks the model for JSON boxes as well (DETECTION_PROMPT unless INFERENCE_PROMPT is set)
+INFERENCE_DETECT = os.environ.get("INFERENCE_DETECT", "0") == "1"
+INFERENCE_PROMPT = os.environ.get("INFERENCE_PROMPT") or (
+    DETECTION_PROMPT if INFERENCE_DETECT else "Describe what is happening in this image in one short sentence.")
+INFERENCE_CONCURRENCY = int(os.environ.get("INFERENCE_CONCURRENCY", "1"))
+INFERENCE_QUEUE_SIZE = int(os.environ.get("INFERENCE_QUEUE_SIZE", "2"))
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m") # never evict the model mid-stream
+
+# Scene-change gate in front of snapshots + inference
+SCENE_THRESHOLD = float(os.environ.get("SCENE_THRESHOLD", "0.02"))     # fraction of pixels that must change
+SCENE_PIXEL_DELTA = int(os.environ.get("SCENE_PIXEL_DELTA", "25"))     # grey levels for a pixel to count
+SCENE_MIN_INTERVAL = float(os.environ.get("SCENE_MIN_INTERVAL", "1.0")) # max one forward per N seconds
+SCENE_MAX_STALENESS = float(os.environ.get("SCENE_MAX_STALENESS", "60")) # forward anyway after N seconds
+
+# Perceptual-hash cache of VLM answers (survives restarts via CACHE_PATH)
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "256"))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "86400"))
+CACHE_MAX_DISTANCE = int(os.environ.get("CACHE_MAX_DISTANCE", "4")) # dhash bits that may differ
+CACHE_PATH = os.environ.get("CACHE_PATH", f"/data/images/{STREAM_NAME}/vlm_cache.json")
+
+# Snapshot retention on disk (0 disables a limit)
+SNAPSHOT_MAX_FILES = int(os.environ.get("SNAPSHOT_MAX_FILES", "10"))
+SNAPSHOT_MAX_BYTES = int(os.environ.get("SNAPSHOT_MAX_BYTES", "0"))
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", "0")) # seconds
+
+# Searchable history of every result (GET /results on the API), batched into the API's database
+RESULTS_ENABLED = os.environ.get("RESULTS_ENABLED", "1") == "1"
+RESULTS_DB_PATH = os.environ.get("RESULTS_DB_PATH", "/data/streams.db")
+RESULTS_BATCH_SIZE = int(os.environ.get("RESULTS_BATCH_SIZE", "50"))
+RESULTS_LINGER = float(os.environ.get("RESULTS_LINGER", "2")) # seconds a batch waits for more rows
+
+# Optical-flow tracker carrying detections between model calls (needs INFERENCE_DETECT)
+TRACKER_ENABLED = INFERENCE_DETECT and os.environ.get("TRACKER_ENABLED", "1") == "1"
+TRACKER_FPS = float(os.environ.get("TRACKER_FPS", "0"))                     # 0 = every frame
+TRACKER_WORK_WIDTH = int(os.environ.get("TRACKER_WORK_WIDTH", "320"))       # flow runs on a downscaled copy
+TRACKER_REFRESH_BELOW = float(os.environ.get("TRACKER_REFRESH_BELOW", "0.5")) # confidence that triggers an early call
+TRACKER_MIN_INTERVAL = float(os.environ.get("TRACKER_MIN_INTERVAL", "5"))   # scene-gate interval while tracking well
+TRACKER_HISTORY = int(os.environ.get("TRACKER_HISTORY", "64"))               # frames kept to re-anchor late detections on
+
 # --- LOGGING SETUP ---
 
 def get_logger():
@@ -64,6 +171,11 @@ def get_logger():
 # Initialize logger
 logger = get_logger()
 
+# Typed events for the API (snapshots, results, timings, errors) over a Unix socket
+events = EventPublisher(STREAM_NAME)
+logger.addHandler(EventLogHandler(events))
+EVENT_TIMINGS_INTERVAL = 2 # seconds between stage timing events
+
 
 def test_udp_network(url, timeout=5):
     try:
@@ -96,7 +208,7 @@ def setup_dirs():
     os.makedirs(IMAGE_DIR, exist_ok=True)
     
     # 2. Setup Stream Dirs
-    for d in [RAW_STREAM_DIR, PROC_STREAM_DIR]:
+    for d in [RAW_STREAM_DIR, PROC_STREAM_DIR, LLHLS_RAW_DIR, LLHLS_PROC_DIR]:
         if os.path.exists(d):
             shutil.rmtree(d)
         os.makedirs(d, exist_ok=True)
@@ -108,39 +220,28 @@ def setup_dirs():
 
     # 3. Preserve Logs...
 
-def save_and_clean_frame(frame, saved_count):
-    try:
-        # Re-scan to see current actual files
-        files = [os.path.join(IMAGE_DIR, f) for f in os.listdir(IMAGE_DIR) if f.endswith('.jpg')]
-        files.sort(key=os.path.getmtime)
-
-        # Strictly keep only 9 oldest so we can add the 10th
-        if len(files) >= 10:
-            for i in range(len(files) - 9):
-                os.remove(files[i])
-
-        # Save the new 10th image
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # Tip: Use a modulo on saved_count to keep names repeating 0-9 if you prefer
-        filename = f"frame_{saved_count % 10:01d}_{timestamp}.jpg" 
-        cv2.imwrite(os.path.join(IMAGE_DIR, filename), frame)
-        
-        # Flush stdout so the log reader sees it immediately
-        sys.stdout.flush() 
-        return True
-    except Exception as e:
-        print(f"Cleanup Error: {e}")
-        return False
-
 def run_analysis_loop():
     global state
     setup_dirs()
     # Standard LISTEN_URL for OpenCV inside Docker
-    LISTEN_URL = "udp://0.0.0.0:55080"
+    LISTEN_URL = INPUT_URL
+
+    ingest = IngestReceiver(INGEST_TRANSPORT, ingest_address(INGEST_TRANSPORT, INGEST_PORT),
+                            ("127.0.0.1", RELAY_PORT), INGEST_RCVBUF, (RELAY_PORT, DECODE_PORT), logger).start()
+
+    # Passthrough owns the relay feed and hands the decoder a loopback copy
+    remuxer = None
+    if "raw" in WORKER_OUTPUTS and RAW_HLS_MODE == "passthrough":
+        raw_segmenter = LLHLSSegmenter([LLHLS_RAW_DIR], LLHLS_PART_TARGET, logger=logger) if HLS_MODE == "llhls" else None
+        remuxer = PassthroughRemuxer(INPUT_URL, RAW_STREAM_DIR, DECODE_PUSH_URL, logger,
+                                     segmenter=raw_segmenter, segment_prefix=SEGMENT_PREFIX)
+        remuxer.start()
+        LISTEN_URL = DECODE_LISTEN_URL
     logger.info(f"run_analysis_loop starting. Listening on: {LISTEN_URL}")
     
-    # Increase probing to ensure H.264/MJPEG recognition
-    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "probesize;5000000|analyzeduration;5000000"
+    # Enough probing for H.264/MJPEG recognition; stream-cam repeats SPS/PPS on
+    # every keyframe (dump_extra), so a short probe is sufficient and opens faster
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "probesize;500000|analyzeduration;1000000"
     
     # --- 1. SETUP INPUT WITH RETRIES ---
     logger.info("Opening VideoCapture (with retries)...")
@@ -155,110 +256,315 @@ def run_analysis_loop():
         
         logger.warning(f"Attempt {attempt + 1}: Could not open stream. Waiting for FFmpeg...")
         if cap: cap.release()
-        time.sleep(3)
+        # Back off from 0.25s to 3s so a camera that is already streaming is picked up quickly
+        time.sleep(min(0.25 * 2 ** attempt, 3))
     
     if cap is None or not cap.isOpened():
         logger.error(f"FATAL: Could not open stream {LISTEN_URL} after {max_init_retries} attempts.")
+        if remuxer:
+            remuxer.stop()
+        ingest.stop()
         return
 
     # 2. SYNC WITH STREAM (Discard early broken frames)
     logger.info("Syncing with stream...")
     # Read up to 200 frames to find a valid keyframe from the webcam
+    frame = None
     for i in range(200): 
         ret, frame = cap.read()
         if ret and frame is not None:
-            logger.info(f"Stream sync successful on frame {i}!")
+            ttff_ms = round((time.time() - HANDOFF_TS) * 1000, 1)
+            logger.info(f"Stream sync successful on frame {i}! (first frame after {ttff_ms}ms)")
+            events.emit("first_frame", stream_id=STREAM_ID, ttff_ms=ttff_ms, shape=list(frame.shape))
             break
         if i % 20 == 0:
             logger.warning(f"Searching for valid frames... (attempt {i})")
         time.sleep(0.01)
-    
+
+    # Everything downstream is configured from what the stream actually is
+    width, height, source_fps = probe_stream(cap, frame, SOURCE_FPS_DEFAULT, logger)
+    encoder_fps = min(ENCODER_FPS, source_fps) if ENCODER_FPS > 0 else source_fps
 
 
-    # --- 2. SETUP HLS OUTPUT STREAMS ---
-    def start_hls_pipe(output_path, input_url=None):
-        cmd = [
-            'ffmpeg', '-y', '-loglevel', 'error',
-        ]
-        if input_url:
-            cmd += ['-i', input_url]
+    # --- 2. SETUP OUTPUT STREAMS (one encode per picture, tee fan-out) ---
+    # Outputs showing the same pixels share an encoder: "clean" (raw when it is
+    # encoded) and "processed" (UDP + processed HLS, annotated by the overlay).
+    # With the overlay off everything is the same picture again.
+    clean, annotated = [], []
+    if "raw" in WORKER_OUTPUTS and remuxer is None:
+        clean.append("raw")
+    annotated += [o for o in ("udp", "processed") if o in WORKER_OUTPUTS]
+    if not OVERLAY_ENABLED:
+        clean, annotated = clean + annotated, []
+    hls_dirs = {"raw": (RAW_STREAM_DIR, LLHLS_RAW_DIR), "processed": (PROC_STREAM_DIR, LLHLS_PROC_DIR)}
+
+    def start_encoder(kinds):
+        outputs = [udp_output(OUTPUT_URL)] if "udp" in kinds else []
+        dirs = [hls_dirs[k] for k in kinds if k in hls_dirs]
+        segmenter = None
+        if HLS_MODE == "llhls" and dirs:
+            # One fMP4 stream; the segmenter writes the same parts into each playlist dir
+            segmenter = LLHLSSegmenter([ll for _, ll in dirs], LLHLS_PART_TARGET, logger=logger)
+            outputs.append(fmp4_output(LLHLS_PART_TARGET))
         else:
-            cmd += [
-                '-f', 'rawvideo', '-vcodec', 'rawvideo',
-                '-pix_fmt', 'bgr24', '-s', '640x480', '-r', '30', '-i', '-'
-            ]
-            
-        cmd += [
-            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
-            '-g', '30', '-hls_time', '2', '-hls_list_size', '3', '-hls_flags', 'delete_segments',
-            '-f', 'hls', os.path.join(output_path, "live.m3u8")
-        ]
-        return subprocess.Popen(cmd, stdin=subprocess.PIPE if not input_url else None)
-
-    # Raw stream pipe
-    raw_hls = start_hls_pipe(RAW_STREAM_DIR)
-    # Processed stream from Pipe
-    proc_hls = start_hls_pipe(PROC_STREAM_DIR)
-    
-    # Keeping old UDP output for compatibility if still needed
-    udp_out_cmd = [
-        'ffmpeg', '-y', '-loglevel', 'error',
-        '-f', 'rawvideo', '-vcodec', 'rawvideo',
-        '-pix_fmt', 'bgr24', '-s', '640x480', '-r', '30', 
-        '-i', '-', 
-        '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
-        '-preset', 'ultrafast', '-tune', 'zerolatency',
-        '-g', '30', '-f', 'mpegts', OUTPUT_URL
-    ]
-    udp_out_pipe = subprocess.Popen(udp_out_cmd, stdin=subprocess.PIPE, bufsize=10**7)
+            outputs += [hls_output(d, segment_prefix=SEGMENT_PREFIX) for d, _ in dirs]
+        encoder = TeeEncoder(outputs, width, height, encoder_fps, out_size=ENCODER_SIZE)
+        encoder.start()
+        if segmenter:
+            segmenter.start(encoder.process.stdout)
+        return encoder
+
+    encoders = {}
+    if clean:
+        encoders["encoder"] = start_encoder(clean)
+    if annotated:
+        encoders["encoder-processed"] = start_encoder(annotated)
+    overlay = OverlayRenderer(width, height, OVERLAY_OPACITY, OVERLAY_MAX_AGE) if annotated else None
+    logger.info(f"Encoder outputs: clean={','.join(clean) or 'none'} annotated={','.join(annotated) or 'none'} @ {encoder_fps}fps")
     
-    frame_count = 0
-    saved_count = 0
+    # --- 3. CAPTURE STAGE + PER-SINK WRITERS ---
+    # The capture thread decodes straight into the shared frame ring; each
+    # consumer reads the ring on its own thread (RingReader or SinkWriter) so
+    # a slow pipe or disk can only drop its own frames instead of stalling decode.
+    ring = SharedFrameRing(frame_ring_name(STREAM_NAME), (height, width, 3), FRAME_RING_SLOTS, create=True)
+    logger.info(f"Frame ring {ring.name}: {ring.slots} x {width}x{height}")
 
-    logger.info(f"Analysis Loop started. Input: {INPUT_URL} | Output: {OUTPUT_URL}")
+    # One limiter per consumer; the capture thread only retrieves a frame when one is due
+    encoder_rates = {name: RateLimiter(encoder_fps if encoder_fps < source_fps else 0) for name in encoders}
+    analysis_rate = RateLimiter(ANALYSIS_FPS)
+    tracker_rate = RateLimiter(TRACKER_FPS)
+    consumer_rates = [analysis_rate] + list(encoder_rates.values()) + ([tracker_rate] if TRACKER_ENABLED else [])
+    capture_stats = {"grabbed": 0, "retrieved": 0, "grab_ms": 0.0, "retrieve_ms": 0.0}
+    grab_hist, retrieve_hist = Histogram(), Histogram()
 
-    try:
-        logger.info(f"Starting while loop")
+    def capture_loop():
         while state["running"]:
-            ret, frame = cap.read()
-            #logger.info(f"Frame received {ret}")
-            if not ret:
+            start = time.perf_counter()
+            if not cap.grab():
                 logger.warning("Empty frame received. Waiting...")
                 time.sleep(1)
                 continue
+            grabbed = time.perf_counter()
+            capture_stats["grabbed"] += 1
+            capture_stats["grab_ms"] += (grabbed - start) * 1000
+            grab_hist.observe(grabbed - start)
+            now = time.monotonic()
+            if not any(rate.due(now) for rate in consumer_rates):
+                continue
+            seq, view = ring.begin_write()
+            ret, frame = cap.retrieve(view)
+            retrieve_s = time.perf_counter() - grabbed
+            capture_stats["retrieve_ms"] += retrieve_s * 1000
+            retrieve_hist.observe(retrieve_s)
+            if not ret:
+                continue
+            if frame is not view:
+                # Decoder reallocated (resolution changed): fit it into the slot
+                if frame.shape == view.shape:
+                    view[...] = frame
+                else:
+                    cv2.resize(frame, (width, height), dst=view)
+            ring.commit(seq)
+            capture_stats["retrieved"] += 1
+
+    # Latest snapshot is published in shared memory for /latest-frame (no directory scans)
+    latest_slot = SharedJpegSlot(latest_frame_slot_path(STREAM_NAME), writer=True)
+
+    def on_snapshot_saved(path, saved_count):
+        logger.info(f"Saved AI Snapshot: frame {saved_count}")
+        sys.stdout.flush()
+
+    # Disk persistence runs on its own writer so slow I/O only delays the files
+    snapshot_store = SnapshotStore(
+        IMAGE_DIR, SNAPSHOT_MAX_FILES, SNAPSHOT_MAX_BYTES, SNAPSHOT_MAX_AGE,
+        policy=SINK_DROP_POLICY, logger=logger, on_saved=on_snapshot_saved
+    )
+
+    def write_snapshot(seq):
+        frame = ring.view(seq)
+        frame_ts = ring.timestamp(seq)
+        if frame is None:
+            return
+        ok, buffer = cv2.imencode('.jpg', fit_size(frame, SNAPSHOT_SIZE))
+        # Skip the snapshot if the decoder overwrote the slot mid-encode
+        if not ok or not ring.valid(seq):
+            return
+        slot_seq = latest_slot.publish(buffer)
+        events.emit("snapshot", seq=slot_seq // 2, bytes=len(buffer), frame_seq=seq, frame_ts=frame_ts)
+        snapshot_store.offer(buffer.tobytes())
+
+    sinks = {}
+    if "encoder" in encoders:
+        # Pipes the ring slot itself (no tobytes() copy)
+        sinks["encoder"] = RingReader("encoder", lambda frame: encoders["encoder"].write(frame.data), ring, logger,
+                                      rate=encoder_rates["encoder"]).start()
+    if overlay:
+        # The ring slot is shared, so annotate a private copy of it
+        annotated_frame = np.empty((height, width, 3), np.uint8)
+        sinks["encoder-processed"] = RingReader(
+            "encoder-processed",
+            lambda frame: encoders["encoder-processed"].write(overlay.apply(frame, annotated_frame).data),
+            ring, logger, rate=encoder_rates["encoder-processed"]
+        ).start()
+    sinks["snapshots"] = SinkWriter("snapshots", write_snapshot,
+                                    SINK_QUEUE_SIZE, SINK_DROP_POLICY, logger).start()
+    sinks["disk"] = snapshot_store.start()
+
+    tracker = None
+    if TRACKER_ENABLED:
+        tracker = BoxTracker(width, height, TRACKER_WORK_WIDTH, refresh_below=TRACKER_REFRESH_BELOW,
+                             history=TRACKER_HISTORY)
+
+        def track(seq, frame):
+            boxes = tracker.update(frame, seq)
+            state["detection_box"] = boxes
+            if overlay:
+                overlay.set_boxes(boxes)
+
+        sinks["tracker"] = RingReader("tracker", track, ring, logger, rate=tracker_rate, with_seq=True).start()
+
+    def on_inference_result(result):
+        source = "cache" if result.get("cached") else f"{result['latency_ms']}ms"
+        logger.info(f"AI Result (frame {result['frame_seq']}, {source}): {result['caption']}")
+        detections = result.get("detections")
+        if tracker is not None and detections is not None:
+            tracker.anchor(detections, result.get("frame_seq"))
+        if overlay:
+            # Tracked boxes are drawn live; otherwise pin the model's boxes to the result
+            boxes = [] if tracker is not None else [
+                (x * width, y * height, w * width, h * height, label) for x, y, w, h, label in detections or []
+            ]
+            overlay.update(result, boxes)
+        if "results" in sinks:
+            sinks["results"].offer(result)
+        events.emit("inference", **result)
+
+    if INFERENCE_ENABLED:
+        cache = None
+        if CACHE_ENABLED:
+            cache = ResultCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_MAX_DISTANCE, CACHE_PATH)
+            logger.info(f"VLM cache: {cache.load()} entries loaded from {CACHE_PATH}")
+        sinks["inference"] = InferenceClient(
+            API_URL, MODEL_ID, INFERENCE_PROMPT, logger,
+            concurrency=INFERENCE_CONCURRENCY,
+            queue_size=INFERENCE_QUEUE_SIZE,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            detect=INFERENCE_DETECT,
+            policy=SINK_DROP_POLICY,
+            on_result=on_inference_result,
+            cache=cache,
+            ring=ring,
+            size=INFERENCE_SIZE
+        ).start()
+        threading.Thread(target=sinks["inference"].warm, daemon=True).start()
+        if RESULTS_ENABLED:
+            # After inference in `sinks`, so results still queued are flushed on stop
+            sinks["results"] = ResultWriter(ResultStore(RESULTS_DB_PATH).init(), STREAM_NAME,
+                                            RESULTS_BATCH_SIZE, RESULTS_LINGER, logger=logger).start()
+
+    capture_thread = threading.Thread(target=capture_loop, name="capture", daemon=True)
+    capture_thread.start()
+
+    scene = SceneChangeDetector(SCENE_THRESHOLD, SCENE_PIXEL_DELTA, SCENE_MIN_INTERVAL, SCENE_MAX_STALENESS)
 
-            # --- 3. PUSH TO OUTPUT STREAMS ---
+    # Stream edits in the API push these here instead of restarting the worker
+    # (helpers/streams.py LIVE_SETTINGS); the API restarts us for anything else
+    live_settings = {
+        "ANALYSIS_FPS": lambda v: analysis_rate.set_fps(float(v)),
+        "SCENE_THRESHOLD": lambda v: setattr(scene, "threshold", float(v)),
+        "SCENE_PIXEL_DELTA": lambda v: setattr(scene, "pixel_delta", int(v)),
+        "SCENE_MIN_INTERVAL": lambda v: setattr(scene, "min_interval", float(v)),
+        "SCENE_MAX_STALENESS": lambda v: setattr(scene, "max_staleness", float(v)),
+    }
+    if overlay:
+        live_settings["OVERLAY_OPACITY"] = lambda v: setattr(overlay, "opacity", float(v))
+        live_settings["OVERLAY_MAX_AGE"] = lambda v: setattr(overlay, "max_age", float(v))
+    if "inference" in sinks:
+        live_settings["INFERENCE_PROMPT"] = lambda v: sinks["inference"].set_prompt(v or INFERENCE_PROMPT)
+    config_version = [0]
+
+    def apply_config(event):
+        # Several API processes may send; the row version orders them
+        version = int(event.get("version") or 0)
+        if version and version <= config_version[0]:
+            return
+        config_version[0] = version
+        applied = []
+        for key, value in (event.get("settings") or {}).items():
             try:
-                frame_bytes = frame.tobytes()
-                udp_out_pipe.stdin.write(frame_bytes)
-                raw_hls.stdin.write(frame_bytes)
-                proc_hls.stdin.write(frame_bytes)
-            except Exception as pipe_err:
-                logger.error(f"Pipe error: {pipe_err}")
-
-            # --- 4. SAMPLING FOR AI ---
-            if frame_count % 30 == 0:
-                
-                if save_and_clean_frame(frame, saved_count):
-                    logger.info(f"Saved AI Snapshot: frame {saved_count}")
-                    sys.stdout.flush()
-                    saved_count += 1
-
-            frame_count += 1
+                live_settings[key](value)
+                applied.append(key)
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Config v{version}: cannot apply {key}={value!r} live ({e!r})")
+        logger.info(f"Config v{version} applied: {', '.join(applied) or 'nothing'}")
+        events.emit("config", stream_id=STREAM_ID, version=version, applied=applied)
+
+    control = EventListener(apply_config, control_socket_path(STREAM_NAME)).bind()
+    threading.Thread(target=control.run, name="control", daemon=True).start()
+
+    cursor = ring.cursor()
+    last_stats = time.time()
+    last_timings = time.time()
+
+    logger.info(f"Analysis Loop started. Input: {INPUT_URL} | Output: {OUTPUT_URL}")
+    events.emit("started", input=INPUT_URL, outputs=WORKER_OUTPUTS)
+
+    try:
+        logger.info(f"Starting while loop")
+        while state["running"]:
+            # The encoder follows the ring on its own cursor; this loop only gates
+            seq, frame = cursor.next(timeout=1.0, latest=True)
+            if frame is None or not analysis_rate.take():
+                continue
+
+            # --- 4. SAMPLING FOR AI (only frames where the scene changed) ---
+            # A confident tracker keeps boxes fresh, so the model is asked less often;
+            # losing the boxes asks for a new detection right away
+            refresh = tracker is not None and tracker.take_refresh()
+            tracking = tracker is not None and tracker.active and tracker.confidence >= TRACKER_REFRESH_BELOW
+            forward, _ = scene.check(frame, force=refresh, min_interval=TRACKER_MIN_INTERVAL if tracking else None)
+            if forward:
+                sinks["snapshots"].offer(seq)
+                if "inference" in sinks:
+                    sinks["inference"].offer((seq, frame))
+
+            if time.time() - last_timings >= EVENT_TIMINGS_INTERVAL:
+                last_timings = time.time()
+                events.emit("timings", decoded=ring.head, grabbed=capture_stats["grabbed"], capture=dict(capture_stats),
+                            decode={"grab": grab_hist.snapshot(), "retrieve": retrieve_hist.snapshot()},
+                            gate=scene.stats(), ingest=ingest.stats(),
+                            sinks=[sink.stats() for sink in sinks.values()],
+                            tracker=tracker.stats() if tracker else None)
+
+            if time.time() - last_stats >= SINK_STATS_INTERVAL:
+                last_stats = time.time()
+                summary = " | ".join(
+                    f"{s['name']}: q={s['depth']} dropped={s['dropped']} avg={s['avg_write_ms']}ms"
+                    for s in (sink.stats() for sink in sinks.values())
+                )
+                gate = scene.stats()
+                received = ingest.stats()
+                logger.info(f"Sink stats (ingest {INGEST_TRANSPORT} {received['bytes_per_s'] / 1000:.0f}kB/s lost {received['lost_packets']}+{received['decoder_lost_packets']}/{received['packets']}, "
+                            f"decoded {ring.head}/{capture_stats['grabbed']}, forwarded {gate['forwarded']}/{gate['checked']}) | {summary}")
             
     except Exception as e:
         logger.error(f"Error in analysis loop: {e}")
     finally:
+        state["running"] = False
+        capture_thread.join(timeout=2)
+        for sink in sinks.values():
+            sink.stop()
         cap.release()
-        for p in [udp_out_pipe, proc_hls, raw_hls]:
-            if p.stdin:
-                p.stdin.close()
-            p.terminate()
-            try:
-                p.wait(timeout=0.5)
-            except subprocess.TimeoutExpired:
-                p.kill()
+        for encoder in encoders.values():
+            encoder.close()
+        control.close()
+        ring.close()
+        latest_slot.close()
+        if remuxer:
+            remuxer.stop()
+        ingest.stop()
         logger.info("Stream connections closed.")
+        events.emit("stopped")
 
 if __name__ == "__main__":
     # Signal handling for SIGTERM
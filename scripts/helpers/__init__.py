@@ -1,2 +1,44 @@
 from .camera import connect_camera, camera_src
-__all__ = ["connect_camera", "camera_src"]
\ No newline at end of file
+from .encoder import TeeEncoder, hls_output, udp_output
+from .remux import PassthroughRemuxer
+from .llhls import LLHLSSegmenter, LLHLS_BASE_DIR, fmp4_output, llhls_dir, playlist_has
+from .sinks import SinkWriter, DROP_OLDEST, DROP_NEWEST
+from .inference import InferenceClient, DETECTION_PROMPT, encode_jpeg_b64, parse_detections
+from .scene import SceneChangeDetector, dhash, hamming
+from .cache import ResultCache, prompt_key
+from .frameslot import JpegBroadcast, SharedJpegSlot, latest_frame_slot_path
+from .rates import RateLimiter, fit_size, parse_size, probe_stream
+from .overlay import OverlayRenderer
+from .tracker import BoxTracker
+from .metrics import (
+    Histogram, MetricsText, SharedMetrics, process_cmdline, process_role, process_sample, process_tree,
+)
+from .framering import SharedFrameRing, RingCursor, RingReader, frame_ring_name
+from .snapshots import SnapshotStore
+from .results import ResultStore, ResultWriter
+from .logtail import LogTailer
+from .events import EventPublisher, EventListener, EventLogHandler, control_socket_path
+from .supervisor import StreamSupervisor, WarmWorkerPool, WorkerHandle, WorkerRegistry
+from .streams import StreamRegistry, LIVE_SETTINGS, WORKER_SETTINGS, clean_settings, plan_update
+__all__ = [
+    "connect_camera", "camera_src",
+    "TeeEncoder", "hls_output", "udp_output",
+    "PassthroughRemuxer",
+    "LLHLSSegmenter", "LLHLS_BASE_DIR", "fmp4_output", "llhls_dir", "playlist_has",
+    "SinkWriter", "DROP_OLDEST", "DROP_NEWEST",
+    "InferenceClient", "DETECTION_PROMPT", "encode_jpeg_b64", "parse_detections",
+    "SceneChangeDetector", "dhash", "hamming",
+    "ResultCache", "prompt_key",
+    "JpegBroadcast", "SharedJpegSlot", "latest_frame_slot_path",
+    "RateLimiter", "fit_size", "parse_size", "probe_stream",
+    "OverlayRenderer",
+    "BoxTracker",
+    "Histogram", "MetricsText", "SharedMetrics", "process_cmdline", "process_role", "process_sample", "process_tree",
+    "SharedFrameRing", "RingCursor", "RingReader", "frame_ring_name",
+    "SnapshotStore",
+    "ResultStore", "ResultWriter",
+    "LogTailer",
+    "EventPublisher", "EventListener", "EventLogHandler", "control_socket_path",
+    "StreamSupervisor", "WarmWorkerPool", "WorkerHandle", "WorkerRegistry",
+    "StreamRegistry", "LIVE_SETTINGS", "WORKER_SETTINGS", "clean_settings", "plan_update",
+]
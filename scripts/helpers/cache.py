@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .scene import hamming
+
+
+def prompt_key(model_id, prompt):
+    """Short stable key for a (model, prompt) pair."""
+    return hashlib.sha1(f"{model_id}\n{prompt}".encode()).hexdigest()[:16]
+
+
+class ResultCache:
+    """LRU + TTL cache of VLM responses keyed by perceptual hash and prompt.
+
+    A lookup matches any entry for the same prompt whose hash is within
+    `max_distance` bits, so a camera returning to a known state (door
+    closed, lights off...) reuses the earlier caption. Entries can be
+    persisted to `path` as JSON and are reloaded on the next start.
+    """
+
+    def __init__(self, max_entries=256, ttl=86400, max_distance=4, path=None, save_every=20):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.path = path
+        self.save_every = save_every
+        self._entries = OrderedDict() # (prompt_key, phash) -> (created, value)
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, phash, key):
+        now = time.time()
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for entry_key, (created, _) in list(self._entries.items()):
+                if now - created > self.ttl:
+                    del self._entries[entry_key]
+                    continue
+                if entry_key[0] != key:
+                    continue
+                distance = hamming(entry_key[1], phash)
+                if distance < best_distance:
+                    best, best_distance = entry_key, distance
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][1]
+
+    def put(self, phash, key, value):
+        with self._lock:
+            self._entries[(key, phash)] = (time.time(), value)
+            self._entries.move_to_end((key, phash))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty += 1
+            should_save = self.path and self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r') as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        now = time.time()
+        with self._lock:
+            for key, phash, created, value in rows:
+                if now - created <= self.ttl:
+                    self._entries[(key, int(phash))] = (created, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return len(self._entries)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            rows = [[key, str(phash), created, value] for (key, phash), (created, value) in self._entries.items()]
+            self._dirty = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, self.path)
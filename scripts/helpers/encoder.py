@@ -0,0 +1,87 @@
+import os
+import subprocess
+
+# Tee slave options shared by every output. onfail=ignore keeps the other
+# outputs alive when e.g. nobody is listening on the UDP side.
+TEE_DEFAULTS = "onfail=ignore"
+
+
+def udp_output(url):
+    """Tee slave spec for an MPEG-TS push over UDP."""
+    return f"[f=mpegts:{TEE_DEFAULTS}]{url}"
+
+
+def hls_output(stream_dir, hls_time=2, list_size=3, segment_prefix="live"):
+    """Tee slave spec for an HLS playlist written into stream_dir.
+
+    Give each run its own segment_prefix so segment names are never reused
+    (the API serves them as immutable).
+    """
+    playlist = os.path.join(stream_dir, "live.m3u8")
+    segments = os.path.join(stream_dir, f"{segment_prefix}%d.ts")
+    return (
+        f"[f=hls:hls_time={hls_time}:hls_list_size={list_size}"
+        f":hls_flags=delete_segments:hls_segment_filename={segments}:{TEE_DEFAULTS}]{playlist}"
+    )
+
+
+class TeeEncoder:
+    """One libx264 encode of a picture, fanned out to N muxers via ffmpeg's tee.
+
+    Every output that shows the same pixels (UDP, raw HLS, processed HLS...)
+    should hang off a single TeeEncoder instead of running its own encoder.
+    width/height/fps must describe the frames actually written (the probed
+    stream, after decimation); `out_size` (w, h) scales inside ffmpeg.
+    """
+
+    def __init__(self, outputs, width=640, height=480, fps=30, gop=None, out_size=None):
+        self.outputs = list(outputs)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.gop = gop or max(1, round(fps))  # one keyframe per second by default
+        self.out_size = out_size
+        self.process = None
+
+    def build_cmd(self):
+        scale = ['-vf', f'scale={self.out_size[0]}:{self.out_size[1]}'] if self.out_size else []
+        return [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-vcodec', 'rawvideo',
+            '-pix_fmt', 'bgr24', '-s', f'{self.width}x{self.height}', '-r', str(self.fps),
+            '-i', '-',
+            '-map', '0:v',
+            *scale,
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+            '-preset', 'ultrafast', '-tune', 'zerolatency',
+            '-g', str(self.gop),
+            '-f', 'tee', '|'.join(self.outputs)
+        ]
+
+    def start(self):
+        if not self.outputs:
+            return None
+        # An fMP4 slave on pipe:1 (LL-HLS) is read from process.stdout by its segmenter
+        stdout = subprocess.PIPE if any(o.endswith("pipe:1") for o in self.outputs) else None
+        self.process = subprocess.Popen(self.build_cmd(), stdin=subprocess.PIPE, stdout=stdout, bufsize=10**7)
+        return self.process
+
+    def write(self, frame_bytes):
+        if self.process and self.process.stdin:
+            self.process.stdin.write(frame_bytes)
+
+    def close(self):
+        p = self.process
+        if p is None:
+            return
+        if p.stdin:
+            try:
+                p.stdin.close()
+            except Exception:
+                pass
+        p.terminate()
+        try:
+            p.wait(timeout=0.5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+        self.process = None
@@ -0,0 +1,196 @@
+import logging
+import os
+import socket
+import struct
+import time
+
+EVENT_SOCKET = os.environ.get("EVENT_SOCKET", "/tmp/worker_events.sock")
+# API -> worker direction: each worker listens for "config" events on its own socket
+CONTROL_SOCKET_DIR = os.environ.get("CONTROL_SOCKET_DIR", "/tmp")
+
+# Wire format: header (version, type code, timestamp) followed by the payload
+# as a tagged binary map (see encode_value). One event per datagram.
+VERSION = 1
+HEADER = struct.Struct("<BBd")
+# Append only: the index is the on-wire type code
+EVENT_TYPES = ["started", "stopped", "snapshot", "inference", "timings", "error", "first_frame", "config"]
+TYPE_CODES = {name: i for i, name in enumerate(EVENT_TYPES)}
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+
+def control_socket_path(stream_name):
+    return os.path.join(CONTROL_SOCKET_DIR, f"worker_control_{stream_name}.sock")
+
+
+def encode_value(value, out):
+    if value is None:
+        out.append(b"N")
+    elif value is True:
+        out.append(b"T")
+    elif value is False:
+        out.append(b"F")
+    elif isinstance(value, int):
+        out.append(b"i" + _I64.pack(value))
+    elif isinstance(value, float):
+        out.append(b"d" + _F64.pack(value))
+    elif isinstance(value, str):
+        data = value.encode()
+        out.append(b"s" + _U32.pack(len(data)) + data)
+    elif isinstance(value, (list, tuple)):
+        out.append(b"l" + _U32.pack(len(value)))
+        for item in value:
+            encode_value(item, out)
+    elif isinstance(value, dict):
+        out.append(b"m" + _U32.pack(len(value)))
+        for key, item in value.items():
+            encode_value(str(key), out)
+            encode_value(item, out)
+    else:
+        encode_value(str(value), out)
+
+
+def decode_value(buf, offset=0):
+    """Returns (value, next_offset)."""
+    tag = buf[offset:offset + 1]
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag == b"T":
+        return True, offset
+    if tag == b"F":
+        return False, offset
+    if tag == b"i":
+        return _I64.unpack_from(buf, offset)[0], offset + _I64.size
+    if tag == b"d":
+        return _F64.unpack_from(buf, offset)[0], offset + _F64.size
+    if tag in (b"s", b"l", b"m"):
+        (length,) = _U32.unpack_from(buf, offset)
+        offset += _U32.size
+        if tag == b"s":
+            return bytes(buf[offset:offset + length]).decode(), offset + length
+        if tag == b"l":
+            items = []
+            for _ in range(length):
+                item, offset = decode_value(buf, offset)
+                items.append(item)
+            return items, offset
+        mapping = {}
+        for _ in range(length):
+            key, offset = decode_value(buf, offset)
+            mapping[key], offset = decode_value(buf, offset)
+        return mapping, offset
+    raise ValueError(f"Unknown tag {tag!r} at offset {offset - 1}")
+
+
+def encode_event(event_type, payload, timestamp=None):
+    out = [HEADER.pack(VERSION, TYPE_CODES[event_type], timestamp or time.time())]
+    encode_value(payload, out)
+    return b"".join(out)
+
+
+def decode_event(data):
+    version, code, timestamp = HEADER.unpack_from(data, 0)
+    if version != VERSION:
+        raise ValueError(f"Unsupported event version {version}")
+    payload, _ = decode_value(data, HEADER.size)
+    event = dict(payload) if isinstance(payload, dict) else {"data": payload}
+    event["type"] = EVENT_TYPES[code]
+    event["timestamp"] = timestamp
+    return event
+
+
+class EventPublisher:
+    """Fire-and-forget sender of typed worker events over a Unix datagram socket.
+
+    Sends never block: if the API is not listening (or its buffer is full)
+    the event is counted in `dropped` and discarded.
+    """
+
+    def __init__(self, stream_name, path=EVENT_SOCKET):
+        self.stream_name = stream_name
+        self.path = path
+        self.sent = 0
+        self.dropped = 0
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def emit(self, event_type, **fields):
+        fields["stream"] = self.stream_name
+        try:
+            self.sock.sendto(encode_event(event_type, fields), self.path)
+            self.sent += 1
+            return True
+        except OSError:
+            self.dropped += 1
+            return False
+
+    def close(self):
+        self.sock.close()
+
+
+class EventLogHandler(logging.Handler):
+    """Forwards ERROR (and worse) log records as 'error' events."""
+
+    def __init__(self, publisher, level=logging.ERROR):
+        super().__init__(level)
+        self.publisher = publisher
+
+    def emit(self, record):
+        try:
+            self.publisher.emit("error", message=record.getMessage(), logger=record.name)
+        except Exception:
+            pass
+
+
+class EventListener:
+    """Receives worker events on a Unix datagram socket and hands them to `handler`.
+
+    A handler that raises (a locked database, a message-queue hiccup) costs
+    that one event, counted in `errors`; the listener keeps going.
+    """
+
+    def __init__(self, handler, path=EVENT_SOCKET):
+        self.handler = handler
+        self.path = path
+        self.received = 0
+        self.errors = 0
+        self.sock = None
+
+    def bind(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def run(self):
+        if self.sock is None:
+            self.bind()
+        sock = self.sock
+        while True:
+            try:
+                data = sock.recv(256 * 1024)
+            except OSError:
+                return  # closed
+            try:
+                event = decode_event(data)
+            except (ValueError, IndexError, struct.error):
+                self.errors += 1
+                continue
+            self.received += 1
+            try:
+                self.handler(event)
+            except Exception:
+                self.errors += 1
+                logging.getLogger(__name__).exception(f"Event handler failed on {event.get('type')!r}")
@@ -0,0 +1,278 @@
+import errno
+import os
+import re
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .frameslot import SHM_DIR
+from .metrics import Histogram
+
+MAGIC = b"FRNG"
+# magic, slot count, height, width, channels, head seq (last committed frame)
+HEADER = struct.Struct("<4sIIIIQ")
+HEADER_SIZE = 64
+# per slot: seq (0 while the slot is being written), capture timestamp
+SLOT_HEADER = struct.Struct("<Qd")
+SLOT_HEADER_SIZE = 64  # keeps every frame 64-byte aligned
+# Left free in SHM_DIR after the ring for the stream's JPEG slot and LL-HLS parts
+SHM_RESERVE = int(os.environ.get("SHM_RESERVE", str(32 * 1024 * 1024)))
+
+
+def frame_ring_name(stream_name):
+    return "frame_ring_" + re.sub(r"[^A-Za-z0-9_.-]", "_", stream_name)
+
+
+def shm_free(path=SHM_DIR):
+    """Bytes still available on the shared-memory filesystem."""
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+class SharedFrameRing:
+    """Fixed-size frame slots in POSIX shared memory, written by the capture thread.
+
+    The decoder writes straight into the next slot (cap.read(view)) and
+    commits it under a sequence number; consumers get numpy views of the
+    slot instead of copies, in this process or any other that attaches by
+    name. A slot is reused `slots` frames later, so a consumer that holds a
+    view longer than that checks `valid(seq)` afterwards and discards the
+    result if the frame was overwritten underneath it.
+    """
+
+    def __init__(self, name, shape=None, slots=8, create=False):
+        self.name = name
+        self.owner = create
+        if create:
+            height, width, channels = shape
+            frame_size = height * width * channels
+            size = HEADER_SIZE + slots * (SLOT_HEADER_SIZE + frame_size)
+            self._unlink_stale(name)
+            # tmpfs pages are only allocated on write: a ring that does not fit
+            # would die of SIGBUS on some later frame instead of failing here
+            free = shm_free()
+            if size + SHM_RESERVE > free:
+                raise OSError(errno.ENOSPC, f"{name} needs {size >> 20} MiB (+{SHM_RESERVE >> 20} MiB reserve) but "
+                              f"{SHM_DIR} has {free >> 20} MiB free; raise shm_size or lower FRAME_RING_SLOTS")
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            HEADER.pack_into(self.shm.buf, 0, MAGIC, slots, height, width, channels, 0)
+            for i in range(slots):
+                SLOT_HEADER.pack_into(self.shm.buf, self._slot_offset(i, frame_size), 0, 0.0)
+        else:
+            self.shm = self._attach(name)
+        magic, slots, height, width, channels, _ = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{name} is not a frame ring")
+        self.slots = slots
+        self.shape = (height, width, channels)
+        self.frame_size = height * width * channels
+        self._views = [
+            np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                       offset=self._slot_offset(i, self.frame_size) + SLOT_HEADER_SIZE)
+            for i in range(slots)
+        ]
+        # Wakes readers in this process; other processes poll `head`
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _slot_offset(index, frame_size):
+        return HEADER_SIZE + index * (SLOT_HEADER_SIZE + frame_size)
+
+    @staticmethod
+    def _attach(name):
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before 3.13 every attach registers with the resource tracker,
+            # which would unlink the ring when this reader exits
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+            return shm
+
+    @staticmethod
+    def _unlink_stale(name):
+        """Removes a ring left behind by a worker that died without cleanup."""
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        stale.close()
+        stale.unlink()
+
+    @property
+    def head(self):
+        return HEADER.unpack_from(self.shm.buf, 0)[5]
+
+    def _slot_seq(self, seq):
+        offset = self._slot_offset(seq % self.slots, self.frame_size)
+        return SLOT_HEADER.unpack_from(self.shm.buf, offset)[0]
+
+    def begin_write(self):
+        """Returns (seq, view) of the next slot; the frame is published by commit(seq)."""
+        seq = self.head + 1
+        offset = self._slot_offset(seq % self.slots, self.frame_size)
+        SLOT_HEADER.pack_into(self.shm.buf, offset, 0, 0.0)  # readers now see it as invalid
+        return seq, self._views[seq % self.slots]
+
+    def commit(self, seq, timestamp=None):
+        offset = self._slot_offset(seq % self.slots, self.frame_size)
+        SLOT_HEADER.pack_into(self.shm.buf, offset, seq, timestamp or time.time())
+        struct.pack_into("<Q", self.shm.buf, HEADER.size - 8, seq)
+        with self._cond:
+            self._cond.notify_all()
+
+    def timestamp(self, seq):
+        """Capture time of frame `seq` (0.0 once overwritten)."""
+        offset = self._slot_offset(seq % self.slots, self.frame_size)
+        slot_seq, ts = SLOT_HEADER.unpack_from(self.shm.buf, offset)
+        return ts if slot_seq == seq else 0.0
+
+    def valid(self, seq):
+        return seq > 0 and self._slot_seq(seq) == seq
+
+    def view(self, seq):
+        """Zero-copy view of frame `seq`, or None if it was already overwritten."""
+        return self._views[seq % self.slots] if self.valid(seq) else None
+
+    def wait(self, last_seq, timeout=1.0, poll_interval=0.005):
+        """Blocks until head > last_seq; returns the head (last_seq on timeout)."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                head = self.head
+                remaining = deadline - time.time()
+                if head > last_seq or remaining <= 0:
+                    return head
+                self._cond.wait(min(remaining, poll_interval))
+
+    def cursor(self, from_start=False):
+        return RingCursor(self, 0 if from_start else self.head)
+
+    def close(self):
+        self._views = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # A consumer still holds a view; the mapping goes away with the process
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class RingCursor:
+    """One consumer's read position in a SharedFrameRing.
+
+    next() hands out each committed frame once; frames the consumer was too
+    slow for (already overwritten) are skipped and counted.
+    """
+
+    def __init__(self, ring, seq=0):
+        self.ring = ring
+        self.seq = seq
+        self.read = 0
+        self.skipped = 0
+
+    def next(self, timeout=1.0, latest=False):
+        """Returns (seq, view), or (seq, None) on timeout. latest=True jumps to the newest frame."""
+        head = self.ring.wait(self.seq, timeout)
+        if head <= self.seq:
+            return self.seq, None
+        # The oldest slot is the one the writer is refilling, so stop one short of it
+        target = head if latest else max(self.seq + 1, head - self.ring.slots + 2)
+        frame = self.ring.view(target)
+        if frame is None:
+            # Lapped between wait and view: take whatever is newest now
+            target = self.ring.head
+            frame = self.ring.view(target)
+        self.skipped += max(0, target - self.seq - 1)
+        self.seq = target
+        if frame is not None:
+            self.read += 1
+        return target, frame
+
+    def stats(self):
+        return {"seq": self.seq, "read": self.read, "skipped": self.skipped, "lag": self.ring.head - self.seq}
+
+
+class RingReader:
+    """Runs one consumer (e.g. the encoder pipe) on its own cursor into a SharedFrameRing.
+
+    Unlike a SinkWriter there is no queue: the handler gets a view of every
+    committed frame in order, and frames it was too slow for are skipped
+    and reported as `dropped`. `stats()` has the same shape as SinkWriter's.
+    An optional RateLimiter (`rate`) decimates to the consumer's own fps;
+    frames passed over that way are `decimated`, not dropped. With
+    `with_seq` the handler is called as handler(seq, frame).
+    """
+
+    def __init__(self, name, handler, ring, logger=None, rate=None, with_seq=False):
+        self.name = name
+        self.handler = handler
+        self.with_seq = with_seq
+        self.ring = ring
+        self.logger = logger
+        self.rate = rate
+        self.cursor = ring.cursor()
+        self.decimated = 0
+        self.written = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.latency = Histogram()
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=f"ring-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def stats(self):
+        cursor = self.cursor.stats()
+        return {
+            "name": self.name,
+            "policy": "ring",
+            "depth": cursor["lag"],
+            "submitted": cursor["read"] + cursor["skipped"],
+            "written": self.written,
+            "dropped": cursor["skipped"],
+            "errors": self.errors,
+            "decimated": self.decimated,
+            "avg_write_ms": round(self.busy_time / self.written * 1000, 2) if self.written else 0.0,
+            "latency_hist": self.latency.snapshot(),
+        }
+
+    def _run(self):
+        while self.running:
+            seq, frame = self.cursor.next(timeout=0.2)
+            if frame is None:
+                continue
+            if self.rate is not None and not self.rate.take():
+                self.decimated += 1
+                continue
+            start = time.perf_counter()
+            try:
+                if self.with_seq:
+                    self.handler(seq, frame)
+                else:
+                    self.handler(frame)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                if self.logger:
+                    self.logger.error(f"Ring reader '{self.name}' error: {e}")
+            elapsed = time.perf_counter() - start
+            self.busy_time += elapsed
+            self.latency.observe(elapsed)
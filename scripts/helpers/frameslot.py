@@ -0,0 +1,145 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+SHM_DIR = os.environ.get("SHM_DIR", "/dev/shm")
+
+# magic, generation, seq, timestamp, length
+HEADER = struct.Struct("<4sIQdI")
+HEADER_SIZE = 64
+MAGIC = b"SVLF"
+DEFAULT_CAPACITY = 4 * 1024 * 1024
+
+
+def latest_frame_slot_path(stream_name):
+    return os.path.join(SHM_DIR, f"latest_frame_{stream_name}.slot")
+
+
+class SharedJpegSlot:
+    """Single JPEG published through a memory-mapped file (tmpfs by default).
+
+    The worker overwrites the slot with each snapshot; the API reads it
+    without touching the image directory. Writes follow a seqlock: the
+    sequence number is odd while the payload is being replaced, so readers
+    retry instead of returning a torn image. `generation` changes with every
+    writer start so ETags never collide across worker restarts.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, writer=False):
+        self.path = path
+        self.writer = writer
+        self.capacity = capacity
+        self.generation = int(time.time()) & 0xFFFFFFFF if writer else 0
+        self.seq = 0
+        self._mm = None
+        if writer:
+            self._open_writer()
+
+    def _open_writer(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + self.capacity)
+            self._mm = mmap.mmap(fd, HEADER_SIZE + self.capacity)
+        finally:
+            os.close(fd)
+        self._mm[:HEADER.size] = HEADER.pack(MAGIC, self.generation, 0, 0.0, 0)
+
+    def _open_reader(self):
+        if self._mm is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size <= HEADER_SIZE:
+                return False
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+            self.capacity = size - HEADER_SIZE
+        finally:
+            os.close(fd)
+        return True
+
+    def publish(self, jpeg_bytes):
+        """Replaces the slot contents; returns the new sequence number (0 if too large)."""
+        data = bytes(jpeg_bytes)
+        if len(data) > self.capacity:
+            return 0
+        mm = self._mm
+        next_seq = self.seq + 2
+        mm[:HEADER.size] = HEADER.pack(MAGIC, self.generation, self.seq + 1, time.time(), 0)
+        mm[HEADER_SIZE:HEADER_SIZE + len(data)] = data
+        mm[:HEADER.size] = HEADER.pack(MAGIC, self.generation, next_seq, time.time(), len(data))
+        self.seq = next_seq
+        return next_seq
+
+    def header(self):
+        """Returns (generation, seq, timestamp, length) or None if nothing is published."""
+        if not self._open_reader():
+            return None
+        magic, generation, seq, ts, length = HEADER.unpack(self._mm[:HEADER.size])
+        if magic != MAGIC or seq == 0:
+            return None
+        return generation, seq, ts, length
+
+    def etag(self):
+        """ETag of the published image, without copying it (None while empty or mid-write)."""
+        head = self.header()
+        if head is None or head[1] % 2 or head[3] == 0:
+            return None
+        return f'"{head[0]:x}-{head[1] // 2}"'
+
+    def read(self, retries=5):
+        """Returns (etag, timestamp, jpeg_bytes) or None."""
+        if not self._open_reader():
+            return None
+        for _ in range(retries):
+            head = self.header()
+            if head is None:
+                return None
+            generation, seq, ts, length = head
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            if length == 0:
+                return None
+            data = self._mm[HEADER_SIZE:HEADER_SIZE + length]
+            if HEADER.unpack(self._mm[:HEADER.size])[2] == seq:
+                return f'"{generation:x}-{seq // 2}"', ts, data
+        return None
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+class JpegBroadcast:
+    """In-process fan-out of one stream's latest JPEG to every MJPEG response.
+
+    The API's hub task put()s each new snapshot read from a SharedJpegSlot
+    once; responses wait for a sequence number newer than the one they last
+    sent, so a slow viewer skips frames instead of queuing them.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self.seq = 0
+
+    def put(self, jpeg):
+        with self._cond:
+            self._jpeg = jpeg
+            self.seq += 1
+            self._cond.notify_all()
+
+    def wait(self, last_seq, timeout=1.0):
+        """Returns (seq, jpeg) once seq > last_seq, or (last_seq, None) on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq > last_seq, timeout=timeout):
+                return last_seq, None
+            return self.seq, self._jpeg
@@ -0,0 +1,249 @@
+import base64
+import json
+import re
+import threading
+import time
+from collections import deque
+
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import prompt_key
+from .rates import fit_size
+from .scene import dhash
+from .sinks import SinkWriter, DROP_OLDEST
+
+
+def encode_jpeg_b64(frame, quality=80, size=None):
+    """JPEG-encodes a BGR frame (resized to `size` if given) and returns it base64'd for the Ollama API."""
+    frame = fit_size(frame, size)
+    ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return base64.b64encode(buffer).decode('ascii')
+
+
+DETECTION_PROMPT = (
+    'List the main objects as JSON, [{"label": "person", "box": [x1, y1, x2, y2]}] '
+    'with coordinates from 0 to 1, then describe what is happening in one short sentence.'
+)
+_JSON_LIST = re.compile(r"\[\s*\{.*?\}\s*\]", re.S)
+_FENCE = re.compile(r"```\w*")
+
+
+def parse_detections(content):
+    """Splits a model answer into (caption, detections).
+
+    Detections are (x, y, w, h, label) normalized to 0..1 and come from the
+    first JSON list of {"label", "box": [x1, y1, x2, y2]} objects in the text
+    (0..1000 coordinates are rescaled); the rest of the text is the caption.
+    Anything unparsable is left in the caption with no detections.
+    """
+    match = _JSON_LIST.search(content)
+    if not match:
+        return content, []
+    try:
+        items = json.loads(match.group(0))
+    except ValueError:
+        return content, []
+    detections = []
+    for item in items:
+        box = item.get("box") if isinstance(item, dict) else None
+        if not isinstance(box, list) or len(box) != 4:
+            continue
+        try:
+            x1, y1, x2, y2 = (float(v) for v in box)
+        except (TypeError, ValueError):
+            continue
+        if max(x1, y1, x2, y2) > 1.0:
+            x1, y1, x2, y2 = (v / 1000.0 for v in (x1, y1, x2, y2))
+        x1, x2 = sorted((min(max(x1, 0.0), 1.0), min(max(x2, 0.0), 1.0)))
+        y1, y2 = sorted((min(max(y1, 0.0), 1.0), min(max(y2, 0.0), 1.0)))
+        if x2 - x1 > 0 and y2 - y1 > 0:
+            detections.append((x1, y1, x2 - x1, y2 - y1, str(item.get("label", ""))))
+    rest = _FENCE.sub(" ", content[:match.start()] + " " + content[match.end():])
+    caption = " ".join(rest.split()).strip(" :") or content
+    return caption, detections
+
+
+class InferenceClient:
+    """Sends sampled frames to an Ollama-compatible /api/chat endpoint.
+
+    Frames go through a bounded SinkWriter queue drained by `concurrency`
+    threads that share one pooled requests.Session, so the capture loop never
+    waits on the model. `keep_alive` is sent with every request (and with the
+    warm-up call) so Ollama keeps the model resident between frames.
+    Results are passed to `on_result` as a dict. With a ResultCache, frames
+    whose perceptual hash matches an earlier one reuse its caption without a
+    model call.
+    With a SharedFrameRing (`ring`), queued frames are ring views: a frame
+    that was overwritten while it waited is replaced by the newest one, and
+    an encode the decoder tore underneath is discarded (`lapped`).
+    `size` (w, h) is the resolution the model gets, independent of the stream.
+    With `detect`, answers are split by parse_detections and results carry
+    `detections` (use a prompt that asks for them, e.g. DETECTION_PROMPT).
+    """
+
+    def __init__(self, api_url, model_id, prompt, logger, concurrency=1, queue_size=2,
+                 keep_alive="30m", timeout=60, jpeg_quality=80, policy=DROP_OLDEST,
+                 on_result=None, stats_window=100, cache=None, ring=None, size=None, detect=False):
+        self.api_url = api_url
+        self.model_id = model_id
+        self.prompt = prompt
+        self.logger = logger
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+        self.size = size
+        self.detect = detect
+        self.on_result = on_result
+        self.cache = cache
+        self.ring = ring
+        self.prompt_key = prompt_key(model_id, prompt)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(concurrency, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.writer = SinkWriter("inference", self._infer, queue_size, policy, logger, workers=concurrency)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=stats_window)
+        self._completions = deque(maxlen=stats_window)
+        self.completed = 0
+        self.lapped = 0
+        self.last_result = None
+
+    @property
+    def name(self):
+        return self.writer.name
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def stop(self):
+        self.writer.stop()
+        self.session.close()
+        if self.cache is not None:
+            self.cache.save()
+
+    def warm(self):
+        """Loads the model ahead of the first frame (an empty chat just loads it)."""
+        try:
+            payload = {"model": self.model_id, "messages": [], "keep_alive": self.keep_alive}
+            self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            self.logger.info(f"Inference model warmed: {self.model_id} (keep_alive={self.keep_alive})")
+            return True
+        except requests.RequestException as e:
+            self.logger.warning(f"Inference warm-up failed: {e}")
+            return False
+
+    def set_prompt(self, prompt):
+        """Switches the prompt for the next requests; cached answers are keyed by prompt."""
+        self.prompt = prompt
+        self.prompt_key = prompt_key(self.model_id, prompt)
+
+    def offer(self, item):
+        """Queues (frame_seq, frame) for inference without blocking."""
+        return self.writer.offer(item)
+
+    def build_payload(self, image_b64):
+        return {
+            "model": self.model_id,
+            "messages": [{"role": "user", "content": self.prompt, "images": [image_b64]}],
+            "stream": False,
+            "keep_alive": self.keep_alive,
+        }
+
+    def _resolve(self, frame_seq, frame):
+        """Swaps a ring view that was overwritten in the queue for the newest frame."""
+        if self.ring is None or self.ring.valid(frame_seq):
+            return frame_seq, frame
+        frame_seq = self.ring.head
+        return frame_seq, self.ring.view(frame_seq)
+
+    def _torn(self, frame_seq):
+        if self.ring is None or self.ring.valid(frame_seq):
+            return False
+        with self._lock:
+            self.lapped += 1
+        return True
+
+    def _finish(self, result, content):
+        """Fills caption (and detections) from the raw model answer."""
+        if self.detect:
+            result["caption"], result["detections"] = parse_detections(content)
+        else:
+            result["caption"] = content
+        return result
+
+    def _infer(self, item):
+        frame_seq, frame = self._resolve(*item)
+        if frame is None:
+            return None
+        start = time.perf_counter()
+        phash = None
+        if self.cache is not None:
+            phash = dhash(frame)
+            if self._torn(frame_seq):
+                return None
+            content = self.cache.get(phash, self.prompt_key)
+            if content is not None:
+                result = self._finish({
+                    "frame_seq": frame_seq,
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "cached": True,
+                    "timestamp": time.time(),
+                }, content)
+                with self._lock:
+                    self.last_result = result
+                if self.on_result:
+                    self.on_result(result)
+                return result
+
+        image_b64 = encode_jpeg_b64(frame, self.jpeg_quality, self.size)
+        encode_ms = (time.perf_counter() - start) * 1000
+        if self._torn(frame_seq):
+            return None
+
+        resp = self.session.post(self.api_url, json=self.build_payload(image_b64), timeout=self.timeout)
+        resp.raise_for_status()
+        content = resp.json().get("message", {}).get("content", "").strip()
+        latency = time.perf_counter() - start
+
+        result = self._finish({
+            "frame_seq": frame_seq,
+            "latency_ms": round(latency * 1000, 1),
+            "encode_ms": round(encode_ms, 1),
+            "cached": False,
+            "timestamp": time.time(),
+        }, content)
+        if self.cache is not None and content:
+            self.cache.put(phash, self.prompt_key, content)
+        with self._lock:
+            self._latencies.append(latency)
+            self._completions.append(time.time())
+            self.completed += 1
+            self.last_result = result
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def stats(self):
+        stats = self.writer.stats()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            completions = list(self._completions)
+        if latencies:
+            stats["latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            stats["latency_p95_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1)
+        if len(completions) > 1 and completions[-1] > completions[0]:
+            stats["throughput_fps"] = round((len(completions) - 1) / (completions[-1] - completions[0]), 2)
+        stats["completed"] = self.completed
+        if self.ring is not None:
+            stats["lapped"] = self.lapped
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
@@ -0,0 +1,356 @@
+import math
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+from .encoder import TEE_DEFAULTS
+from .frameslot import SHM_DIR
+
+# LL-HLS rings live in shared memory (tmpfs), not on the /data/logs volume
+LLHLS_BASE_DIR = os.path.join(SHM_DIR, "hls")
+
+# Fragmented MP4 on stdout: one moof+mdat per keyframe or per frag_duration (us)
+# delay_moov: the H.264 parameter sets are only known after the first packet
+FMP4_MOVFLAGS = "frag_keyframe+empty_moov+delay_moov+default_base_moof+omit_tfhd_offset"
+
+_BOX = struct.Struct(">I4s")
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+SAMPLE_NON_SYNC = 0x00010000
+
+
+def llhls_dir(stream_name, kind):
+    return os.path.join(LLHLS_BASE_DIR, stream_name, kind)
+
+
+def fmp4_output(part_target=0.2):
+    """Tee slave spec writing fragmented MP4 to stdout for an LLHLSSegmenter."""
+    return (
+        f"[f=mp4:movflags={FMP4_MOVFLAGS}"
+        f":frag_duration={int(part_target * 1000000)}:{TEE_DEFAULTS}]pipe:1"
+    )
+
+
+def iter_boxes(data, offset=0, end=None):
+    """Yields (type, body_start, box_end) for the ISO-BMFF boxes in data[offset:end]."""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, kind = _BOX.unpack_from(data, offset)
+        header = 8
+        if size == 1:
+            size = _U64.unpack_from(data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _find(data, path, offset=0, end=None):
+    """Body range of the first box matching a path like [b'moov', b'trak', b'mdia']."""
+    for kind, body, box_end in iter_boxes(data, offset, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return body, box_end
+            return _find(data, path[1:], body, box_end)
+    return None
+
+
+def parse_init(init):
+    """(timescale, trex default duration, trex default flags) of the first track."""
+    timescale, duration, flags = 90000, 0, 0
+    mdhd = _find(init, [b"moov", b"trak", b"mdia", b"mdhd"])
+    if mdhd:
+        body = mdhd[0]
+        version = init[body]
+        timescale = _U32.unpack_from(init, body + (20 if version == 1 else 12))[0]
+    trex = _find(init, [b"moov", b"mvex", b"trex"])
+    if trex:
+        body = trex[0]
+        duration = _U32.unpack_from(init, body + 12)[0]
+        flags = _U32.unpack_from(init, body + 20)[0]
+    return timescale, duration, flags
+
+
+def parse_fragment(moof, default_duration=0, default_flags=0):
+    """(duration in timescale units, starts with a sync sample) of one moof."""
+    traf = _find(moof, [b"moof", b"traf"])
+    if traf is None:
+        return 0, False
+    tfhd = _find(moof, [b"tfhd"], *traf)
+    if tfhd:
+        body = tfhd[0]
+        tf_flags = _U32.unpack_from(moof, body)[0] & 0xFFFFFF
+        pos = body + 8
+        if tf_flags & 0x01:
+            pos += 8
+        if tf_flags & 0x02:
+            pos += 4
+        if tf_flags & 0x08:
+            default_duration = _U32.unpack_from(moof, pos)[0]
+            pos += 4
+        if tf_flags & 0x10:
+            pos += 4
+        if tf_flags & 0x20:
+            default_flags = _U32.unpack_from(moof, pos)[0]
+
+    duration, first_flags = 0, None
+    for kind, body, _ in iter_boxes(moof, *traf):
+        if kind != b"trun":
+            continue
+        tr_flags = _U32.unpack_from(moof, body)[0] & 0xFFFFFF
+        count = _U32.unpack_from(moof, body + 4)[0]
+        pos = body + 8
+        if tr_flags & 0x01:
+            pos += 4
+        run_first = None
+        if tr_flags & 0x04:
+            run_first = _U32.unpack_from(moof, pos)[0]
+            pos += 4
+        for i in range(count):
+            sample_duration, sample_flags = default_duration, default_flags
+            if tr_flags & 0x100:
+                sample_duration = _U32.unpack_from(moof, pos)[0]
+                pos += 4
+            if tr_flags & 0x200:
+                pos += 4
+            if tr_flags & 0x400:
+                sample_flags = _U32.unpack_from(moof, pos)[0]
+                pos += 4
+            if tr_flags & 0x800:
+                pos += 4
+            if i == 0 and first_flags is None:
+                first_flags = run_first if run_first is not None else sample_flags
+            duration += sample_duration
+    independent = first_flags is not None and not first_flags & SAMPLE_NON_SYNC
+    return duration, independent
+
+
+class _Segment:
+    def __init__(self, msn, init_name, discontinuity):
+        self.msn = msn
+        self.init_name = init_name
+        self.discontinuity = discontinuity
+        self.parts = []  # (name, duration, independent)
+        self.data = []   # part bytes, kept until the full segment is written
+        self.duration = 0.0
+        self.complete = False
+        self.parts_removed = False
+
+
+class LLHLSSegmenter:
+    """Turns a fragmented MP4 byte stream into a Low-Latency HLS ring.
+
+    Every moof+mdat pair becomes a partial segment (EXT-X-PART) the moment
+    it arrives; parts are grouped into full segments starting at sync
+    samples once `segment_target` seconds are reached. Only the last
+    `window` segments are kept, in `out_dirs` (tmpfs), and file names carry
+    a run prefix so they can be cached as immutable. The playlist
+    advertises CAN-BLOCK-RELOAD; the API implements the blocking reload.
+    A new init segment (ffmpeg restart) starts a discontinuity.
+    """
+
+    def __init__(self, out_dirs, part_target=0.2, segment_target=1.0, window=6, logger=None):
+        self.out_dirs = list(out_dirs)
+        self.part_target = part_target
+        self.segment_target = segment_target
+        self.window = window
+        self.logger = logger
+        self.prefix = f"{int(time.time()):x}"
+        self.segments = deque()
+        self.current = None
+        self.next_msn = 0
+        self.discontinuity_seq = 0
+        self.inits = 0
+        self.init_name = None
+        self.timescale = 90000
+        self.defaults = (0, 0)
+        self.parts_written = 0
+        self._lock = threading.Lock()
+        for d in self.out_dirs:
+            os.makedirs(d, exist_ok=True)
+
+    def start(self, stream):
+        """Consumes `stream` (a binary file object) on a daemon thread."""
+        thread = threading.Thread(target=self.feed, args=(stream,), daemon=True)
+        thread.start()
+        return thread
+
+    def feed(self, stream):
+        """Reads boxes until EOF; safe to call again with a new stream after a restart."""
+        header_boxes, moof = [], None
+        try:
+            while True:
+                box = self._read_box(stream)
+                if box is None:
+                    break
+                kind = box[4:8]
+                if kind in (b"ftyp", b"moov"):
+                    header_boxes.append(box)
+                    if kind == b"moov":
+                        self._on_init(b"".join(header_boxes))
+                        header_boxes = []
+                elif kind == b"moof":
+                    moof = box
+                elif kind == b"mdat" and moof is not None and self.init_name:
+                    self._on_part(moof, box)
+                    moof = None
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"LL-HLS segmenter stopped: {e}")
+        finally:
+            with self._lock:
+                self._close_segment()
+                self._write_playlist()
+
+    @staticmethod
+    def _read_box(stream):
+        header = stream.read(8)
+        if len(header) < 8:
+            return None
+        size = _U32.unpack_from(header)[0]
+        if size == 1:
+            large = stream.read(8)
+            size = _U64.unpack(large)[0]
+            header += large
+        body = stream.read(size - len(header)) if size > len(header) else b""
+        return header + body
+
+    def _on_init(self, init):
+        with self._lock:
+            self._close_segment()
+            self.inits += 1
+            self.init_name = f"{self.prefix}_init{self.inits}.mp4"
+            self._write_file(self.init_name, init)
+            self.timescale, *self.defaults = parse_init(init)
+
+    def _on_part(self, moof, mdat):
+        duration, independent = parse_fragment(moof, *self.defaults)
+        seconds = duration / self.timescale if self.timescale else 0.0
+        with self._lock:
+            cur = self.current
+            if cur is not None and independent and cur.duration >= self.segment_target * 0.9:
+                self._close_segment()
+                cur = None
+            if cur is None:
+                discontinuity = bool(self.segments) and self.segments[-1].init_name != self.init_name
+                cur = self.current = _Segment(self.next_msn, self.init_name, discontinuity)
+                self.next_msn += 1
+            name = f"{self.prefix}_seg{cur.msn}.part{len(cur.parts)}.m4s"
+            cur.data.append(moof + mdat)
+            self._write_file(name, cur.data[-1])
+            cur.parts.append((name, seconds, independent))
+            cur.duration += seconds
+            self.parts_written += 1
+            self._write_playlist()
+
+    def _close_segment(self):
+        cur = self.current
+        if cur is None or not cur.parts:
+            self.current = None
+            return
+        self._write_file(self._segment_name(cur), b"".join(cur.data))
+        cur.data = []
+        cur.complete = True
+        self.segments.append(cur)
+        self.current = None
+        while len(self.segments) > self.window:
+            old = self.segments.popleft()
+            if self.segments[0].discontinuity:
+                self.discontinuity_seq += 1
+            self._remove(self._segment_name(old))
+            self._remove_parts(old)
+            if old.init_name != self.init_name and all(s.init_name != old.init_name for s in self.segments):
+                self._remove(old.init_name)
+        # Parts are only listed for the most recent segments
+        if len(self.segments) > 3:
+            self._remove_parts(self.segments[-4])
+
+    def _segment_name(self, seg):
+        return f"{self.prefix}_seg{seg.msn}.m4s"
+
+    def _remove_parts(self, seg):
+        for name, _, _ in seg.parts:
+            self._remove(name)
+        seg.parts_removed = True
+
+    def _write_file(self, name, data):
+        for d in self.out_dirs:
+            tmp = os.path.join(d, f".{name}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(d, name))
+
+    def _remove(self, name):
+        for d in self.out_dirs:
+            try:
+                os.remove(os.path.join(d, name))
+            except OSError:
+                pass
+
+    def _write_playlist(self):
+        segments = list(self.segments) + ([self.current] if self.current else [])
+        if not segments:
+            return
+        longest = max([s.duration for s in self.segments] or [self.segment_target])
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:9",
+            f"#EXT-X-TARGETDURATION:{max(1, math.ceil(longest))}",
+            f"#EXT-X-PART-INF:PART-TARGET={self.part_target:.3f}",
+            f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={self.part_target * 3:.3f}",
+            f"#EXT-X-MEDIA-SEQUENCE:{segments[0].msn}",
+            f"#EXT-X-DISCONTINUITY-SEQUENCE:{self.discontinuity_seq}",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+        ]
+        init_name = None
+        for seg in segments:
+            if seg.discontinuity and init_name is not None:
+                lines.append("#EXT-X-DISCONTINUITY")
+            if seg.init_name != init_name:
+                lines.append(f'#EXT-X-MAP:URI="{seg.init_name}"')
+                init_name = seg.init_name
+            if not seg.parts_removed:
+                for name, duration, independent in seg.parts:
+                    attrs = f'DURATION={duration:.3f},URI="{name}"'
+                    if independent:
+                        attrs += ",INDEPENDENT=YES"
+                    lines.append(f"#EXT-X-PART:{attrs}")
+            if seg.complete:
+                lines.append(f"#EXTINF:{seg.duration:.3f},")
+                lines.append(self._segment_name(seg))
+        self._write_file("live.m3u8", ("\n".join(lines) + "\n").encode())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segments": len(self.segments),
+                "next_msn": self.next_msn,
+                "parts_written": self.parts_written,
+                "inits": self.inits,
+            }
+
+
+def playlist_has(text, msn, part=None):
+    """True if an LL-HLS playlist already contains segment `msn` (or its part `part`).
+
+    Used for blocking playlist reload (_HLS_msn / _HLS_part).
+    """
+    media_sequence, complete, trailing_parts = 0, 0, 0
+    for line in text.splitlines():
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            complete += 1
+            trailing_parts = 0
+        elif line.startswith("#EXT-X-PART:"):
+            trailing_parts += 1
+    if msn < media_sequence + complete:
+        return True
+    if msn == media_sequence + complete and part is not None:
+        return part < trailing_parts
+    return False
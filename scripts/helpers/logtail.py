@@ -0,0 +1,176 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal ctypes binding: one watch on a directory, cooperative waits via select()."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wd = None
+
+    def watch(self, path, mask=IN_MODIFY | IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF):
+        if self.wd is not None:
+            self._libc.inotify_rm_watch(self.fd, self.wd)
+        self.wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if self.wd < 0:
+            self.wd = None
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+
+    def read(self, timeout):
+        """Waits up to timeout seconds; returns [(mask, name), ...]."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, offset = [], 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogTailer:
+    """Follows the newest *.log file of a directory and emits new lines in batches.
+
+    Wakes on inotify events for the directory (appends, new files from a
+    restart or day rollover) and falls back to cheap polling where inotify
+    is unavailable. Lines arriving within `batch_window` seconds are
+    coalesced into one `emit(lines)` call, capped at `max_batch` lines.
+    """
+
+    def __init__(self, emit, batch_window=0.1, max_batch=200, poll_interval=0.5, rescan_interval=5.0, logger=print):
+        self.emit = emit
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.log = logger
+        self.log_dir = None
+        self.current_file = None
+        self.handle = None
+        self.inotify = None
+        self._partial = ""
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError):
+            self.log("Log Reader: inotify unavailable, falling back to polling")
+
+    def run(self, get_log_dir):
+        """Loops forever; get_log_dir() is re-evaluated so stream switches are followed."""
+        last_rescan = 0.0
+        while True:
+            try:
+                log_dir = get_log_dir()
+                if log_dir != self.log_dir or self.handle is None:
+                    if not self._attach(log_dir):
+                        time.sleep(1)
+                        continue
+                    last_rescan = time.time()
+
+                if self.inotify:
+                    events = self.inotify.read(timeout=self.rescan_interval)
+                    if any(mask & (IN_DELETE_SELF | IN_MOVE_SELF) for mask, _ in events):
+                        self._detach()
+                        continue
+                    new_logs = [name for mask, name in events if mask & (IN_CREATE | IN_MOVED_TO) and name.endswith('.log')]
+                    if new_logs:
+                        self._switch(os.path.join(self.log_dir, sorted(new_logs)[-1]), from_start=True)
+                    if not events:
+                        continue
+                else:
+                    time.sleep(self.poll_interval)
+                    if time.time() - last_rescan >= self.rescan_interval:
+                        last_rescan = time.time()
+                        newest = self._newest_log()
+                        if newest and newest != self.current_file:
+                            self._switch(newest, from_start=True)
+
+                # Give a burst a moment to land so it goes out as one event
+                time.sleep(self.batch_window)
+                self._flush()
+            except Exception:
+                self._detach()
+                time.sleep(1)
+
+    def _attach(self, log_dir):
+        self._detach()
+        if not os.path.isdir(log_dir):
+            return False
+        newest = self._newest_log(log_dir)
+        if newest is None:
+            return False
+        self.log_dir = log_dir
+        if self.inotify:
+            self.inotify.watch(log_dir)
+        self._switch(newest, from_start=False)
+        return True
+
+    def _detach(self):
+        if self.handle:
+            self.handle.close()
+        self.handle = None
+        self.current_file = None
+        self.log_dir = None
+
+    def _newest_log(self, log_dir=None):
+        log_dir = log_dir or self.log_dir
+        log_files = [os.path.join(log_dir, f) for f in os.listdir(log_dir) if f.endswith('.log')]
+        if not log_files:
+            return None
+        return max(log_files, key=os.path.getmtime)
+
+    def _switch(self, path, from_start):
+        if path == self.current_file:
+            return
+        self._flush()
+        if self.handle:
+            self.handle.close()
+        self.current_file = path
+        self.handle = open(path, 'r')
+        if not from_start:
+            self.handle.seek(0, 2) # Start at the end
+        self._partial = ""
+        self.log(f"Log Reader now watching: {path}")
+
+    def _flush(self):
+        if not self.handle:
+            return
+        # Truncated (e.g. history cleared) -> start over
+        if os.fstat(self.handle.fileno()).st_size < self.handle.tell():
+            self.handle.seek(0)
+        data = self._partial + self.handle.read()
+        if not data:
+            return
+        lines = data.split("\n")
+        self._partial = lines.pop() # keep an unterminated tail for the next read
+        lines = [line.strip() for line in lines if line.strip()]
+        for i in range(0, len(lines), self.max_batch):
+            self.emit(lines[i:i + self.max_batch])
@@ -0,0 +1,195 @@
+import json
+import os
+from bisect import bisect_left
+
+# Seconds; covers a 1ms pipe write up to a slow VLM round trip
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds.
+
+    observe() is a bisect and three additions, cheap enough to call for
+    every frame of every stage. Callers that observe from several threads
+    hold their own lock (SinkWriter does). snapshot() is what the worker
+    sends in its timings event and what MetricsText.histogram() renders.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def snapshot(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": round(self.sum, 6)}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels.items()
+    )
+    return "{" + body + "}"
+
+
+class MetricsText:
+    """Builds a Prometheus text exposition (format 0.0.4) sample by sample."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.lines = []
+        self._declared = set()
+
+    def _declare(self, name, kind, help_text):
+        if name not in self._declared:
+            self._declared.add(name)
+            if help_text:
+                self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, labels=None, kind="gauge", help_text=""):
+        if value is None:
+            return
+        name = self.prefix + name
+        self._declare(name, kind, help_text)
+        value = int(value) if isinstance(value, (bool, int)) else repr(float(value))
+        self.lines.append(f"{name}{_labels(labels)} {value}")
+
+    def counter(self, name, value, labels=None, help_text=""):
+        self.sample(name, value, labels, "counter", help_text)
+
+    def histogram(self, name, snapshot, labels=None, help_text=""):
+        """Renders a Histogram.snapshot() (per-bucket counts) as cumulative buckets."""
+        if not snapshot:
+            return
+        name = self.prefix + name
+        self._declare(name, "histogram", help_text)
+        labels = dict(labels or {})
+        total = 0
+        for bound, count in zip(list(snapshot["buckets"]) + ["+Inf"], snapshot["counts"]):
+            total += count
+            le = bound if bound == "+Inf" else f"{bound:g}"
+            self.lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {total}")
+        self.lines.append(f"{name}_sum{_labels(labels)} {float(snapshot['sum'])!r}")
+        self.lines.append(f"{name}_count{_labels(labels)} {total}")
+
+    def render(self):
+        return "\n".join(self.lines) + "\n"
+
+
+class SharedMetrics:
+    """Metrics of several processes serving one /metrics, through files in a shared directory.
+
+    Each process write()s its own samples to `<dir>/<pid>.json` (atomic
+    rename, so a reader never sees half a file); collect() merges the
+    files of the processes still alive, summing counters, gauges and
+    histogram buckets per (name, labels). Whichever process answers a
+    scrape reports the same totals. A sample is (kind, name, labels,
+    value) with kind "counter", "gauge" or "histogram" (value: a
+    Histogram.snapshot()).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, samples):
+        target = os.path.join(self.path, f"{os.getpid()}.json")
+        tmp = f"{target}.tmp"
+        with open(tmp, "w") as f:
+            json.dump([list(sample) for sample in samples], f)
+        os.replace(tmp, target)
+
+    def collect(self):
+        merged = {}
+        for entry in os.listdir(self.path):
+            pid, ext = os.path.splitext(entry)
+            if ext != ".json" or not pid.isdigit():
+                continue
+            file_path = os.path.join(self.path, entry)
+            if not os.path.exists(f"/proc/{pid}"):
+                # A process that exited (or a previous container run); its counters go with it
+                try:
+                    os.unlink(file_path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(file_path) as f:
+                    samples = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for kind, name, labels, value in samples:
+                key = (kind, name, tuple(sorted((labels or {}).items())))
+                if key not in merged:
+                    merged[key] = value if kind != "histogram" else dict(value, counts=list(value["counts"]))
+                elif kind == "histogram":
+                    total = merged[key]
+                    total["counts"] = [a + b for a, b in zip(total["counts"], value["counts"])]
+                    total["sum"] = round(total["sum"] + value["sum"], 6)
+                else:
+                    merged[key] += value
+        return [(kind, name, dict(labels), value) for (kind, name, labels), value in sorted(merged.items())]
+
+
+def process_tree(root_pid):
+    """Pids of root_pid and all of its descendants, found through /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def process_cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+    except OSError:
+        return ""
+
+
+def process_sample(pid):
+    """(cpu seconds, rss bytes) of a process, or None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK, rss_pages * PAGE_SIZE
+
+
+def process_role(pid, cmdline, root_pid):
+    """Short label for a process in a worker tree (worker, encoder, remux...)."""
+    if pid == root_pid:
+        return "worker"
+    if "-f tee" in cmdline:
+        return "encoder-processed" if "/processed" in cmdline else "encoder"
+    if "ffmpeg" in cmdline:
+        return "remux"
+    return os.path.basename(cmdline.split(" ", 1)[0]) or str(pid)
@@ -0,0 +1,120 @@
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+TEXT_COLOR = (255, 255, 255)
+PANEL_COLOR = (20, 20, 20)
+BOX_COLOR = (0, 200, 255)
+
+
+def wrap_text(text, max_width, scale=0.5, thickness=1, max_lines=3):
+    """Greedy word wrap by rendered width; the last line is cut with an ellipsis."""
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and cv2.getTextSize(candidate, FONT, scale, thickness)[0][0] > max_width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = lines[-1].rstrip(".") + "..."
+    return lines
+
+
+class OverlayRenderer:
+    """Composites the latest inference result onto frames of the processed stream.
+
+    update() runs on the inference thread and renders the caption panel,
+    boxes and timestamp once into a premultiplied patch covering only the
+    annotated region. apply() runs per frame: one copy out of the ring plus
+    an integer alpha blend of that patch, so drawing never waits on the
+    model. A result older than `max_age` seconds is no longer shown.
+    Boxes that move every frame (set_boxes, from the tracker) are drawn as
+    plain rectangles after the blend.
+    """
+
+    def __init__(self, width, height, opacity=0.6, max_age=30.0, scale=0.5):
+        self.width = width
+        self.height = height
+        self.opacity = opacity
+        self.max_age = max_age
+        self.scale = scale
+        self._layer = None  # (y0, y1, x0, x1, premultiplied, inverse alpha, rendered_at)
+        self._boxes = ()
+        self.rendered = 0
+        self.applied = 0
+
+    def update(self, result, boxes=()):
+        """Pre-renders a result dict (caption, frame_seq, timestamp, cached) and optional (x, y, w, h, label) boxes."""
+        canvas = np.zeros((self.height, self.width, 3), np.uint8)
+        alpha = np.zeros((self.height, self.width), np.uint8)
+
+        caption = result.get("caption") or ""
+        when = datetime.fromtimestamp(result.get("timestamp") or time.time()).strftime("%H:%M:%S")
+        source = "cache" if result.get("cached") else f"{result.get('latency_ms', 0)}ms"
+        lines = wrap_text(caption, self.width - 16, self.scale)
+        lines.append(f"{when}  frame {result.get('frame_seq', '-')}  ({source})")
+
+        line_height = int(22 * self.scale / 0.5)
+        panel_top = self.height - line_height * len(lines) - 10
+        cv2.rectangle(canvas, (0, panel_top), (self.width, self.height), PANEL_COLOR, -1)
+        cv2.rectangle(alpha, (0, panel_top), (self.width, self.height), int(255 * self.opacity), -1)
+        for i, text in enumerate(lines):
+            org = (8, panel_top + line_height * (i + 1))
+            cv2.putText(canvas, text, org, FONT, self.scale, TEXT_COLOR, 1, cv2.LINE_AA)
+            cv2.putText(alpha, text, org, FONT, self.scale, 255, 1, cv2.LINE_AA)
+
+        for x, y, w, h, label, *_ in boxes:
+            for layer, color in ((canvas, BOX_COLOR), (alpha, 255)):
+                cv2.rectangle(layer, (int(x), int(y)), (int(x + w), int(y + h)), color, 2)
+                if label:
+                    cv2.putText(layer, str(label), (int(x), max(int(y) - 4, 10)), FONT, self.scale, color, 1, cv2.LINE_AA)
+
+        ys, xs = np.nonzero(alpha)
+        if not len(ys):
+            self._layer = None
+            return
+        y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        a = alpha[y0:y1, x0:x1, None].astype(np.uint16)
+        premultiplied = canvas[y0:y1, x0:x1].astype(np.uint16) * a
+        self._layer = (y0, y1, x0, x1, premultiplied, 255 - a, time.time())
+        self.rendered += 1
+
+    def set_boxes(self, boxes):
+        """Live (x, y, w, h, label, ...) boxes in frame pixels, drawn on every frame."""
+        self._boxes = tuple(boxes)
+
+    def clear(self):
+        self._layer = None
+        self._boxes = ()
+
+    def apply(self, frame, out):
+        """Copies frame into `out` (preallocated, same shape) and blends the current layer onto it."""
+        np.copyto(out, frame)
+        for x, y, w, h, label, *_ in self._boxes:
+            cv2.rectangle(out, (int(x), int(y)), (int(x + w), int(y + h)), BOX_COLOR, 2)
+            if label:
+                cv2.putText(out, str(label), (int(x), max(int(y) - 4, 10)), FONT, self.scale, BOX_COLOR, 1, cv2.LINE_AA)
+        layer = self._layer
+        if layer is None:
+            return out
+        y0, y1, x0, x1, premultiplied, inverse, rendered_at = layer
+        if self.max_age and time.time() - rendered_at > self.max_age:
+            return out
+        roi = out[y0:y1, x0:x1]
+        blended = roi * inverse
+        blended += premultiplied
+        blended //= 255
+        roi[...] = blended
+        self.applied += 1
+        return out
+
+    def stats(self):
+        return {"rendered": self.rendered, "applied": self.applied, "visible": self._layer is not None}
@@ -0,0 +1,94 @@
+import time
+
+import cv2
+
+# Sources that report no usable rate (raw UDP MJPEG, some ESP32 firmwares)
+# are timed over this many frames instead
+FPS_PROBE_FRAMES = 15
+MAX_SANE_FPS = 120
+
+
+def parse_size(value, name="size"):
+    """Parses "640x480" into (640, 480); empty, "0" or None gives None (keep the source size).
+
+    Anything else raises ValueError naming `name` (the env variable it came from).
+    """
+    value = (value or "").strip().lower()
+    if value in ("", "0"):
+        return None
+    try:
+        width, height = (int(v) for v in value.split("x"))
+    except ValueError:
+        width = height = 0
+    if width <= 0 or height <= 0:
+        raise ValueError(f"{name} must be WxH (e.g. 640x480), empty or 0; got {value!r}")
+    return width, height
+
+
+def fit_size(frame, size):
+    """Resizes a frame to `size` (w, h) when it differs; returns the frame itself otherwise."""
+    if size is None or (frame.shape[1], frame.shape[0]) == tuple(size):
+        return frame
+    return cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+
+
+def probe_stream(cap, frame, default_fps=30.0, logger=None):
+    """Returns (width, height, fps) of an opened capture.
+
+    Geometry comes from a decoded frame, which is what actually lands in
+    memory (the container's values if no frame could be decoded). The rate is what the container reports when plausible, otherwise
+    measured by grabbing FPS_PROBE_FRAMES frames, otherwise `default_fps`.
+    """
+    if frame is not None:
+        height, width = frame.shape[:2]
+    else:
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 480
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 640
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    source = "container"
+    if not 1.0 <= fps <= MAX_SANE_FPS:
+        start = time.perf_counter()
+        grabbed = sum(1 for _ in range(FPS_PROBE_FRAMES) if cap.grab())
+        elapsed = time.perf_counter() - start
+        fps = grabbed / elapsed if grabbed > 1 and elapsed > 0 else 0.0
+        source = "measured"
+        if not 1.0 <= fps <= MAX_SANE_FPS:
+            fps, source = float(default_fps), "default"
+    fps = round(fps, 2)
+    if logger:
+        logger.info(f"Stream probe: {width}x{height} @ {fps}fps ({source})")
+    return width, height, fps
+
+
+class RateLimiter:
+    """Lets through at most `fps` frames per second (fps <= 0 lets everything through).
+
+    `due()` peeks, `take()` consumes: the capture thread peeks every
+    consumer's limiter to decide whether a frame must be decoded at all, and
+    each consumer takes the frames it actually uses.
+    """
+
+    def __init__(self, fps=0.0):
+        self._next = 0.0
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+
+    def due(self, now=None):
+        if not self.interval:
+            return True
+        now = time.monotonic() if now is None else now
+        # A quarter interval of slack so frame-arrival jitter does not halve the rate
+        return now >= self._next - self.interval / 4
+
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        if not self.due(now):
+            return False
+        if self.interval:
+            # Keep the cadence through jitter, but never burst after a gap
+            late = now - self._next
+            self._next = self._next + self.interval if late < self.interval else now + self.interval
+        return True
@@ -0,0 +1,143 @@
+import os
+import re
+import subprocess
+import threading
+import time
+
+from .encoder import TEE_DEFAULTS
+from .llhls import fmp4_output
+
+SEGMENT_OPEN_RE = re.compile(r"Opening '([^']+\.ts)' for writing")
+
+
+class PassthroughRemuxer:
+    """Copies the incoming H.264 MPEG-TS into a raw HLS playlist without re-encoding.
+
+    The same ffmpeg also re-publishes the untouched packets on a loopback UDP
+    port so the analysis loop can keep decoding with cv2.VideoCapture (the
+    ingest port can only be bound once). ffmpeg is restarted whenever the
+    source goes quiet or dies, and the playlist is appended with a
+    discontinuity so players survive camera restarts. With a `segmenter`
+    (LLHLSSegmenter) the copy goes out as fragmented MP4 on stdout instead
+    of an on-disk playlist.
+    """
+
+    def __init__(self, input_url, hls_dir, decode_url, logger, hls_time=2, list_size=3, input_timeout=5,
+                 segmenter=None, segment_prefix="live"):
+        self.input_url = input_url
+        self.hls_dir = hls_dir
+        self.decode_url = decode_url
+        self.logger = logger
+        self.hls_time = hls_time
+        self.list_size = list_size
+        self.input_timeout = input_timeout
+        self.segmenter = segmenter
+        self.segment_prefix = segment_prefix
+        self.process = None
+        self.running = False
+        self.restarts = 0
+        self.segments = 0
+        self.last_segment = None
+        self.last_segment_duration = None
+        self.last_segment_wall = None
+        self._last_open_ts = None
+        self._thread = None
+
+    @property
+    def playlist(self):
+        return os.path.join(self.hls_dir, "live.m3u8")
+
+    def build_cmd(self):
+        sep = "&" if "?" in self.input_url else "?"
+        # udp timeout is in microseconds; it makes ffmpeg exit when the camera stops
+        src = f"{self.input_url}{sep}timeout={self.input_timeout * 1000000}&overrun_nonfatal=1"
+        if self.segmenter:
+            hls = fmp4_output(self.segmenter.part_target)
+        else:
+            segments = os.path.join(self.hls_dir, f"{self.segment_prefix}%d.ts")
+            hls = (
+                f"[f=hls:hls_time={self.hls_time}:hls_list_size={self.list_size}"
+                f":hls_flags=delete_segments+append_list+discont_start+omit_endlist"
+                f":hls_segment_filename={segments}:{TEE_DEFAULTS}]{self.playlist}"
+            )
+        decode = f"[f=mpegts:{TEE_DEFAULTS}]{self.decode_url}"
+        return [
+            'ffmpeg', '-y', '-hide_banner', '-nostats', '-loglevel', 'info',
+            '-fflags', '+genpts+discardcorrupt',
+            '-i', src,
+            '-map', '0:v', '-c', 'copy',
+            '-f', 'tee', f"{hls}|{decode}"
+        ]
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        p = self.process
+        if p and p.poll() is None:
+            p.terminate()
+            try:
+                p.wait(timeout=0.5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def _supervise(self):
+        while self.running:
+            self.logger.info(f"Raw HLS passthrough: remuxing {self.input_url} (restart #{self.restarts})")
+            self.process = subprocess.Popen(
+                self.build_cmd(),
+                stdout=subprocess.PIPE if self.segmenter else subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                universal_newlines=True
+            )
+            if self.segmenter:
+                # stdout is binary fMP4; the text wrapper only applies to stderr parsing
+                self.segmenter.start(self.process.stdout.buffer)
+            self._last_open_ts = None
+            for line in self.process.stderr:
+                self._handle_line(line)
+            code = self.process.wait()
+            if not self.running:
+                break
+            self.restarts += 1
+            self.logger.warning(f"Raw HLS passthrough exited (code {code}), restarting...")
+            time.sleep(0.5)
+
+    def _handle_line(self, line):
+        match = SEGMENT_OPEN_RE.search(line)
+        if not match:
+            return
+        now = time.time()
+        # A new segment opening means the previous one is complete and listed
+        if self._last_open_ts is not None and self.last_segment:
+            self.segments += 1
+            self.last_segment_wall = now - self._last_open_ts
+            self.last_segment_duration = self._read_duration(self.last_segment)
+            media = f"{self.last_segment_duration:.2f}s" if self.last_segment_duration else "?"
+            self.logger.info(
+                f"Raw HLS segment {os.path.basename(self.last_segment)}: "
+                f"{media} media / {self.last_segment_wall:.2f}s wall"
+            )
+        self.last_segment = match.group(1)
+        self._last_open_ts = now
+
+    def _read_duration(self, segment_path):
+        """Looks up the #EXTINF duration ffmpeg wrote for a finished segment."""
+        name = os.path.basename(segment_path)
+        try:
+            with open(self.playlist, 'r') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        for i, entry in enumerate(lines):
+            if entry == name and i > 0 and lines[i - 1].startswith("#EXTINF:"):
+                try:
+                    return float(lines[i - 1][8:].split(",")[0])
+                except ValueError:
+                    return None
+        return None
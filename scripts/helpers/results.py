@@ -0,0 +1,227 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .sinks import SinkWriter, DROP_OLDEST
+
+MAX_PAGE = 200
+
+
+def result_id(timestamp):
+    """Row id of a result: its timestamp in microseconds, so the primary key is the time index."""
+    return int(timestamp * 1_000_000)
+
+
+def fts_query(text):
+    """Turns free text into an FTS5 query: every word must match, no operators get through."""
+    words = [w.replace('"', '""') for w in text.split()]
+    return " ".join(f'"{w}"' for w in words)
+
+
+class ResultStore:
+    """History of VLM results in SQLite (next to the streams table).
+
+    Rows are keyed by their timestamp in microseconds (bumped by one on a
+    collision), so time ranges and keyset pages are primary-key ranges and
+    the FTS5 index over caption and detection labels can be walked newest
+    first by rowid. Every query is "seek to a rowid, read one page":
+    latency depends on the page size, not on how much history there is.
+    Pass `connection` (a context manager yielding a connection, e.g.
+    StreamRegistry.connection) to share a pool; otherwise one connection
+    is opened and serialized by a lock.
+    """
+
+    def __init__(self, db_path, connection=None):
+        self.db_path = db_path
+        self._connection = connection
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        if self._connection is not None:
+            with self._connection() as conn:
+                yield conn
+            return
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+                self._conn.row_factory = sqlite3.Row
+            yield self._conn
+
+    def init(self):
+        with self.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS results (
+                        id INTEGER PRIMARY KEY,
+                        stream TEXT NOT NULL,
+                        ts REAL NOT NULL,
+                        frame_seq INTEGER,
+                        caption TEXT,
+                        labels TEXT,
+                        detections TEXT,
+                        latency_ms REAL,
+                        cached INTEGER DEFAULT 0
+                    )
+                ''')
+                # rowid is the last column of every index, so this is (stream, time)
+                conn.execute("CREATE INDEX IF NOT EXISTS results_stream_time ON results (stream, id)")
+                conn.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+                        caption, labels, stream, content='results', content_rowid='id'
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS results_ai AFTER INSERT ON results BEGIN
+                        INSERT INTO results_fts (rowid, caption, labels, stream)
+                        VALUES (new.id, new.caption, new.labels, new.stream);
+                    END
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS results_ad AFTER DELETE ON results BEGIN
+                        INSERT INTO results_fts (results_fts, rowid, caption, labels, stream)
+                        VALUES ('delete', old.id, old.caption, old.labels, old.stream);
+                    END
+                ''')
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self
+
+    @staticmethod
+    def _values(stream, result):
+        detections = result.get("detections") or []
+        labels = " ".join(str(d[4]) for d in detections if len(d) > 4 and d[4])
+        return [
+            stream, result.get("timestamp") or time.time(), result.get("frame_seq"), result.get("caption") or "",
+            labels, json.dumps(detections) if detections else None, result.get("latency_ms"), int(bool(result.get("cached"))),
+        ]
+
+    def insert_many(self, stream, results):
+        """Inserts a batch of inference results in one transaction; returns the number written."""
+        rows = [self._values(stream, r) for r in results]
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for values in rows:
+                    row_id = result_id(values[1])
+                    # Another result (this batch or another worker) may have taken this microsecond; move up until free
+                    while conn.execute("SELECT 1 FROM results WHERE id = ?", (row_id,)).fetchone():
+                        row_id += 1
+                    conn.execute('''
+                        INSERT INTO results (id, stream, ts, frame_seq, caption, labels, detections, latency_ms, cached)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', [row_id] + values)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    @staticmethod
+    def _row(row):
+        result = dict(row)
+        result["detections"] = json.loads(result["detections"]) if result["detections"] else []
+        result["cached"] = bool(result["cached"])
+        return result
+
+    def search(self, text=None, stream=None, since=None, until=None, cursor=None, limit=50):
+        """One page of results, newest first; returns (rows, next_cursor or None).
+
+        `text` matches caption words and detection labels, `since`/`until`
+        are epoch seconds, `cursor` is the next_cursor of the previous page.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE))
+        low = result_id(since) if since is not None else 0
+        high = result_id(until) if until is not None else 2 ** 63 - 1
+        if cursor is not None:
+            high = min(high, int(cursor) - 1)
+        if text and text.strip():
+            match = fts_query(text)
+            if stream:
+                # Narrows the doclist inside the index; the equality below keeps it exact
+                match = '{} AND stream : "{}"'.format(match, stream.replace('"', '""'))
+            sql = '''
+                SELECT results.* FROM results_fts JOIN results ON results.id = results_fts.rowid
+                WHERE results_fts MATCH ? AND results_fts.rowid BETWEEN ? AND ? {}
+                ORDER BY results_fts.rowid DESC LIMIT ?
+            '''.format("AND results.stream = ?" if stream else "")
+            params = [match, low, high] + ([stream] if stream else []) + [limit + 1]
+        else:
+            sql = '''
+                SELECT * FROM results WHERE id BETWEEN ? AND ? {} ORDER BY id DESC LIMIT ?
+            '''.format("AND stream = ?" if stream else "")
+            params = [low, high] + ([stream] if stream else []) + [limit + 1]
+        with self.connection() as conn:
+            rows = [self._row(row) for row in conn.execute(sql, params)]
+        next_cursor = str(rows[limit - 1]["id"]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+
+class ResultWriter:
+    """Worker-side batched inserter of inference results into a ResultStore.
+
+    offer() never blocks the inference thread. The writer thread takes a
+    result, lingers up to `linger` seconds for more (at most `batch_size`)
+    and inserts them in one transaction; results still queued on stop()
+    are flushed synchronously.
+    """
+
+    def __init__(self, store, stream, batch_size=50, linger=1.0, queue_size=1000,
+                 policy=DROP_OLDEST, logger=None):
+        self.store = store
+        self.stream = stream
+        self.batch_size = batch_size
+        self.linger = linger
+        self.logger = logger
+        self.rows = 0
+        self.writer = SinkWriter("results", self._write, queue_size, policy, logger)
+
+    @property
+    def name(self):
+        return self.writer.name
+
+    def start(self):
+        self.writer.start()
+        return self
+
+    def offer(self, result):
+        return self.writer.offer(result)
+
+    def _drain(self, batch, deadline=None):
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic() if deadline else 0
+            try:
+                batch.append(self.writer.queue.get(timeout=remaining) if remaining > 0 else self.writer.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, first):
+        batch = self._drain([first], time.monotonic() + self.linger)
+        self.rows += self.store.insert_many(self.stream, batch)
+
+    def stop(self):
+        self.writer.stop()
+        while True:
+            batch = self._drain([])
+            if not batch:
+                break
+            try:
+                self.rows += self.store.insert_many(self.stream, batch)
+            except sqlite3.Error as e:
+                if self.logger:
+                    self.logger.error(f"Results flush failed ({len(batch)} lost): {e}")
+                break
+
+    def stats(self):
+        stats = self.writer.stats()
+        stats["rows"] = self.rows
+        return stats
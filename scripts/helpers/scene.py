@@ -0,0 +1,85 @@
+import time
+
+import cv2
+import numpy as np
+
+
+def thumbnail(frame, size=(64, 48)):
+    """Downsampled grayscale copy used for all cheap frame comparisons."""
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small
+
+
+def dhash(frame, hash_size=8):
+    """64-bit difference hash: robust to noise/compression, changes with the scene."""
+    small = thumbnail(frame, (hash_size + 1, hash_size))
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SceneChangeDetector:
+    """Decides whether a frame differs enough from the last forwarded one.
+
+    Works on a 64x48 grayscale thumbnail: a pixel counts as changed when it
+    moved by more than `pixel_delta` grey levels, and the frame is forwarded
+    when more than `threshold` (fraction) of pixels changed. `min_interval`
+    caps the forward rate during constant motion and `max_staleness` forces a
+    refresh on completely static scenes.
+    """
+
+    def __init__(self, threshold=0.02, pixel_delta=25, min_interval=1.0, max_staleness=60.0, size=(64, 48)):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.min_interval = min_interval
+        self.max_staleness = max_staleness
+        self.size = size
+        self.reference = None
+        self.last_forward = 0.0
+        self.last_score = 0.0
+        self.checked = 0
+        self.forwarded = 0
+
+    def check(self, frame, now=None, force=False, min_interval=None):
+        """Returns (forward, reason). Forwarding makes this frame the new reference.
+
+        `force` forwards regardless (e.g. the tracker lost its boxes);
+        `min_interval` overrides the configured one for this call.
+        """
+        now = time.time() if now is None else now
+        self.checked += 1
+        interval = self.min_interval if min_interval is None else min_interval
+        if not force and now - self.last_forward < interval:
+            return False, "interval"
+
+        small = thumbnail(frame, self.size)
+        if force:
+            reason = "forced"
+        elif self.reference is None:
+            reason = "first"
+        else:
+            diff = cv2.absdiff(small, self.reference)
+            self.last_score = float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+            if self.last_score > self.threshold:
+                reason = "changed"
+            elif now - self.last_forward >= self.max_staleness:
+                reason = "stale"
+            else:
+                return False, "static"
+
+        self.reference = small
+        self.last_forward = now
+        self.forwarded += 1
+        return True, reason
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "forwarded": self.forwarded,
+            "last_score": round(self.last_score, 4),
+        }
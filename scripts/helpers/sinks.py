@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+
+from .metrics import Histogram
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class SinkWriter:
+    """Runs one consumer (encoder pipe, snapshot writer, inference...) on its own thread.
+
+    Items are handed over through a bounded queue. When the consumer falls
+    behind, `policy` decides what is lost: DROP_OLDEST keeps the freshest
+    frames, DROP_NEWEST keeps what is already queued. Either way the caller
+    never blocks, and `dropped` tells which sink is the bottleneck.
+    `workers` > 1 drains the same queue from several threads (e.g. for
+    concurrent HTTP requests). Handler durations also go into a Histogram
+    (`latency`), reported by stats() for the metrics endpoint.
+    """
+
+    def __init__(self, name, handler, maxsize=2, policy=DROP_OLDEST, logger=None, workers=1):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.logger = logger
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.latency = Histogram()
+        self.running = False
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"sink-{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def offer(self, item):
+        """Non-blocking hand-off; returns False if something had to be dropped."""
+        self.submitted += 1
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        self.dropped += 1
+        if self.policy == DROP_NEWEST:
+            return False
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            pass
+        return False
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "policy": self.policy,
+            "depth": self.queue.qsize(),
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "avg_write_ms": round(self.busy_time / self.written * 1000, 2) if self.written else 0.0,
+            "latency_hist": self.latency.snapshot(),
+        }
+
+    def _run(self):
+        while self.running:
+            try:
+                item = self.queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            start = time.perf_counter()
+            ok = True
+            try:
+                self.handler(item)
+            except Exception as e:
+                ok = False
+                if self.logger:
+                    self.logger.error(f"Sink '{self.name}' error: {e}")
+            with self._lock:
+                if ok:
+                    self.written += 1
+                else:
+                    self.errors += 1
+                elapsed = time.perf_counter() - start
+                self.busy_time += elapsed
+                self.latency.observe(elapsed)
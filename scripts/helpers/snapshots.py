@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .sinks import SinkWriter, DROP_OLDEST
+
+
+class SnapshotStore:
+    """Writes JPEG snapshots to disk on a background writer and enforces retention.
+
+    The directory is scanned once at start; after that an in-memory index of
+    (path, size, mtime) is the source of truth, so retention by count, total
+    bytes and age never needs a listdir. Files are written to a hidden temp
+    name and renamed into place, so readers never see a partial JPEG.
+    A value of 0 disables a retention limit.
+    """
+
+    def __init__(self, image_dir, max_files=10, max_bytes=0, max_age=0, queue_size=4,
+                 policy=DROP_OLDEST, logger=None, on_saved=None):
+        self.image_dir = image_dir
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.logger = logger
+        self.on_saved = on_saved
+        self.index = deque()
+        self.total_bytes = 0
+        self.saved = 0
+        self._lock = threading.Lock()
+        self.writer = SinkWriter("disk", self._write, queue_size, policy, logger)
+
+    @property
+    def name(self):
+        return self.writer.name
+
+    def start(self):
+        os.makedirs(self.image_dir, exist_ok=True)
+        self._load_index()
+        self._enforce_retention()
+        self.writer.start()
+        return self
+
+    def stop(self):
+        self.writer.stop()
+
+    def offer(self, jpeg_bytes):
+        """Queues an encoded snapshot for writing; never blocks the caller."""
+        return self.writer.offer(jpeg_bytes)
+
+    def stats(self):
+        stats = self.writer.stats()
+        stats["files"] = len(self.index)
+        stats["bytes"] = self.total_bytes
+        return stats
+
+    def _load_index(self):
+        entries = []
+        for f in os.listdir(self.image_dir):
+            path = os.path.join(self.image_dir, f)
+            if f.endswith('.tmp'):
+                # Left over from a crash mid-write
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not f.endswith('.jpg'):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        entries.sort(key=lambda e: e[2])
+        with self._lock:
+            self.index = deque(entries)
+            self.total_bytes = sum(e[1] for e in entries)
+
+    def _write(self, jpeg_bytes):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"frame_{self.saved:06d}_{timestamp}.jpg"
+        path = os.path.join(self.image_dir, filename)
+        tmp_path = os.path.join(self.image_dir, f".{filename}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(jpeg_bytes)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.index.append((path, len(jpeg_bytes), time.time()))
+            self.total_bytes += len(jpeg_bytes)
+            saved_count = self.saved
+            self.saved += 1
+        self._enforce_retention()
+        if self.on_saved:
+            self.on_saved(path, saved_count)
+
+    def _enforce_retention(self):
+        now = time.time()
+        expired = []
+        with self._lock:
+            while self.index and (
+                (self.max_files and len(self.index) > self.max_files)
+                or (self.max_bytes and self.total_bytes > self.max_bytes)
+                or (self.max_age and now - self.index[0][2] > self.max_age)
+            ):
+                path, size, _ = self.index.popleft()
+                self.total_bytes -= size
+                expired.append(path)
+        for path in expired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                if self.logger:
+                    self.logger.warning(f"Snapshot cleanup failed for {path}: {e}")
@@ -0,0 +1,237 @@
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+STREAM_FIELDS = ("name", "display_name", "url", "type", "username", "password")
+# What stream-cam needs to pull a camera; changing them keeps the worker and its ingest port
+CAMERA_FIELDS = ("url", "type", "username", "password")
+
+# Per-stream overrides of camera_test.py's environment (stored in streams.settings)
+WORKER_SETTINGS = {
+    "WORKER_OUTPUTS", "RAW_HLS_MODE", "HLS_MODE", "ENCODER_FPS", "ENCODER_SIZE",
+    "ANALYSIS_FPS", "SNAPSHOT_SIZE", "INFERENCE_SIZE", "INFERENCE_ENABLED", "INFERENCE_DETECT",
+    "INFERENCE_PROMPT", "OVERLAY_ENABLED", "OVERLAY_OPACITY", "OVERLAY_MAX_AGE",
+    "SCENE_THRESHOLD", "SCENE_PIXEL_DELTA", "SCENE_MIN_INTERVAL", "SCENE_MAX_STALENESS",
+    "TRACKER_ENABLED", "TRACKER_FPS", "INGEST_TRANSPORT",
+}
+# ...of which a running worker applies these in place (a "config" control event)
+LIVE_SETTINGS = {
+    "ANALYSIS_FPS", "INFERENCE_PROMPT", "OVERLAY_OPACITY", "OVERLAY_MAX_AGE",
+    "SCENE_THRESHOLD", "SCENE_PIXEL_DELTA", "SCENE_MIN_INTERVAL", "SCENE_MAX_STALENESS",
+}
+
+
+def clean_settings(settings):
+    """Validates a settings dict from the API; values are kept as env strings."""
+    settings = settings or {}
+    unknown = sorted(set(settings) - WORKER_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown worker settings: {', '.join(unknown)}")
+    return {key: str(value) for key, value in settings.items() if value is not None}
+
+
+def plan_update(old, new):
+    """How a running worker takes an edit from `old` to `new`.
+
+    Returns {"restart": bool, "camera": bool, "live": {setting: value}}:
+    a new name (paths, ring and slot names) or a changed setting outside
+    LIVE_SETTINGS needs a restart; camera fields only need stream-cam to
+    re-pull into the same ingest port; live settings are pushed as is.
+    A removed live setting restarts too, since only the worker's start
+    environment knows its default.
+    """
+    before, after = old.get("settings") or {}, new.get("settings") or {}
+    changed = {key for key in set(before) | set(after) if before.get(key) != after.get(key)}
+    live = {key: after[key] for key in changed if key in LIVE_SETTINGS and key in after}
+    return {
+        "restart": old["name"] != new["name"] or bool(changed - set(live)),
+        "camera": any(old.get(field) != new.get(field) for field in CAMERA_FIELDS),
+        "live": live,
+    }
+
+
+class StreamRegistry:
+    """Read-through, in-memory copy of the streams and settings tables.
+
+    Reads are served from memory. Every write bumps `streams_version` (and
+    the row's own `version`) inside its transaction; before a read, a
+    dedicated connection's PRAGMA data_version tells whether any other
+    connection committed since the last look, and only then is the stored
+    version compared and the cache reloaded. That covers writes from other
+    API processes at the cost of one PRAGMA per read (a counter in the
+    shared WAL index, no table I/O); rows are only queried after a commit.
+    Connections are pooled and the database runs in WAL mode, so reads
+    never wait for a writer.
+    """
+
+    def __init__(self, db_path, pool_size=4):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool = []
+        self._lock = threading.Lock()
+        self._watch = None
+        self._data_version = None
+        self.version = None
+        self._streams = {}
+        self._order = []
+        self._settings = {}
+        self.reloads = 0
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """A pooled autocommit connection."""
+        with self._lock:
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                if len(self._pool) < self.pool_size and not conn.in_transaction:
+                    self._pool.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction that also bumps streams_version, invalidating every process's cache."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'streams_version'")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        with self._lock:
+            self.version = None
+
+    def init(self, seed=()):
+        """Creates/migrates the tables and inserts `seed` rows into an empty streams table."""
+        with self.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # One process migrates; the others wait on the lock and find it done
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS streams (
+                        id TEXT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        display_name TEXT NOT NULL,
+                        url TEXT NOT NULL,
+                        type TEXT NOT NULL,
+                        username TEXT,
+                        password TEXT
+                    )
+                ''')
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(streams)")}
+                if "version" not in columns:
+                    conn.execute("ALTER TABLE streams ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+                if "settings" not in columns:
+                    conn.execute("ALTER TABLE streams ADD COLUMN settings TEXT")
+                # Control-plane state shared by every API process (e.g. the active stream)
+                conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+                conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('streams_version', '1')")
+                if not conn.execute("SELECT COUNT(*) FROM streams").fetchone()[0]:
+                    for row in seed:
+                        conn.execute("INSERT OR IGNORE INTO streams (id, {}) VALUES (?, ?, ?, ?, ?, ?, ?)".format(
+                            ", ".join(STREAM_FIELDS)), [row["id"]] + [row.get(f, "") for f in STREAM_FIELDS])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self
+
+    @staticmethod
+    def _row(row):
+        stream = dict(row)
+        stream["settings"] = json.loads(stream["settings"]) if stream.get("settings") else {}
+        return stream
+
+    def _fresh(self):
+        with self._lock:
+            if self._watch is None:
+                self._watch = self._open()
+            data_version = self._watch.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version and self.version is not None:
+                return
+            self._data_version = data_version
+            # One read transaction, so rows and version come from the same snapshot
+            self._watch.execute("BEGIN")
+            try:
+                version = self._watch.execute("SELECT value FROM settings WHERE key = 'streams_version'").fetchone()[0]
+                if version != self.version:
+                    rows = self._watch.execute('''
+                        SELECT * FROM streams
+                        ORDER BY (CASE WHEN id = 'local' THEN 0 ELSE 1 END), display_name ASC
+                    ''').fetchall()
+                    settings = self._watch.execute("SELECT key, value FROM settings").fetchall()
+                    self._order = [self._row(row) for row in rows]
+                    self._streams = {stream["id"]: stream for stream in self._order}
+                    self._settings = {row["key"]: row["value"] for row in settings}
+                    self.version = version
+                    self.reloads += 1
+            finally:
+                self._watch.execute("COMMIT")
+
+    def list(self):
+        self._fresh()
+        return [dict(stream) for stream in self._order]
+
+    def get(self, stream_id):
+        self._fresh()
+        stream = self._streams.get(stream_id)
+        return dict(stream) if stream else None
+
+    def first(self):
+        """'local' if it exists, else the first stream by display name."""
+        self._fresh()
+        return dict(self._order[0]) if self._order else None
+
+    def setting(self, key, default=None):
+        self._fresh()
+        return self._settings.get(key, default)
+
+    def set_setting(self, key, value):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def create(self, fields, settings=None):
+        stream_id = str(uuid.uuid4())
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO streams (id, {}, settings) VALUES (?, ?, ?, ?, ?, ?, ?, ?)".format(
+                ", ".join(STREAM_FIELDS)),
+                [stream_id] + [fields.get(f, "") for f in STREAM_FIELDS] + [json.dumps(settings or {})])
+        return self.get(stream_id)
+
+    def update(self, stream_id, fields, settings=None):
+        """Updates a stream (settings=None keeps the stored ones); returns (old, new), both None if it does not exist."""
+        old = None
+        with self.transaction() as conn:
+            row = conn.execute("SELECT * FROM streams WHERE id = ?", (stream_id,)).fetchone()
+            if row is not None:
+                old = self._row(row)
+                values = [fields.get(f, "") for f in STREAM_FIELDS]
+                values.append(json.dumps(old["settings"] if settings is None else settings))
+                conn.execute("UPDATE streams SET {}, settings = ?, version = version + 1 WHERE id = ?".format(
+                    ", ".join(f"{f} = ?" for f in STREAM_FIELDS)), values + [stream_id])
+        if old is None:
+            return None, None
+        return old, self.get(stream_id)
+
+    def delete(self, stream_id):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM streams WHERE id = ?", (stream_id,))
+
+    def stats(self):
+        return {"version": self.version, "reloads": self.reloads, "pooled": len(self._pool)}
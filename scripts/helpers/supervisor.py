@@ -0,0 +1,433 @@
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def pid_alive(pid):
+    """True if pid exists and is not a zombie (another API process may not have reaped it yet)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return False
+
+
+class WorkerRegistry:
+    """Worker table in the API's SQLite database, shared by every API process.
+
+    Slots (and therefore ports) are claimed inside an IMMEDIATE transaction so
+    two API processes can never hand out the same one, and any process can
+    report on or stop a worker another one started (by its process group).
+    One autocommit connection per process is reused, serialized by a lock.
+    """
+
+    def __init__(self, db_path, event_retention=7 * 86400):
+        self.db_path = db_path
+        self.event_retention = event_retention
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+                self._conn.row_factory = sqlite3.Row
+                # The database is in WAL mode (StreamRegistry.init): commits append without an fsync
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            yield self._conn
+
+    def init(self):
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS workers (
+                    stream_id TEXT PRIMARY KEY,
+                    stream TEXT NOT NULL,
+                    slot INTEGER NOT NULL UNIQUE,
+                    pid INTEGER,
+                    ports TEXT,
+                    cores TEXT,
+                    warm INTEGER DEFAULT 0,
+                    started_at REAL,
+                    first_frame_ms REAL
+                )
+            ''')
+            # Last event of each type per stream; only the control process receives them
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS worker_events (
+                    stream TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    timestamp REAL,
+                    event TEXT NOT NULL,
+                    PRIMARY KEY (stream, type)
+                )
+            ''')
+        return self
+
+    def claim_slot(self, stream, max_workers):
+        """Reserves the lowest free slot for a stream (dead workers' rows are dropped first)."""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for row in conn.execute('SELECT stream_id, pid, started_at FROM workers').fetchall():
+                    # No pid after a while means the claiming process failed to spawn it
+                    dead = not pid_alive(row['pid']) if row['pid'] else time.time() - (row['started_at'] or 0) > 30
+                    if dead:
+                        conn.execute('DELETE FROM workers WHERE stream_id = ?', (row['stream_id'],))
+                conn.execute('DELETE FROM workers WHERE stream_id = ?', (str(stream['id']),))
+                used = {row[0] for row in conn.execute('SELECT slot FROM workers')}
+                slot = next((i for i in range(max_workers) if i not in used), None)
+                if slot is None:
+                    raise RuntimeError(f"All {max_workers} worker slots are in use")
+                conn.execute('INSERT INTO workers (stream_id, stream, slot, started_at) VALUES (?, ?, ?, ?)',
+                             (str(stream['id']), stream['name'], slot, time.time()))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return slot
+
+    def record(self, handle):
+        with self._connect() as conn:
+            conn.execute('UPDATE workers SET pid = ?, ports = ?, cores = ?, warm = ?, started_at = ? WHERE stream_id = ?',
+                         (handle.process.pid, json.dumps(handle.ports), json.dumps(handle.cores),
+                          int(handle.warm), handle.started_at, str(handle.stream['id'])))
+
+    def set_first_frame(self, stream_id, ttff_ms):
+        with self._connect() as conn:
+            conn.execute('UPDATE workers SET first_frame_ms = ? WHERE stream_id = ?', (ttff_ms, str(stream_id)))
+
+    def record_event(self, event):
+        """Keeps `event` as its stream's last of that type; a worker (re)start also drops events gone stale."""
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO worker_events (stream, type, timestamp, event) VALUES (?, ?, ?, ?)',
+                         (event.get('stream') or '', event['type'], event.get('timestamp'), json.dumps(event)))
+            if event['type'] == 'started':
+                conn.execute('DELETE FROM worker_events WHERE timestamp < ?', (time.time() - self.event_retention,))
+
+    def events(self):
+        """{stream: {event type: last event}} of every stream that reported."""
+        events = {}
+        with self._connect() as conn:
+            for row in conn.execute('SELECT stream, type, event FROM worker_events'):
+                events.setdefault(row['stream'], {})[row['type']] = json.loads(row['event'])
+        return events
+
+    def last_event_time(self, stream):
+        with self._connect() as conn:
+            return conn.execute('SELECT MAX(timestamp) FROM worker_events WHERE stream = ?', (stream,)).fetchone()[0]
+
+    def remove(self, stream_id, pid=None):
+        """Drops a stream's row; with `pid`, only if the row still belongs to that process."""
+        with self._connect() as conn:
+            if pid is None:
+                conn.execute('DELETE FROM workers WHERE stream_id = ?', (str(stream_id),))
+            else:
+                conn.execute('DELETE FROM workers WHERE stream_id = ? AND pid = ?', (str(stream_id), pid))
+
+    def get(self, stream_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM workers WHERE stream_id = ?', (str(stream_id),)).fetchone()
+        return dict(row) if row else None
+
+    def rows(self):
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute('SELECT * FROM workers ORDER BY slot')]
+
+    @staticmethod
+    def status(row):
+        """A registry row in the same shape as WorkerHandle.status()."""
+        alive = bool(row['pid']) and pid_alive(row['pid'])
+        return {
+            "stream_id": row['stream_id'],
+            "stream": row['stream'],
+            "alive": alive,
+            "pid": row['pid'],
+            "exit_code": None,
+            "ports": json.loads(row['ports']) if row['ports'] else None,
+            "cores": json.loads(row['cores']) if row['cores'] else None,
+            "uptime": round(time.time() - (row['started_at'] or time.time()), 1),
+            "warm_start": bool(row['warm']),
+            "time_to_first_frame_ms": row['first_frame_ms'],
+        }
+
+
+class WorkerHandle:
+    """One running analysis worker and the resources it was given."""
+
+    def __init__(self, stream, slot, ports, cores, process, warm=False):
+        self.stream = stream
+        self.slot = slot
+        self.ports = ports
+        self.cores = cores
+        self.process = process
+        self.warm = warm
+        self.started_at = time.time()
+        self.first_frame_ms = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def status(self):
+        return {
+            "stream_id": self.stream['id'],
+            "stream": self.stream['name'],
+            "alive": self.alive,
+            "pid": self.process.pid if self.process else None,
+            "exit_code": None if self.alive else self.process.poll(),
+            "ports": self.ports,
+            "cores": self.cores,
+            "uptime": round(time.time() - self.started_at, 1),
+            "warm_start": self.warm,
+            "time_to_first_frame_ms": self.first_frame_ms,
+        }
+
+
+class WarmWorkerPool:
+    """Keeps `size` pre-imported warm_worker.py processes idle on stdin.
+
+    take() returns one (or None if none is ready) and immediately spawns a
+    replacement in the background, so the next switch is warm as well.
+    """
+
+    def __init__(self, warm_script, size=1):
+        self.warm_script = warm_script
+        self.size = size
+        self.idle = []
+        self._lock = threading.Lock()
+
+    def fill(self):
+        with self._lock:
+            self.idle = [p for p in self.idle if p.poll() is None]
+            while len(self.idle) < self.size:
+                self.idle.append(subprocess.Popen(
+                    [sys.executable, self.warm_script],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    start_new_session=True
+                ))
+
+    def take(self):
+        process = None
+        with self._lock:
+            while self.idle and process is None:
+                candidate = self.idle.pop(0)
+                if candidate.poll() is None:
+                    process = candidate
+        threading.Thread(target=self.fill, daemon=True).start()
+        return process
+
+    def shutdown(self):
+        with self._lock:
+            idle, self.idle = self.idle, []
+        for p in idle:
+            try:
+                p.stdin.close() # warm_worker exits on EOF
+                p.wait(timeout=1)
+            except Exception:
+                p.kill()
+
+
+class StreamSupervisor:
+    """Runs one camera_test.py worker per stream, side by side.
+
+    Each worker gets a slot index that fixes its ports (ingest, UDP output,
+    loopback decode feed and loopback ingest relay, `port_stride` apart per slot) and is pinned to
+    the least-loaded CPU cores. Paths are already unique per STREAM_NAME.
+    With a WarmWorkerPool, streams are handed to an idle pre-imported
+    interpreter instead of a cold `python camera_test.py`. With a
+    WorkerRegistry, slots and worker status are shared with the other API
+    processes, which can also stop workers this one started.
+    """
+
+    def __init__(self, worker_script, base_port=55080, port_stride=10, max_workers=8,
+                 cores_per_worker=None, pool=None, log=print, registry=None):
+        self.worker_script = worker_script
+        self.pool = pool
+        self.registry = registry
+        self.base_port = base_port
+        self.port_stride = port_stride
+        self.max_workers = max_workers
+        self.log = log
+        try:
+            self.cpus = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            self.cpus = list(range(os.cpu_count() or 1))
+        self.cores_per_worker = cores_per_worker or max(1, min(2, len(self.cpus)))
+        self.workers = {}
+        self._lock = threading.RLock()
+
+    def ports_for(self, slot):
+        ingest = self.base_port + slot * self.port_stride
+        return {"ingest": ingest, "output": ingest + 1, "decode": ingest + 2, "relay": ingest + 3}
+
+    def _allocate_slot(self):
+        used = {w.slot for w in self.workers.values()}
+        for slot in range(self.max_workers):
+            if slot not in used:
+                return slot
+        raise RuntimeError(f"All {self.max_workers} worker slots are in use")
+
+    def _place(self):
+        """Picks the cores currently assigned to the fewest live workers (of every API process, with a registry)."""
+        load = {cpu: 0 for cpu in self.cpus}
+        if self.registry:
+            assigned = [json.loads(row['cores']) for row in self.registry.rows()
+                        if row['cores'] and row['pid'] and pid_alive(row['pid'])]
+        else:
+            assigned = [w.cores for w in self.workers.values() if w.alive]
+        for cores in assigned:
+            for cpu in cores:
+                load[cpu] = load.get(cpu, 0) + 1
+        ranked = sorted(self.cpus, key=lambda cpu: (load.get(cpu, 0), cpu))
+        return ranked[:self.cores_per_worker]
+
+    def _reap(self):
+        for stream_id in [sid for sid, w in self.workers.items() if not w.alive]:
+            del self.workers[stream_id]
+
+    def start(self, stream, extra_env=None, requested_at=None):
+        """Starts (or restarts) the worker for a stream config row; returns its handle.
+
+        `requested_at` (default: now) is when the switch was asked for; the
+        worker measures time-to-first-frame from it, stopping the previous
+        worker included.
+        """
+        requested_at = requested_at or time.time()
+        with self._lock:
+            # Dead handles first: another process may have stopped them and started a new worker since
+            self._reap()
+            self.stop(stream['id'])
+            slot = self.registry.claim_slot(stream, self.max_workers) if self.registry else self._allocate_slot()
+            ports = self.ports_for(slot)
+            cores = self._place()
+
+            stream_env = dict(extra_env or {})
+            stream_env["STREAM_NAME"] = stream['name']
+            stream_env["STREAM_ID"] = str(stream['id'])
+            stream_env["INGEST_PORT"] = str(ports["ingest"])
+            stream_env["OUTPUT_PORT"] = str(ports["output"])
+            stream_env["DECODE_PORT"] = str(ports["decode"])
+            stream_env["RELAY_PORT"] = str(ports["relay"])
+            stream_env["WORKER_HANDOFF_TS"] = str(requested_at)
+
+            process = self.pool.take() if self.pool else None
+            warm = process is not None
+            if warm:
+                process.stdin.write((json.dumps(stream_env) + "\n").encode())
+                process.stdin.close()
+            else:
+                env = os.environ.copy()
+                env.update(stream_env)
+                process = subprocess.Popen(
+                    [sys.executable, self.worker_script],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    env=env,
+                    start_new_session=True
+                )
+            try:
+                os.sched_setaffinity(process.pid, cores)
+            except (AttributeError, OSError):
+                pass
+
+            handle = WorkerHandle(stream, slot, ports, cores, process, warm)
+            self.workers[stream['id']] = handle
+            if self.registry:
+                self.registry.record(handle)
+            self.log(f"[SUPERVISOR] Worker for {stream['name']} started ({'warm' if warm else 'cold'}, PID {process.pid}, ports {ports}, cores {cores})")
+            return handle
+
+    def _owns(self, handle, row):
+        """True if the registry row is the worker behind this local handle (not one started since)."""
+        return row is not None and handle.process is not None and row['pid'] == handle.process.pid
+
+    def _stop_remote(self, stream_id, timeout, row=None):
+        """Stops a worker another API process started, through its process group."""
+        row = row or self.registry.get(stream_id)
+        if row is None:
+            return False
+        pid = row['pid']
+        if pid and pid_alive(pid):
+            self.log(f"[SUPERVISOR] Stopping worker for {row['stream']} (PID {pid})...")
+            try:
+                os.killpg(pid, signal.SIGTERM)
+                deadline = time.time() + timeout
+                while pid_alive(pid) and time.time() < deadline:
+                    time.sleep(0.05)
+                if pid_alive(pid):
+                    os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.registry.remove(stream_id, pid)
+        return True
+
+    def stop(self, stream_id, timeout=2):
+        with self._lock:
+            handle = self.workers.pop(stream_id, None)
+        if self.registry:
+            row = self.registry.get(stream_id)
+            if handle is None or not self._owns(handle, row):
+                # A stale handle must not remove the row of a worker another process started since
+                stopped = self._stop_remote(stream_id, timeout, row) if row else False
+                if handle is not None and handle.alive:
+                    handle.process.terminate()
+                return stopped
+            self.registry.remove(stream_id, handle.process.pid)
+        elif handle is None:
+            return False
+        if handle.alive:
+            self.log(f"[SUPERVISOR] Stopping worker for {handle.stream['name']}...")
+            handle.process.terminate()
+            try:
+                handle.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                handle.process.kill()
+        return True
+
+    def stop_all(self):
+        stream_ids = set(self.workers)
+        if self.registry:
+            stream_ids |= {row['stream_id'] for row in self.registry.rows()}
+        for stream_id in stream_ids:
+            self.stop(stream_id)
+
+    def shutdown(self):
+        self.stop_all()
+        if self.pool:
+            self.pool.shutdown()
+
+    def record_first_frame(self, stream_id, ttff_ms):
+        # Workers report STREAM_ID back as a string
+        for handle in list(self.workers.values()):
+            if str(handle.stream['id']) == str(stream_id):
+                handle.first_frame_ms = ttff_ms
+        if self.registry:
+            self.registry.set_first_frame(stream_id, ttff_ms)
+
+    def get(self, stream_id):
+        return self.workers.get(stream_id)
+
+    def status(self, stream_id=None):
+        if self.registry:
+            # The registry is authoritative; workers this process started report their exit codes
+            with self._lock:
+                local = {str(sid): w for sid, w in self.workers.items()}
+            rows = [self.registry.get(stream_id)] if stream_id is not None else self.registry.rows()
+            statuses = [local[row['stream_id']].status() if row['stream_id'] in local
+                        and self._owns(local[row['stream_id']], row) else WorkerRegistry.status(row)
+                        for row in rows if row]
+            return statuses if stream_id is None else (statuses[0] if statuses else None)
+        with self._lock:
+            if stream_id is not None:
+                handle = self.workers.get(stream_id)
+                return handle.status() if handle else None
+            return [w.status() for w in self.workers.values()]
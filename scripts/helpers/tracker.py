@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class BoxTracker:
+    """Carries the last model detections from frame to frame with sparse optical flow.
+
+    anchor() is called with each inference result: it seeds up to
+    `max_points` corners inside every box. The boxes belong to the frame the
+    model saw, one inference latency ago, so they are seeded on that frame
+    (kept in a `history` of recent grayscale frames by seq) and flowed
+    forward through the frames since. update() runs per frame on a
+    `work_width` grayscale copy, moves each box by the median flow of its
+    surviving points (forward-backward checked) and returns the boxes in
+    frame pixels. A box's confidence is the fraction of its points still
+    tracked; when the average falls under `refresh_below` the tracker asks
+    for an early model call (take_refresh) instead of waiting for the scene
+    gate.
+    """
+
+    def __init__(self, width, height, work_width=320, max_points=20, refresh_below=0.5,
+                 max_fb_error=1.0, min_refresh_interval=2.0, history=64):
+        self.width = width
+        self.height = height
+        self.scale = min(1.0, work_width / float(width))
+        self.work_size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+        self.max_points = max_points
+        self.refresh_below = refresh_below
+        self.max_fb_error = max_fb_error
+        self.min_refresh_interval = min_refresh_interval
+        self._lock = threading.Lock()
+        self._pending = None  # (detections, frame seq) waiting for the tracker thread to anchor
+        self._tracks = []  # [box (x, y, w, h) in work pixels, label, points, initial count]
+        self._history = deque(maxlen=history)  # (seq, gray) of the last frames seen
+        self._prev = None
+        self._refresh = False
+        self._last_refresh = 0.0
+        self.confidence = 0.0
+        self.anchored = 0
+        self.caught_up = 0  # frames flowed through to bring anchored boxes up to date
+        self.updates = 0
+        self.refreshes = 0
+
+    def anchor(self, detections, frame_seq=None):
+        """Queues normalized (x, y, w, h, label) detections of frame `frame_seq`; applied on the next update()."""
+        with self._lock:
+            self._pending = (list(detections), frame_seq)
+
+    def _gray(self, frame):
+        small = cv2.resize(frame, self.work_size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _seed(self, gray, detections):
+        work_w, work_h = self.work_size
+        tracks = []
+        for x, y, w, h, label in detections:
+            box = np.array([x * work_w, y * work_h, w * work_w, h * work_h], np.float32)
+            x0, y0 = int(box[0]), int(box[1])
+            x1, y1 = int(box[0] + box[2]), int(box[1] + box[3])
+            mask = np.zeros_like(gray)
+            mask[y0:y1, x0:x1] = 255
+            points = cv2.goodFeaturesToTrack(gray, self.max_points, 0.01, 3, mask=mask)
+            if points is None:
+                points = np.empty((0, 1, 2), np.float32)
+            # A box without corners (flat region) just stays put and does not count
+            tracks.append([box, label, points, len(points)])
+        self._tracks = tracks
+        self.confidence = 1.0
+        self._refresh = False
+        self.anchored += 1
+
+    def _since(self, frame_seq, seq):
+        """Remembered frames from `frame_seq` (or the closest one before it) on; empty if it is too old."""
+        if frame_seq is None or (seq is not None and frame_seq >= seq):
+            return []
+        frames = list(self._history)
+        start = next((i for i in range(len(frames) - 1, -1, -1) if frames[i][0] <= frame_seq), None)
+        return [] if start is None else [gray for _, gray in frames[start:]]
+
+    def update(self, frame, seq=None):
+        """Advances every box to `frame` (ring seq `seq`); returns [(x, y, w, h, label, confidence)] in frame pixels."""
+        gray = self._gray(frame)
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            detections, frame_seq = pending
+            path = self._since(frame_seq, seq)
+            if path:
+                self._seed(path[0], detections)
+                for prev, nxt in zip(path, path[1:] + [gray]):
+                    self._flow(prev, nxt)
+                self.caught_up += len(path)
+            else:
+                self._seed(gray, detections)
+        elif self._prev is not None and self._tracks:
+            self._flow(self._prev, gray)
+        if seq is not None:
+            self._history.append((seq, gray))
+        self._prev = gray
+        self.updates += 1
+        return self.boxes()
+
+    def _flow(self, prev, gray):
+        counts = [len(t[2]) for t in self._tracks]
+        if not sum(counts):
+            if any(t[3] for t in self._tracks):
+                self.confidence = 0.0
+                self._flag_refresh()
+            return
+        points = np.concatenate([t[2] for t in self._tracks if len(t[2])]).astype(np.float32)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev, gray, points, None, **LK_PARAMS)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, prev, moved, None, **LK_PARAMS)
+        error = np.abs(points - back).reshape(-1, 2).max(axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < self.max_fb_error)
+
+        start = 0
+        for track, count in zip(self._tracks, counts):
+            if not count:
+                continue
+            keep = good[start:start + count]
+            before = points[start:start + count][keep].reshape(-1, 2)
+            after = moved[start:start + count][keep].reshape(-1, 2)
+            start += count
+            if len(after):
+                dx, dy = np.median(after - before, axis=0)
+                track[0][0] += dx
+                track[0][1] += dy
+            track[2] = after.reshape(-1, 1, 2)
+        self.confidence = float(np.mean([len(t[2]) / t[3] for t in self._tracks if t[3]]))
+        if self.confidence < self.refresh_below:
+            self._flag_refresh()
+
+    def _flag_refresh(self):
+        now = time.time()
+        if not self._refresh and now - self._last_refresh >= self.min_refresh_interval:
+            self._refresh = True
+            self._last_refresh = now
+            self.refreshes += 1
+
+    def take_refresh(self):
+        """True once per confidence drop: the caller should send the current frame to the model."""
+        if self._refresh:
+            self._refresh = False
+            return True
+        return False
+
+    @property
+    def active(self):
+        return bool(self._tracks)
+
+    def boxes(self):
+        inv = 1.0 / self.scale
+        return [
+            (float(box[0] * inv), float(box[1] * inv), float(box[2] * inv), float(box[3] * inv),
+             label, round(len(points) / initial, 2) if initial else 1.0)
+            for box, label, points, initial in self._tracks
+        ]
+
+    def stats(self):
+        return {
+            "tracks": len(self._tracks),
+            "confidence": round(self.confidence, 2),
+            "anchored": self.anchored,
+            "caught_up": self.caught_up,
+            "updates": self.updates,
+            "refreshes": self.refreshes,
+        }
@@ -0,0 +1,151 @@
+"""InferenceClient against a local stub of Ollama's /api/chat."""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from helpers import InferenceClient  # noqa: E402
+
+LOGGER = logging.getLogger("test_inference")
+
+
+class StubChat:
+    """/api/chat that answers `content` after `latency` seconds (or `status` with an error body)."""
+
+    def __init__(self, latency=0.0, status=200, content="A grey test frame."):
+        stub = self
+        self.latency = latency
+        self.status = status
+        self.content = content
+        self.payloads = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                with stub._lock:
+                    stub.payloads.append(body)
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(stub.latency)
+                with stub._lock:
+                    stub.in_flight -= 1
+                if stub.status == 200:
+                    data = json.dumps({"message": {"role": "assistant", "content": stub.content}, "done": True})
+                else:
+                    data = json.dumps({"error": "model not found"})
+                data = data.encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/chat"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def frame():
+    return np.full((48, 64, 3), 128, np.uint8)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class InferenceClientTest(unittest.TestCase):
+    def make_client(self, stub, **kwargs):
+        results = []
+        client = InferenceClient(stub.url, "test-model", "Describe.", LOGGER, keep_alive="7m",
+                                 on_result=results.append, **kwargs).start()
+        self.addCleanup(client.stop)
+        return client, results
+
+    def stub(self, **kwargs):
+        stub = StubChat(**kwargs)
+        self.addCleanup(stub.close)
+        return stub
+
+    def test_successful_call(self):
+        stub = self.stub()
+        client, results = self.make_client(stub)
+        self.assertTrue(client.offer((7, frame())))
+        self.assertTrue(wait_for(lambda: results))
+
+        result = results[0]
+        self.assertEqual(result["frame_seq"], 7)
+        self.assertEqual(result["caption"], "A grey test frame.")
+        self.assertFalse(result["cached"])
+        payload = stub.payloads[0]
+        self.assertEqual(payload["model"], "test-model")
+        self.assertEqual(payload["keep_alive"], "7m")
+        self.assertFalse(payload["stream"])
+        self.assertEqual(payload["messages"][0]["content"], "Describe.")
+        self.assertEqual(len(payload["messages"][0]["images"]), 1)
+        stats = client.stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertIn("latency_p50_ms", stats)
+
+    def test_warm_up_sends_keep_alive(self):
+        stub = self.stub()
+        client, _ = self.make_client(stub)
+        self.assertTrue(client.warm())
+        self.assertEqual(stub.payloads[0], {"model": "test-model", "messages": [], "keep_alive": "7m"})
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        stub = self.stub(latency=0.3)
+        client, results = self.make_client(stub, queue_size=1)
+        client.offer((1, frame()))
+        self.assertTrue(wait_for(lambda: stub.in_flight == 1))
+        started = time.perf_counter()
+        accepted = [client.offer((seq, frame())) for seq in range(2, 6)]
+        self.assertLess(time.perf_counter() - started, 0.1)
+        self.assertEqual(accepted, [True, False, False, False])
+
+        self.assertTrue(wait_for(lambda: len(results) == 2))
+        # drop_oldest: the newest frame is the one that waited in the queue
+        self.assertEqual([r["frame_seq"] for r in results], [1, 5])
+        self.assertEqual(client.stats()["dropped"], 3)
+
+    def test_concurrency_limit(self):
+        stub = self.stub(latency=0.2)
+        client, results = self.make_client(stub, concurrency=2, queue_size=6)
+        for seq in range(1, 7):
+            client.offer((seq, frame()))
+        self.assertTrue(wait_for(lambda: len(results) == 6))
+        self.assertEqual(stub.max_in_flight, 2)
+
+    def test_error_response(self):
+        stub = self.stub(status=500)
+        client, results = self.make_client(stub)
+        client.offer((1, frame()))
+        self.assertTrue(wait_for(lambda: client.stats()["errors"] == 1))
+        self.assertEqual(results, [])
+        self.assertEqual(client.stats()["completed"], 0)
+        self.assertIsNone(client.last_result)
+
+
+if __name__ == "__main__":
+    unittest.main()
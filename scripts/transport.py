@@ -0,0 +1,445 @@
+"""Ingest transport between stream-cam (camera_control.py) and the AI worker.
+
+stream-cam's ffmpeg writes MPEG-TS to stdout and an IngestSender carries it
+to the worker, where an IngestReceiver takes it in, counts continuity-counter
+gaps and relays the packets to the worker's local decode feed. Transports:
+
+  udp   datagrams of 7 TS packets (the old pkt_size=1316); lossy, measured
+  tcp   one stream connection; lossless, works across hosts
+  unix  Unix stream socket in INGEST_SOCKET_DIR; lossless, same host only
+  pipe  named FIFO in INGEST_SOCKET_DIR; lossless, same host only
+
+The lossless ones lose nothing on the way to the worker: a stalled
+receiver stalls the camera's ffmpeg instead. Inside the worker the relay
+still feeds the decoders over loopback UDP, which drops whatever arrives
+at a full receive buffer when a decoder falls behind; those drops are
+read from /proc/net/udp and reported apart from the ingest loss.
+Standard library only, since stream-cam has neither numpy nor cv2.
+"""
+import fcntl
+import os
+import socket
+import stat
+import threading
+import time
+
+TRANSPORTS = ("udp", "tcp", "unix", "pipe")
+TS_PACKET = 188
+TS_SYNC = 0x47
+NULL_PID = 0x1FFF
+DATAGRAM = 7 * TS_PACKET  # 1316, fits a 1500-byte MTU
+INGEST_SOCKET_DIR = os.environ.get("INGEST_SOCKET_DIR", "/run/ingest")
+RECONNECT_INTERVAL = 0.5
+
+
+def ingest_address(transport, port, host="0.0.0.0"):
+    """(host, port) for udp/tcp, a path in INGEST_SOCKET_DIR (keyed by port) for unix/pipe."""
+    if transport in ("udp", "tcp"):
+        return host, port
+    if transport == "unix":
+        return os.path.join(INGEST_SOCKET_DIR, f"ingest_{port}.sock")
+    if transport == "pipe":
+        return os.path.join(INGEST_SOCKET_DIR, f"ingest_{port}.fifo")
+    raise ValueError(f"Unknown ingest transport: {transport} (expected one of {', '.join(TRANSPORTS)})")
+
+
+def udp_drops(ports):
+    """{socket inode: datagrams dropped} for the UDP sockets bound to any of `ports`.
+
+    The kernel counts a datagram that arrives at a full receive buffer in
+    the `drops` column of /proc/net/udp; for a loopback consumer this is
+    the only trace of it.
+    """
+    drops = {}
+    for table in ("/proc/net/udp", "/proc/net/udp6"):
+        try:
+            with open(table) as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 12 and int(fields[1].rsplit(":", 1)[1], 16) in ports:
+                drops[fields[9]] = int(fields[12])
+    return drops
+
+
+class ContinuityCounter:
+    """Counts lost MPEG-TS packets from the 4-bit continuity counter of each PID.
+
+    feed() takes arbitrary chunks (a TCP read may split a packet), resyncs on
+    the 0x47 sync byte and returns the whole packets found. A gap of n in a
+    PID's counter is n lost packets; a repeated counter is a legal duplicate
+    and a packet flagged as a discontinuity starts the count over.
+    """
+
+    def __init__(self):
+        self._last = {}
+        self._rest = b""
+        self.packets = 0
+        self.lost = 0
+        self.discontinuities = 0
+        self.sync_errors = 0
+
+    def reset(self):
+        """Forgets the counters (new connection: the gap to the old one is not loss)."""
+        self._last.clear()
+        self._rest = b""
+
+    def feed(self, data):
+        buf = self._rest + data if self._rest else data
+        end = len(buf)
+        runs = []
+        run_start = i = 0
+        while i + TS_PACKET <= end:
+            if buf[i] != TS_SYNC:
+                self.sync_errors += 1
+                if i > run_start:
+                    runs.append(buf[run_start:i])
+                found = buf.find(b"\x47", i + 1)
+                i = run_start = found if found >= 0 else end
+                continue
+            pid = ((buf[i + 1] & 0x1F) << 8) | buf[i + 2]
+            flags = buf[i + 3]
+            if pid != NULL_PID and flags & 0x10:  # has payload: the counter advances
+                cc = flags & 0x0F
+                # Adaptation field with discontinuity_indicator set
+                if flags & 0x20 and buf[i + 4] and buf[i + 5] & 0x80:
+                    self._last.pop(pid, None)
+                last = self._last.get(pid)
+                if last is not None and cc != last:
+                    gap = (cc - last - 1) & 0x0F
+                    if gap:
+                        self.lost += gap
+                        self.discontinuities += 1
+                self._last[pid] = cc
+            self.packets += 1
+            i += TS_PACKET
+        if i > run_start:
+            runs.append(buf[run_start:i])
+        self._rest = bytes(buf[i:]) if i < end else b""
+        return runs[0] if len(runs) == 1 else b"".join(runs)
+
+    def stats(self):
+        return {
+            "packets": self.packets,
+            "lost_packets": self.lost,
+            "discontinuities": self.discontinuities,
+            "sync_errors": self.sync_errors,
+            "loss_ratio": round(self.lost / (self.packets + self.lost), 6) if self.packets else 0.0,
+        }
+
+
+class _Throughput:
+    """Bytes total and bytes/s over roughly the last second."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.bytes_per_s = 0.0
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+
+    def add(self, n):
+        self.bytes += n
+        self._window_bytes += n
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self.bytes_per_s = self._window_bytes / elapsed
+            self._window_start, self._window_bytes = now, 0
+
+    def current(self):
+        # A stalled stream reports 0, not its last busy second
+        return 0.0 if time.monotonic() - self._window_start > 2.0 else round(self.bytes_per_s, 1)
+
+
+class IngestSender:
+    """stream-cam side: sends ffmpeg's MPEG-TS output over the chosen transport.
+
+    Connection-oriented transports connect lazily and again after an error,
+    at most every RECONNECT_INTERVAL; what arrives while disconnected is
+    dropped and counted (the worker resyncs on the next keyframe).
+    """
+
+    def __init__(self, transport, address, logger=None):
+        ingest_address(transport, 0)  # validates the name
+        self.transport = transport
+        self.address = address
+        self.logger = logger
+        self.throughput = _Throughput()
+        self.connections = 0
+        self.dropped_bytes = 0
+        self.send_errors = 0
+        self._sock = None
+        self._fd = None
+        self._target = None
+        self._next_attempt = 0.0
+        self._pending = b""
+
+    def _log(self, message):
+        if self.logger:
+            self.logger(message)
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        self._next_attempt = now + RECONNECT_INTERVAL
+        try:
+            if self.transport == "udp":
+                # Resolved once; sendto() with a hostname would look it up per datagram
+                self._target = (socket.gethostbyname(self.address[0]), self.address[1])
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            elif self.transport == "pipe":
+                # Non-blocking open fails with ENXIO until the worker has the FIFO open for reading
+                fd = os.open(self.address, os.O_WRONLY | os.O_NONBLOCK)
+                fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+                self._fd = fd
+            else:
+                family = socket.AF_UNIX if self.transport == "unix" else socket.AF_INET
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.settimeout(2)
+                sock.connect(self.address)
+                sock.settimeout(None)
+                if family == socket.AF_INET:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._sock = sock
+        except OSError:
+            return False
+        self.connections += 1
+        # A partial packet left from before is not worth resending
+        self._pending = b""
+        self._log(f"[INGEST] {self.transport} connected to {self.address} (connection {self.connections})")
+        return True
+
+    def _disconnect(self, error):
+        self.send_errors += 1
+        self._log(f"[INGEST] {self.transport} to {self.address} lost: {error}")
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def send(self, data):
+        if self._sock is None and self._fd is None and not self._connect():
+            self.dropped_bytes += len(data)
+            return
+        if self.transport == "udp":
+            data = self._pending + data
+            whole = len(data) - len(data) % TS_PACKET
+            self._pending = data[whole:]
+            for offset in range(0, whole, DATAGRAM):
+                try:
+                    self._sock.sendto(data[offset:min(offset + DATAGRAM, whole)], self._target)
+                except OSError:
+                    # Nobody listening yet (ICMP unreachable) or no route: the datagram is gone
+                    self.send_errors += 1
+                    self.dropped_bytes += min(DATAGRAM, whole - offset)
+            self.throughput.add(whole)
+            return
+        try:
+            if self._fd is not None:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self._fd, view):]
+            else:
+                self._sock.sendall(data)
+            self.throughput.add(len(data))
+        except OSError as e:
+            self.dropped_bytes += len(data)
+            self._disconnect(e)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def stats(self):
+        return {
+            "transport": self.transport,
+            "address": self.address if isinstance(self.address, str) else f"{self.address[0]}:{self.address[1]}",
+            "connected": self._sock is not None or self._fd is not None,
+            "bytes": self.throughput.bytes,
+            "bytes_per_s": self.throughput.current(),
+            "reconnects": max(self.connections - 1, 0),
+            "dropped_bytes": self.dropped_bytes,
+            "send_errors": self.send_errors,
+        }
+
+
+class IngestReceiver:
+    """Worker side: accepts the ingest stream and relays it to a local UDP feed.
+
+    Whatever the transport, the worker's decoders keep reading plain
+    MPEG-TS over UDP from `forward` (loopback), so they do not change. On
+    the way through, every packet goes past a ContinuityCounter, which is
+    what `lost_packets` in stats() counts: loss between stream-cam and here.
+    Loss after the relay, at the decoders' sockets on `watch_ports`, is
+    `decoder_lost_packets`. `rcvbuf` is requested for UDP; the kernel caps
+    it at net.core.rmem_max and stats() reports what was granted.
+    """
+
+    def __init__(self, transport, address, forward, rcvbuf=8 * 1024 * 1024, watch_ports=(), logger=None):
+        ingest_address(transport, 0)
+        self.transport = transport
+        self.address = address
+        self.forward = forward
+        self.rcvbuf = rcvbuf
+        self.watch_ports = set(watch_ports) or {forward[1]}
+        self.logger = logger
+        self.counter = ContinuityCounter()
+        self.throughput = _Throughput()
+        self.connections = 0
+        self.rcvbuf_granted = None
+        self._drops = {}
+        self.running = False
+        self._out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._out.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        self._listener = None
+        self._thread = None
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(message)
+
+    def start(self):
+        self.running = True
+        self._listener = self._bind()
+        self._thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+        self._thread.start()
+        self._log(f"Ingest: {self.transport} on {self.address} -> udp://{self.forward[0]}:{self.forward[1]}")
+        return self
+
+    def _bind(self):
+        if self.transport == "udp":
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            # Linux reports twice the usable size
+            self.rcvbuf_granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 2
+            if self.rcvbuf_granted < self.rcvbuf:
+                self._log(f"Ingest: UDP receive buffer capped at {self.rcvbuf_granted} bytes "
+                          f"(raise net.core.rmem_max for {self.rcvbuf}, or use a lossless transport)")
+            sock.bind(self.address)
+        elif self.transport == "pipe":
+            os.makedirs(os.path.dirname(self.address), exist_ok=True)
+            if os.path.exists(self.address) and not stat.S_ISFIFO(os.stat(self.address).st_mode):
+                os.unlink(self.address)
+            if not os.path.exists(self.address):
+                os.mkfifo(self.address, 0o666)
+            return None
+        else:
+            if self.transport == "unix":
+                os.makedirs(os.path.dirname(self.address), exist_ok=True)
+                if os.path.exists(self.address):
+                    os.unlink(self.address)
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.bind(self.address)
+                os.chmod(self.address, 0o666)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(self.address)
+            sock.listen(1)
+        sock.settimeout(0.5)  # lets _run notice stop()
+        return sock
+
+    def _relay(self, data):
+        self.throughput.add(len(data))
+        packets = self.counter.feed(data)
+        for offset in range(0, len(packets), DATAGRAM):
+            try:
+                self._out.sendto(packets[offset:offset + DATAGRAM], self.forward)
+            except OSError:
+                pass  # decoder not bound yet
+
+    def _connected(self):
+        self.connections += 1
+        self.counter.reset()
+        if self.connections > 1:
+            self._log(f"Ingest: {self.transport} sender reconnected ({self.connections - 1} reconnects)")
+
+    def _run(self):
+        buf = bytearray(256 * 1024)
+        view = memoryview(buf)
+        while self.running:
+            try:
+                if self.transport == "udp":
+                    try:
+                        n = self._listener.recv_into(buf)
+                    except socket.timeout:
+                        continue
+                    if not self.connections:
+                        self._connected()
+                    self._relay(bytes(view[:n]))
+                elif self.transport == "pipe":
+                    # Blocks until stream-cam opens the FIFO; EOF when it closes it
+                    with open(self.address, "rb", buffering=0) as fifo:
+                        if not self.running:
+                            break  # woken by stop()
+                        self._connected()
+                        while self.running:
+                            n = fifo.readinto(buf)
+                            if not n:
+                                break
+                            self._relay(bytes(view[:n]))
+                else:
+                    try:
+                        conn, _ = self._listener.accept()
+                    except socket.timeout:
+                        continue
+                    with conn:
+                        conn.settimeout(1.0)
+                        self._connected()
+                        while self.running:
+                            try:
+                                n = conn.recv_into(buf)
+                            except socket.timeout:
+                                continue
+                            if not n:
+                                break
+                            self._relay(bytes(view[:n]))
+            except OSError as e:
+                if self.running:
+                    self._log(f"Ingest: {self.transport} receive error: {e}")
+                    time.sleep(RECONNECT_INTERVAL)
+
+    def stop(self):
+        self.running = False
+        if self.transport == "pipe":
+            # Unblocks a reader still waiting in open()
+            try:
+                os.close(os.open(self.address, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass  # no reader waiting
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._listener is not None:
+            self._listener.close()
+        if self.transport == "unix" and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._out.close()
+
+    def decoder_drops(self):
+        """Datagrams the decoders' sockets dropped so far (those of closed sockets included)."""
+        self._drops.update(udp_drops(self.watch_ports))
+        return sum(self._drops.values())
+
+    def stats(self):
+        drops = self.decoder_drops()
+        return {
+            "transport": self.transport,
+            "connected": self.connections > 0,
+            "bytes": self.throughput.bytes,
+            "bytes_per_s": self.throughput.current(),
+            "reconnects": max(self.connections - 1, 0),
+            "rcvbuf": self.rcvbuf_granted,
+            **self.counter.stats(),
+            "decoder_drops": drops,
+            "decoder_lost_packets": drops * (DATAGRAM // TS_PACKET),
+        }
@@ -0,0 +1,32 @@
+"""Pre-forked standby AI worker.
+
+Started by the supervisor before any stream needs it: pays for the heavy
+imports (cv2, numpy, requests, helpers) up front, then blocks on stdin.
+The supervisor hands over a stream by writing one JSON line of environment
+overrides (STREAM_NAME, ports...), after which camera_test.py runs in this
+already-warm interpreter exactly as if it had been launched directly.
+"""
+import json
+import os
+import runpy
+import sys
+import time
+
+# Heavy imports camera_test.py needs, done while idle
+import cv2  # noqa: F401
+import numpy  # noqa: F401
+import requests  # noqa: F401
+import helpers  # noqa: F401
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "camera_test.py")
+
+if __name__ == "__main__":
+    line = sys.stdin.readline()
+    if not line.strip():
+        # Pool shut down (stdin closed) before a stream was assigned
+        sys.exit(0)
+
+    os.environ.update({k: str(v) for k, v in json.loads(line).items()})
+    os.environ.setdefault("WORKER_HANDOFF_TS", str(time.time()))
+    sys.argv = [WORKER_SCRIPT]
+    runpy.run_path(WORKER_SCRIPT, run_name="__main__")